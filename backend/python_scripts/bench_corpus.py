@@ -0,0 +1,56 @@
+"""
+Helpers shared by the offline benchmark scripts (bench_*.py).
+
+A corpus is a directory of receipt files with an optional labels.json that
+maps each file name to the expected OCR fields, using dotted keys for nested
+values:
+
+    {
+      "nubank_01.jpg": {"amount": "1,250.00", "transaction_id": "E1818...", "sender.name": "JOAO SILVA"},
+      "inter_02.png": {"amount": "300.00", "recipient.name": "TROCA COIN NEGÓCIOS DIGITAIS E INTERMEDIAÇÕES LTDA"}
+    }
+"""
+import os
+import json
+import math
+
+from receipt_schema import get_path
+
+RECEIPT_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".pdf")
+DEFAULT_FIELDS = ("transaction_id", "amount", "invoice_date", "sender.name", "recipient.name")
+
+def load_corpus(corpus_dir: str) -> list[tuple[str, dict | None]]:
+    """Returns [(path, labels_or_None)] for every receipt file in the corpus directory."""
+    labels = {}
+    labels_path = os.path.join(corpus_dir, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+    items = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.lower().endswith(RECEIPT_EXTENSIONS):
+            items.append((os.path.join(corpus_dir, name), labels.get(name)))
+    return items
+
+def normalize_field(value) -> str:
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+def score_fields(expected: dict, actual: dict | None, fields=None) -> tuple[int, int, list[str]]:
+    """Compares the labelled fields; returns (correct, total, mismatched_field_names)."""
+    fields = fields or list(expected.keys())
+    correct, mismatches = 0, []
+    for field in fields:
+        if normalize_field(expected.get(field)) == normalize_field(get_path(actual, field)):
+            correct += 1
+        else:
+            mismatches.append(field)
+    return correct, len(fields), mismatches
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
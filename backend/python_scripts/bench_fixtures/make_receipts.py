@@ -0,0 +1,93 @@
+"""
+Regenerates the synthetic receipt fixtures in receipts/ (used by bench_preprocess.py).
+
+Every name, key, amount and id is invented; no customer receipt is involved.
+Screenshots are phone-sized PNGs, photos are large JPEGs with sensor-like noise
+and an EXIF orientation tag, like the camera shots that arrive over WhatsApp.
+
+    python bench_fixtures/make_receipts.py
+"""
+import json
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+OUT_DIR = Path(__file__).resolve().parent / "receipts"
+FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+FONT_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+RECEIPTS = [
+    {"file": "nubank_screenshot.png", "kind": "screenshot", "bank": "Nubank", "amount": "1.250,00",
+     "date": "14/03/2025", "time": "10:42:17", "sender": "JOANA EXEMPLO DA SILVA", "recipient": "LOJA FICTICIA LTDA",
+     "id": "E18236120202503141042s0000000001"},
+    {"file": "inter_screenshot.png", "kind": "screenshot", "bank": "Banco Inter", "amount": "300,00",
+     "date": "02/04/2025", "time": "18:05:51", "sender": "CARLOS TESTE PEREIRA", "recipient": "COMERCIO MODELO ME",
+     "id": "E00416968202504021805a0000000002"},
+    {"file": "itau_screenshot.png", "kind": "screenshot", "bank": "Itaú", "amount": "4.780,35",
+     "date": "21/05/2025", "time": "08:13:40", "sender": "BEATRIZ AMOSTRA LIMA", "recipient": "SERVICOS EXEMPLO SA",
+     "id": "E60701190202505210813b0000000003"},
+    {"file": "picpay_screenshot.png", "kind": "screenshot", "bank": "PicPay", "amount": "89,90",
+     "date": "30/06/2025", "time": "22:47:02", "sender": "RAFAEL FICTICIO SOUZA", "recipient": "MERCADO DEMO LTDA",
+     "id": "E22896431202506302247c0000000004"},
+    {"file": "bradesco_photo.jpg", "kind": "photo", "bank": "Bradesco", "amount": "15.000,00",
+     "date": "07/07/2025", "time": "14:20:09", "sender": "PATRICIA MODELO ALVES", "recipient": "DISTRIBUIDORA TESTE LTDA",
+     "id": "E60746948202507071420d0000000005"},
+    {"file": "caixa_photo.jpg", "kind": "photo", "bank": "Caixa Econômica", "amount": "620,00",
+     "date": "19/08/2025", "time": "09:58:33", "sender": "THIAGO EXEMPLAR ROCHA", "recipient": "ALIMENTOS DEMO ME",
+     "id": "E00360305202508190958e0000000006"},
+]
+
+def receipt_lines(r: dict) -> list[tuple[str, bool]]:
+    return [
+        (r["bank"], True), ("Comprovante de transferência Pix", True), ("", False),
+        ("Valor", False), (f"R$ {r['amount']}", True), ("", False),
+        ("Data e hora", False), (f"{r['date']} {r['time']}", False), ("", False),
+        ("Dados de quem pagou", True), (r["sender"], False), ("CPF ***.456.789-**", False), ("", False),
+        ("Dados de quem recebeu", True), (r["recipient"], False), ("Chave Pix: contato@exemplo.com.br", False),
+        ("", False), ("ID da transação", True), (r["id"], False),
+    ]
+
+def render(r: dict, width: int, height: int, scale: float) -> Image.Image:
+    im = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    regular, bold = ImageFont.truetype(FONT, int(40 * scale)), ImageFont.truetype(FONT_BOLD, int(44 * scale))
+    band = int(240 * scale)
+    draw.rectangle((0, 0, width, band), fill=(124, 58, 237))
+    y = int(50 * scale)
+    for text, strong in receipt_lines(r):
+        draw.text((int(60 * scale), y), text, fill=(255, 255, 255) if y < band else (20, 20, 20),
+                  font=bold if strong else regular)
+        y += int(80 * scale)
+    return im
+
+def photo(im: Image.Image) -> Image.Image:
+    """Paper tint, slight blur and per-pixel noise, stored rotated with an EXIF orientation tag."""
+    im = im.rotate(1.5, expand=True, fillcolor=(200, 196, 188)).filter(ImageFilter.GaussianBlur(1.2))
+    tint = Image.new("RGB", im.size, (238, 232, 220))
+    im = Image.blend(im, tint, 0.25)
+    noise = Image.effect_noise(im.size, 18).convert("RGB")
+    im = Image.blend(im, noise, 0.08)
+    return im.transpose(Image.Transpose.ROTATE_90)  # camera sensor orientation; EXIF 6 turns it upright
+
+def main():
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    labels = {}
+    for r in RECEIPTS:
+        path = OUT_DIR / r["file"]
+        if r["kind"] == "screenshot":
+            render(r, 1080, 2400, 1.0).save(path, "PNG")
+        else:
+            im = photo(render(r, 2250, 3400, 2.0))
+            exif = Image.Exif()
+            exif[0x0112] = 6
+            im.save(path, "JPEG", quality=92, exif=exif)
+        # Labels use the JSON formats prompt_2 asks for: "1,250.00" for the printed "1.250,00".
+        amount = r["amount"].replace(".", "").replace(",", ".")
+        labels[r["file"]] = {"transaction_id": r["id"], "amount": f"{float(amount):,.2f}", "invoice_date": r["date"],
+                             "sender.name": r["sender"], "recipient.name": r["recipient"]}
+    with open(OUT_DIR / "labels.json", "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+if __name__ == "__main__":
+    main()
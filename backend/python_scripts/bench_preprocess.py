@@ -0,0 +1,101 @@
+"""
+Benchmark for the receipt image pre-processing stage (utils.preprocess_image).
+
+Measures payload size reduction and pre-processing latency over a corpus
+directory (see bench_corpus.py for the layout), by default the synthetic
+receipts in bench_fixtures/receipts (regenerate with
+bench_fixtures/make_receipts.py). With --ocr it also sends the
+raw and the pre-processed image to Gemini and reports OCR latency and field
+accuracy for both, against labels.json when present, otherwise against the
+raw image's output.
+
+    python bench_preprocess.py
+    python bench_preprocess.py /path/to/corpus
+    python bench_preprocess.py /path/to/corpus --ocr --max-dim 1280 --grayscale
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+script_dir = Path(__file__).resolve().parent
+load_dotenv(dotenv_path=script_dir.parent / '.env')
+
+from utils import preprocess_image, preprocess_settings, gemini_img_ocr, clean_text_and_load_json
+from receipt_schema import get_path
+from bench_corpus import load_corpus, score_fields, percentile, DEFAULT_FIELDS
+
+def run_ocr(image_data, extension, mime_type=None):
+    started = time.perf_counter()
+    result = clean_text_and_load_json(gemini_img_ocr(image_data, extension, mime_type=mime_type) or "")
+    return result, (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark receipt image pre-processing.")
+    parser.add_argument("corpus", nargs="?", default=str(script_dir / "bench_fixtures" / "receipts"),
+                        help="Directory of receipt images (optionally with labels.json); defaults to the fixtures.")
+    parser.add_argument("--ocr", action="store_true", help="Also compare Gemini latency/accuracy on raw vs processed images.")
+    parser.add_argument("--max-dim", type=int, help="Override OCR_IMAGE_MAX_DIM.")
+    parser.add_argument("--grayscale", action="store_true", help="Override OCR_IMAGE_GRAYSCALE.")
+    parser.add_argument("--format", help="Override OCR_IMAGE_FORMAT (JPEG, WEBP, PNG).")
+    parser.add_argument("--quality", type=int, help="Override OCR_IMAGE_QUALITY.")
+    args = parser.parse_args()
+
+    settings = preprocess_settings()
+    settings["enabled"] = True
+    if args.max_dim: settings["max_dim"] = args.max_dim
+    if args.grayscale: settings["grayscale"] = True
+    if args.format: settings["format"] = args.format.upper()
+    if args.quality: settings["quality"] = args.quality
+
+    items = [(p, l) for p, l in load_corpus(args.corpus) if not p.lower().endswith(".pdf")]
+    if not items:
+        print("No images found in corpus.")
+        return 1
+
+    bytes_in = bytes_out = 0
+    prep_ms, raw_ms, proc_ms = [], [], []
+    raw_score = [0, 0]
+    proc_score = [0, 0]
+
+    print(f"Settings: {settings}")
+    print(f"{'file':40} {'in KB':>9} {'out KB':>9} {'ratio':>6} {'prep ms':>8}")
+    for path, labels in items:
+        with open(path, "rb") as f:
+            raw = f.read()
+        data, mime_type, stats = preprocess_image(raw, settings)
+        bytes_in += stats["bytes_in"]
+        bytes_out += stats["bytes_out"]
+        prep_ms.append(stats["elapsed_ms"])
+        ratio = stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 1
+        print(f"{os.path.basename(path)[:40]:40} {stats['bytes_in'] / 1024:9.1f} {stats['bytes_out'] / 1024:9.1f} "
+              f"{ratio:6.2f} {stats['elapsed_ms']:8.1f}")
+
+        if args.ocr:
+            extension = os.path.splitext(path)[1].lower()
+            raw_result, ms = run_ocr(raw, extension)
+            raw_ms.append(ms)
+            proc_result, ms = run_ocr(data, extension, mime_type)
+            proc_ms.append(ms)
+            expected = labels or {f: v for f in DEFAULT_FIELDS if (v := get_path(raw_result, f)) is not None}
+            for totals, result in ((raw_score, raw_result), (proc_score, proc_result)):
+                correct, total, _ = score_fields(expected, result)
+                totals[0] += correct
+                totals[1] += total
+
+    print()
+    print(f"Images: {len(items)}  total {bytes_in / 1024:.1f} KB -> {bytes_out / 1024:.1f} KB "
+          f"({(1 - bytes_out / bytes_in) * 100 if bytes_in else 0:.1f}% smaller)")
+    print(f"Pre-processing ms: p50={percentile(prep_ms, 50):.1f} p95={percentile(prep_ms, 95):.1f}")
+    if args.ocr:
+        reference = "labels.json" if any(l for _, l in items) else "raw-image output"
+        for name, times, score in (("raw", raw_ms, raw_score), ("processed", proc_ms, proc_score)):
+            accuracy = score[0] / score[1] * 100 if score[1] else 0
+            print(f"OCR {name:9} ms: p50={percentile(times, 50):.0f} p95={percentile(times, 95):.0f}  "
+                  f"field accuracy vs {reference}: {accuracy:.1f}% ({score[0]}/{score[1]})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
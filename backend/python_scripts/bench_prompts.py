@@ -0,0 +1,183 @@
+"""
+Prompt variant A/B benchmark over a labelled receipt corpus.
+
+For every (receipt, prompt variant, model) it records the input/output token
+counts Gemini reports (usage_metadata), the call latency and the field
+accuracy against labels.json (see bench_corpus.py), then prints a comparison
+table per variant and model.
+
+Responses are stored as fixtures so a run can be reproduced offline:
+    python bench_prompts.py /path/to/corpus --mode record --models gemini-2.5-flash,gemini-2.5-flash-lite
+    python bench_prompts.py /path/to/corpus                  # replay from fixtures, no API calls
+    python bench_prompts.py /path/to/corpus --max-input-tokens 1500 --json report.json
+
+Fixtures default to <corpus>/fixtures and are keyed by file content, prompt
+text and model, so editing a prompt invalidates only that variant's fixtures.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+script_dir = Path(__file__).resolve().parent
+load_dotenv(dotenv_path=script_dir.parent / '.env')
+
+from prompts import PROMPT_VARIANTS
+from utils import GEMINI_MODEL, INVOICE_GENERATION_CONFIG, get_gemini_client, image_mime_type, preprocess_image
+from receipt_schema import parse_model_json, validate_receipt
+from bench_corpus import load_corpus, score_fields, percentile, DEFAULT_FIELDS
+
+def fixture_path(fixtures_dir: str, file_data: bytes, prompt: str, model_name: str) -> str:
+    digest = hashlib.sha256()
+    for part in (file_data, prompt.encode("utf-8"), model_name.encode("utf-8")):
+        digest.update(hashlib.sha256(part).digest())
+    return os.path.join(fixtures_dir, f"{digest.hexdigest()[:32]}.json")
+
+def call_gemini(file_data: bytes, mime_type: str, prompt: str, model_name: str) -> dict:
+    started = time.perf_counter()
+    response = get_gemini_client().generate(
+        [{"mime_type": mime_type, "data": file_data}, {"text": prompt}],
+        model_name=model_name, generation_config=INVOICE_GENERATION_CONFIG,
+    )
+    latency_ms = (time.perf_counter() - started) * 1000
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": response.text,
+        "input_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "latency_ms": round(latency_ms, 1),
+    }
+
+def load_inputs(path: str) -> tuple[bytes, str]:
+    """Same payload production sends: pre-processed images, PDFs as-is."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        return raw, "application/pdf"
+    data, mime_type, _ = preprocess_image(raw)
+    return data, mime_type or image_mime_type(extension)
+
+def run(items, variants, models, mode, fixtures_dir):
+    """Yields one sample dict per (file, variant, model); missing fixtures are skipped in replay mode."""
+    for path, labels in items:
+        file_data, mime_type = load_inputs(path)
+        for model_name in models:
+            for variant in variants:
+                prompt = PROMPT_VARIANTS[variant]
+                fixture = fixture_path(fixtures_dir, file_data, prompt, model_name)
+                sample = None
+                if mode != "live" and os.path.exists(fixture):
+                    with open(fixture, "r", encoding="utf-8") as f:
+                        sample = json.load(f)
+                elif mode == "replay":
+                    print(f"[BENCH] No fixture for {os.path.basename(path)} / {variant} / {model_name}; "
+                          f"run with --mode record", file=sys.stderr)
+                    continue
+                if sample is None:
+                    try:
+                        sample = call_gemini(file_data, mime_type, prompt, model_name)
+                    except Exception as e:
+                        print(f"[BENCH] {os.path.basename(path)} / {variant} / {model_name} failed: {e}", file=sys.stderr)
+                        continue
+                    if mode == "record":
+                        sample.update({"file": os.path.basename(path), "variant": variant, "model": model_name})
+                        with open(fixture, "w", encoding="utf-8") as f:
+                            json.dump(sample, f, ensure_ascii=False, indent=2)
+
+                result, _ = validate_receipt(parse_model_json(sample["text"]), "invoice")
+                correct, total, mismatches = score_fields(labels, result, [f for f in DEFAULT_FIELDS if f in labels])
+                yield {"path": path, "variant": variant, "model": model_name, "correct": correct, "total": total,
+                       "mismatches": mismatches, "input_tokens": sample.get("input_tokens"),
+                       "output_tokens": sample.get("output_tokens"), "latency_ms": sample.get("latency_ms")}
+
+def summarize(samples: list[dict]) -> list[dict]:
+    groups = {}
+    for sample in samples:
+        groups.setdefault((sample["variant"], sample["model"]), []).append(sample)
+    rows = []
+    for (variant, model_name), group in sorted(groups.items()):
+        input_tokens = [s["input_tokens"] for s in group if s["input_tokens"] is not None]
+        output_tokens = [s["output_tokens"] for s in group if s["output_tokens"] is not None]
+        latencies = [s["latency_ms"] for s in group if s["latency_ms"] is not None]
+        correct = sum(s["correct"] for s in group)
+        total = sum(s["total"] for s in group)
+        field_errors = {}
+        for s in group:
+            for name in s["mismatches"]:
+                field_errors[name] = field_errors.get(name, 0) + 1
+        rows.append({
+            "variant": variant, "model": model_name, "samples": len(group),
+            "avg_input_tokens": round(sum(input_tokens) / len(input_tokens), 1) if input_tokens else None,
+            "avg_output_tokens": round(sum(output_tokens) / len(output_tokens), 1) if output_tokens else None,
+            "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+            "accuracy": round(correct / total * 100, 1) if total else None,
+            "field_errors": field_errors,
+        })
+    return rows
+
+def _fmt(value, spec=""):
+    return "-" if value is None else format(value, spec)
+
+def print_report(rows: list[dict], max_input_tokens: int | None):
+    print(f"| {'variant':10} | {'model':24} | {'n':>4} | {'in tok':>8} | {'out tok':>8} | "
+          f"{'p50 ms':>7} | {'p95 ms':>7} | {'accuracy':>8} | worst fields")
+    print(f"|{'-' * 12}|{'-' * 26}|{'-' * 6}|{'-' * 10}|{'-' * 10}|{'-' * 9}|{'-' * 9}|{'-' * 10}|{'-' * 14}")
+    for row in rows:
+        worst = ", ".join(f"{name} ({count})" for name, count in
+                          sorted(row["field_errors"].items(), key=lambda item: -item[1])[:3])
+        over = max_input_tokens and row["avg_input_tokens"] and row["avg_input_tokens"] > max_input_tokens
+        print(f"| {row['variant']:10} | {row['model']:24} | {row['samples']:>4} | "
+              f"{_fmt(row['avg_input_tokens'], '.0f'):>8}{'!' if over else ' '}| {_fmt(row['avg_output_tokens'], '.0f'):>8} | "
+              f"{_fmt(row['p50_ms'], '.0f'):>7} | {_fmt(row['p95_ms'], '.0f'):>7} | "
+              f"{_fmt(row['accuracy'], '.1f'):>7}% | {worst}")
+    if max_input_tokens:
+        print(f"\n'!' marks variants whose average input exceeds the {max_input_tokens}-token budget.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt variants by tokens, latency and field accuracy.")
+    parser.add_argument("corpus", help="Directory of receipts with labels.json.")
+    parser.add_argument("--variants", default=",".join(PROMPT_VARIANTS),
+                        help=f"Comma-separated prompt variants ({', '.join(PROMPT_VARIANTS)}).")
+    parser.add_argument("--models", default=GEMINI_MODEL, help="Comma-separated Gemini models.")
+    parser.add_argument("--mode", choices=("replay", "record", "live"), default="replay",
+                        help="replay: fixtures only; record: call Gemini for missing fixtures and save them; "
+                             "live: always call Gemini, save nothing.")
+    parser.add_argument("--fixtures", help="Fixture directory (default: <corpus>/fixtures).")
+    parser.add_argument("--max-input-tokens", type=int, help="Flag variants whose average input exceeds this budget.")
+    parser.add_argument("--json", help="Also write the summary and per-sample results to this file.")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in variants if v not in PROMPT_VARIANTS]
+    if unknown:
+        print(f"Unknown prompt variants: {', '.join(unknown)}")
+        return 1
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+
+    items = [(path, labels) for path, labels in load_corpus(args.corpus) if labels]
+    if not items:
+        print("No labelled receipts found in corpus (labels.json is required).")
+        return 1
+    fixtures_dir = args.fixtures or os.path.join(args.corpus, "fixtures")
+    os.makedirs(fixtures_dir, exist_ok=True)
+
+    samples = list(run(items, variants, models, args.mode, fixtures_dir))
+    if not samples:
+        print("No samples; record fixtures first with --mode record.")
+        return 1
+    rows = summarize(samples)
+    print(f"Receipts: {len(items)}  variants: {', '.join(variants)}  models: {', '.join(models)}  mode: {args.mode}\n")
+    print_report(rows, args.max_input_tokens)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": rows, "samples": samples}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Benchmark for fuzzy sender matching (sender_matcher.py) as telegram_checker.py
+uses it: one amount bucket of unused transactions is fetched from MySQL and
+the receipt's OCR'd sender is matched against its names.
+
+For each bucket size, synthetic buckets are built from a pool of payer names.
+The receipt's payer is in the bucket for --present-share of the queries
+(otherwise the right answer is no match). The OCR'd name carries one or two
+typos, or for --short-share of the queries is a lone surname. Decision rules
+compared:
+  - substring: the previous rule, lowercased query contained in the name
+  - raw bonus: trigram similarity with a bonus for any substring hit, no margin
+  - sender_matcher: whole-word bonus for long queries, plus the margin, scoring
+    every row of the bucket
+  - trigram index: the same decision over the rows telegram_checker.py fetches,
+    i.e. only names sharing min_shared_trigrams with the query; the bucket's
+    postings stand in for telegram_sender_trigrams and are built untimed
+
+    python bench_sender_matcher.py
+    python bench_sender_matcher.py --bucket-sizes 10,100,5000 --queries 2000 --min-score 0.7 --margin 0.1
+"""
+import sys
+import random
+import argparse
+import timeit
+
+from collections import Counter
+
+from sender_matcher import (CONTAINS_SCORE, DEFAULT_MARGIN, DEFAULT_MIN_SCORE, _dice, confident_match,
+                            min_shared_trigrams, rank_candidates, trigrams)
+from telegram_parsing import normalize_name
+
+# --- Previous implementations ---
+def substring_rule(candidates, sender):
+    query = sender.lower().strip()
+    return next((row_id for row_id, name, _ in candidates if query in name), None)
+
+def raw_bonus_rule(candidates, sender, min_score):
+    query = normalize_name(sender)
+    best_score, best_row = 0.0, None
+    for row_id, name, _ in candidates:
+        score = _dice(trigrams(query), trigrams(name))
+        if query in name:
+            score = max(CONTAINS_SCORE, score)
+        if score > best_score:
+            best_score, best_row = score, row_id
+    return best_row if best_score >= min_score else None
+
+def matcher_rule(candidates, sender, min_score, margin):
+    match = confident_match(rank_candidates(candidates, sender, k=2), min_score, margin)
+    return match.row_id if match else None
+
+def build_postings(candidates) -> dict:
+    postings = {}
+    for position, (_, name, _) in enumerate(candidates):
+        for gram in trigrams(name):
+            postings.setdefault(gram, []).append(position)
+    return postings
+
+def indexed_rule(candidates, postings, sender, min_score, margin):
+    query = normalize_name(sender)
+    shared = Counter()
+    for gram in trigrams(query):
+        shared.update(postings.get(gram, ()))
+    needed = min_shared_trigrams(query, min_score - margin)
+    fetched = [candidates[position] for position in sorted(shared) if shared[position] >= needed]
+    return matcher_rule(fetched, sender, min_score, margin)
+
+# --- Synthetic buckets ---
+_FIRST = ["joao", "maria", "ana", "pedro", "lucas", "beatriz", "carlos", "fernanda", "jose", "marcia", "rafael",
+          "juliana", "gabriel", "camila", "bruno", "larissa", "thiago", "patricia", "diego", "aline"]
+_LAST = ["silva", "souza", "oliveira", "santos", "pereira", "costa", "rodrigues", "almeida", "nascimento",
+         "lima", "araujo", "fernandes", "carvalho", "gomes", "martins", "rocha", "ribeiro", "alves", "barbosa"]
+_COMPANY = ["comercio", "servicos", "transportes", "distribuidora", "tech", "alimentos", "construcoes"]
+
+def make_payer(rng: random.Random) -> str:
+    if rng.random() < 0.6:
+        return " ".join([rng.choice(_FIRST)] + rng.sample(_LAST, rng.randrange(1, 4)))
+    return " ".join([rng.choice(_COMPANY), rng.choice(_LAST), rng.choice(_LAST)])
+
+def ocr_typo(name: str, rng: random.Random) -> str:
+    """One or two character substitutions/deletions, as OCR misreads produce."""
+    chars = list(name)
+    for _ in range(rng.randrange(1, 3)):
+        i = rng.randrange(len(chars))
+        if chars[i] == " ":
+            continue
+        if rng.random() < 0.5:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        else:
+            del chars[i]
+    return "".join(chars)
+
+def make_queries(count: int, bucket_size: int, present_share: float, short_share: float, seed: int = 9):
+    """(candidates, postings, ocr_sender, expected row_id or None) per query."""
+    rng = random.Random(seed)
+    pool = list({make_payer(rng) for _ in range(20000)})
+    queries = []
+    for _ in range(count):
+        payer = rng.choice(pool)
+        others = [name for name in rng.sample(pool, bucket_size + 1) if name != payer][:bucket_size]
+        candidates = [(row_id, name, "100.00") for row_id, name in enumerate(others, start=1)]
+        expected = None
+        if rng.random() < present_share:
+            expected = 0
+            candidates[rng.randrange(len(candidates))] = (expected, payer, "100.00")
+        sender = payer.split()[-1] if rng.random() < short_share else ocr_typo(payer, rng)
+        queries.append((candidates, build_postings(candidates), sender, expected))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy sender matching over amount buckets.")
+    parser.add_argument("--bucket-sizes", default="5,50,500,5000", help="Candidates per amount bucket.")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--present-share", type=float, default=0.8, help="Share of queries whose payer is in the bucket.")
+    parser.add_argument("--short-share", type=float, default=0.1, help="Share of queries that are a lone surname.")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE)
+    parser.add_argument("--margin", type=float, default=DEFAULT_MARGIN)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rules = {
+        "substring": lambda c, p, s: substring_rule(c, s),
+        "raw bonus": lambda c, p, s: raw_bonus_rule(c, s, args.min_score),
+        "sender_matcher": lambda c, p, s: matcher_rule(c, s, args.min_score, args.margin),
+        "trigram index": lambda c, p, s: indexed_rule(c, p, s, args.min_score, args.margin),
+    }
+    print(f"Queries: {args.queries}  present: {args.present_share:.0%}  lone surname: {args.short_share:.0%}  "
+          f"min score: {args.min_score}  margin: {args.margin}")
+    for bucket_size in (int(size) for size in args.bucket_sizes.split(",")):
+        queries = make_queries(args.queries, bucket_size, args.present_share, args.short_share)
+        print(f"\nBucket of {bucket_size} names")
+        for name, rule in rules.items():
+            correct = wrong = missed = 0
+            for candidates, postings, sender, expected in queries:
+                found = rule(candidates, postings, sender)
+                if found == expected:
+                    correct += 1
+                elif found is None:
+                    missed += 1
+                else:
+                    wrong += 1
+            best = min(timeit.repeat(lambda: [rule(c, p, s) for c, p, s, _ in queries], number=1, repeat=args.repeat))
+            print(f"  {name:15} {best / len(queries) * 1000:8.3f} ms/query  correct {correct / len(queries):6.1%}  "
+                  f"wrong match {wrong / len(queries):6.1%}  missed {missed / len(queries):6.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
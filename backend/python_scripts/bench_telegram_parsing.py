@@ -0,0 +1,167 @@
+"""
+Benchmark for Telegram transaction message parsing: the previous per-call
+regex code of telegram_listener.parse_and_store_message against
+telegram_parsing.py (precompiled patterns, memoized names, no strptime).
+
+Runs over synthetic messages in the listener's format, with recurring payers,
+a share of chat noise and occasional missing fields. Outputs of both
+implementations are compared before timing.
+
+    python bench_telegram_parsing.py
+    python bench_telegram_parsing.py --messages 50000 --payers 300 --noise-share 0.3
+"""
+import re
+import sys
+import random
+import argparse
+import timeit
+from datetime import datetime
+
+import telegram_parsing
+from telegram_parsing import extract_fields, normalize_name, parse_brl_amount, parse_transaction_date
+
+# --- Previous implementation (telegram_listener.py before telegram_parsing.py) ---
+def legacy_parse_brl_amount(amount_str):
+    try:
+        cleaned_str = re.sub(r'[^\d,.]', '', amount_str).strip()
+        if ',' in cleaned_str and '.' in cleaned_str and cleaned_str.rfind('.') < cleaned_str.rfind(','):
+            cleaned_str = cleaned_str.replace(".", "").replace(",", ".")
+        else:
+            cleaned_str = cleaned_str.replace(",", ".")
+        return float(cleaned_str)
+    except (ValueError, TypeError):
+        return 0.0
+
+def legacy_parse(message_text):
+    amount_regex = re.compile(r"Amount:\s*R\$\s*([\d.,]+)")
+    sender_block_regex = re.compile(r"Sender Information:\s*-+\s*(.+?)(?=\n\n|\Z)", re.DOTALL)
+    sender_name_regex = re.compile(r"Name:\s*([^\n]+)")
+    date_regex = re.compile(r"Date:\s*(\d{2}/\d{2}/\d{4}\s\d{2}:\d{2}:\d{2})")
+
+    amount_match = amount_regex.search(message_text)
+    sender_block_match = sender_block_regex.search(message_text)
+    date_match = date_regex.search(message_text)
+    if not (amount_match and sender_block_match and date_match):
+        return None
+    sender_name_match = sender_name_regex.search(sender_block_match.group(1))
+    if not sender_name_match:
+        return None
+    sender_name_raw = sender_name_match.group(1).strip()
+    if not sender_name_raw:
+        return None
+    normalized_name = re.sub(r'[\d.,-]', '', sender_name_raw)
+    normalized_name = re.sub(r'\b(ltda|me|sa|eireli|epp)\b', '', normalized_name, flags=re.IGNORECASE)
+    normalized_name = re.sub(r'\s+', ' ', normalized_name).strip().lower()
+    tx_date = datetime.strptime(date_match.group(1), '%d/%m/%Y %H:%M:%S')
+    return (legacy_parse_brl_amount(amount_match.group(1)), sender_name_raw, normalized_name, tx_date)
+
+def legacy_extract(message_text):
+    """Only the searches of legacy_parse, for the field extraction comparison."""
+    amount_match = re.search(r"Amount:\s*R\$\s*([\d.,]+)", message_text)
+    sender_block_match = re.search(r"Sender Information:\s*-+\s*(.+?)(?=\n\n|\Z)", message_text, re.DOTALL)
+    date_match = re.search(r"Date:\s*(\d{2}/\d{2}/\d{4}\s\d{2}:\d{2}:\d{2})", message_text)
+    sender_name_match = sender_block_match and re.search(r"Name:\s*([^\n]+)", sender_block_match.group(1))
+    return amount_match, sender_name_match, date_match
+
+def new_parse(message_text):
+    fields = extract_fields(message_text)
+    if not (fields.amount and fields.sender_block and fields.date) or not fields.sender_name:
+        return None
+    return (parse_brl_amount(fields.amount), fields.sender_name, normalize_name(fields.sender_name),
+            parse_transaction_date(fields.date))
+
+# --- Synthetic corpus ---
+_FIRST = ["JOAO", "MARIA", "Ana", "Pedro", "LUCAS", "Beatriz", "Carlos", "Fernanda", "José", "Márcia"]
+_LAST = ["SILVA", "Souza", "OLIVEIRA", "Santos", "Pereira", "Costa", "Rodrigues", "Almeida"]
+_COMPANY = ["COMERCIO", "Servicos", "TRANSPORTES", "Distribuidora", "Tech"]
+_SUFFIX = ["LTDA", "ME", "S.A.", "EIRELI", "EPP", "Ltda.", ""]
+
+def make_payer(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return f"{rng.choice(_FIRST)} {rng.choice(_LAST)}  {rng.choice(_LAST)}"
+    cnpj = f"{rng.randrange(10**8):08d}"
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:]} {rng.choice(_COMPANY)} {rng.choice(_LAST)} {rng.choice(_SUFFIX)}".strip()
+
+def make_message(rng: random.Random, payer: str) -> str:
+    amount = f"{rng.randrange(1, 500000) / 100:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    date = f"{rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}/2024 {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+    lines = [
+        "💰 PIX Received", "",
+        f"Amount: R$ {amount}", "",
+        "Sender Information:", "--------------------",
+        f"Name: {payer}", f"Document: ***.{rng.randrange(1000):03d}.***-**", "Bank: 260 - NU PAGAMENTOS", "",
+        "Receiver Information:", "--------------------", "Name: BETA SERVICOS LTDA", "",
+        f"Date: {date}",
+        f"End-to-end ID: E{rng.randrange(10**20):020d}",
+    ]
+    roll = rng.random()
+    if roll < 0.02:
+        lines = [line for line in lines if not line.startswith("Date:")]
+    elif roll < 0.03:
+        lines[6] = "Name:   "
+    return "\n".join(lines)
+
+def make_corpus(messages: int, payers: int, noise_share: float, seed: int = 5) -> list[str]:
+    rng = random.Random(seed)
+    payer_pool = [make_payer(rng) for _ in range(payers)]
+    chat = ["ok", "Conferido ✅", "Pix enviado, favor confirmar", "Amount pending", "bom dia"]
+    return [rng.choice(chat) if rng.random() < noise_share else make_message(rng, rng.choice(payer_pool))
+            for _ in range(messages)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Telegram transaction message parsing.")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages in the synthetic corpus.")
+    parser.add_argument("--payers", type=int, default=200, help="Distinct recurring payer names.")
+    parser.add_argument("--noise-share", type=float, default=0.2, help="Share of non-transaction chat messages.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages, args.payers, args.noise_share)
+    expected = [legacy_parse(m) for m in corpus]
+    if [new_parse(m) for m in corpus] != expected:
+        print("Mismatch between legacy and new parsing.")
+        return 1
+    names = [row[1] for row in expected if row]
+    if [normalize_name(n) for n in names] != [row[2] for row in expected if row]:
+        print("Mismatch between legacy and new name normalization.")
+        return 1
+
+    def new_cold():
+        telegram_parsing.normalize_name.cache_clear()
+        for m in corpus:
+            new_parse(m)
+
+    def legacy_normalize():
+        for n in names:
+            n = re.sub(r'[\d.,-]', '', n)
+            n = re.sub(r'\b(ltda|me|sa|eireli|epp)\b', '', n, flags=re.IGNORECASE)
+            re.sub(r'\s+', ' ', n).strip().lower()
+
+    groups = {
+        "Full parse": {
+            "legacy": lambda: [legacy_parse(m) for m in corpus],
+            "new, cold LRU": new_cold,
+            "new, warm LRU": lambda: [new_parse(m) for m in corpus],
+        },
+        "Field extraction": {
+            "legacy, re module cache": lambda: [legacy_extract(m) for m in corpus],
+            "extract_fields": lambda: [extract_fields(m) for m in corpus],
+        },
+        "Name normalization": {
+            "legacy re.sub x3": legacy_normalize,
+            "normalize_name, warm": lambda: [normalize_name(n) for n in names],
+        },
+    }
+    parsed = sum(1 for row in expected if row)
+    print(f"Messages: {args.messages}  parsed: {parsed}  payers: {args.payers}  noise share: {args.noise_share}")
+    for title, timings in groups.items():
+        print(f"\n{title}")
+        baseline = None
+        for name, fn in timings.items():
+            best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+            baseline = baseline or best
+            print(f"  {name:22} {best * 1000:9.1f} ms  {best / args.messages * 1e6:7.2f} us/msg  x{baseline / best:6.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
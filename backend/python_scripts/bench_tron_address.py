@@ -0,0 +1,90 @@
+"""
+Micro-benchmark for Tron address normalization: the previous usdt_validator
+implementation against tron_address.py.
+
+Runs over synthetic event feeds where a few wallets repeat (as in real
+TronGrid event data) plus a share of unique counterparties.
+
+    python bench_tron_address.py
+    python bench_tron_address.py --events 200000 --wallets 20 --unique-share 0.2
+"""
+import sys
+import random
+import hashlib
+import argparse
+import timeit
+
+import tron_address
+from tron_address import b58check_encode, normalize_tron_addresses
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# --- Previous implementation (usdt_validator.py before tron_address.py) ---
+def legacy_b58encode(b: bytes) -> str:
+    n = int.from_bytes(b, "big")
+    res = ""
+    while n > 0:
+        n, r = divmod(n, 58)
+        res = _B58_ALPHABET[r] + res
+    pad = 0
+    for ch in b:
+        if ch == 0:
+            pad += 1
+        else:
+            break
+    return "1" * pad + res
+
+def legacy_tron_hex_to_base58(addr: str) -> str | None:
+    if not addr: return None
+    a = addr.strip()
+    if a.startswith("T") and len(a) >= 34: return a
+    if a.startswith(("0x", "0X")): a = a[2:]
+    if len(a) == 40: a = "41" + a
+    try:
+        raw = bytes.fromhex(a)
+    except ValueError:
+        return None
+    if len(raw) != 21 or raw[0] != 0x41: return None
+    chk = hashlib.sha256(hashlib.sha256(raw).digest()).digest()[:4]
+    return legacy_b58encode(raw + chk)
+
+def make_feed(events: int, wallets: int, unique_share: float, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    ours = ["41" + rng.randbytes(20).hex() for _ in range(wallets)]
+    return [("41" + rng.randbytes(20).hex()) if rng.random() < unique_share else rng.choice(ours)
+            for _ in range(events)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Tron address normalization.")
+    parser.add_argument("--events", type=int, default=100000, help="Addresses in the synthetic event feed.")
+    parser.add_argument("--wallets", type=int, default=10, help="Distinct recurring wallets.")
+    parser.add_argument("--unique-share", type=float, default=0.1, help="Share of one-off counterparties.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    feed = make_feed(args.events, args.wallets, args.unique_share)
+    expected = [legacy_tron_hex_to_base58(a) for a in feed]
+    if normalize_tron_addresses(feed) != expected:
+        print("Mismatch between legacy and new encodings.")
+        return 1
+
+    def new_cold():
+        tron_address._normalize.cache_clear()
+        normalize_tron_addresses(feed)
+
+    timings = {
+        "legacy, per event": lambda: [legacy_tron_hex_to_base58(a) for a in feed],
+        "encode only, per event": lambda: [b58check_encode(bytes.fromhex(a)) for a in feed],
+        "batch, cold LRU": new_cold,
+        "batch, warm LRU": lambda: normalize_tron_addresses(feed),
+    }
+    print(f"Events: {args.events}  wallets: {args.wallets}  unique share: {args.unique_share}")
+    baseline = None
+    for name, fn in timings.items():
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{name:24} {best * 1000:9.1f} ms  {best / args.events * 1e6:7.2f} us/addr  x{baseline / best:5.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
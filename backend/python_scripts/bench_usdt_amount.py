@@ -0,0 +1,90 @@
+"""
+Benchmark for USDT candidate matching over large transfer histories: the
+previous float-based compare_amounts scan against integer micro-USDT matching
+(usdt_amount.py) and the indexed range lookup used by trc20_index.py.
+
+    python bench_usdt_amount.py
+    python bench_usdt_amount.py --transfers 1000000 --lookups 200
+"""
+import sys
+import random
+import sqlite3
+import argparse
+import timeit
+
+from usdt_amount import parse_usdt, from_raw, amount_range
+
+# --- Previous implementation (usdt_validator.compare_amounts) ---
+def legacy_compare_amounts(onchain_value_raw, invoice_amount: float, decimals: int = 6, tol=1):
+    try:
+        raw = int(onchain_value_raw)
+    except (ValueError, TypeError):
+        return False
+    target_raw = int(round(invoice_amount * (10 ** decimals)))
+    return abs(raw - target_raw) <= tol
+
+def make_history(transfers: int, seed: int = 11) -> list[dict]:
+    """TronGrid-shaped rows: raw values are decimal strings of micro-USDT."""
+    rng = random.Random(seed)
+    return [{"transaction_id": f"{i:064x}", "value": str(rng.randrange(1, 50_000) * 10_000),
+             "block_timestamp": 1_700_000_000_000 + i * 3000} for i in range(transfers)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark USDT amount matching.")
+    parser.add_argument("--transfers", type=int, default=200000, help="Rows in the synthetic transfer history.")
+    parser.add_argument("--lookups", type=int, default=50, help="Receipt amounts looked up per run.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    history = make_history(args.transfers)
+    rng = random.Random(3)
+    receipts = [f"{int(row['value']) / 1_000_000:,.2f}" for row in rng.sample(history, args.lookups)]
+
+    # Pre-parsed integer column, as kept by trc20_index and the sync output's amount_micro.
+    micro_column = [from_raw(row["value"]) for row in history]
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (txid TEXT, amount_raw INTEGER, block_timestamp INTEGER)")
+    conn.execute("CREATE INDEX idx ON t (amount_raw, block_timestamp)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                     ((row["transaction_id"], value, row["block_timestamp"]) for row, value in zip(history, micro_column)))
+
+    def legacy():
+        for receipt in receipts:
+            amount = float(receipt.replace(",", ""))
+            [row["transaction_id"] for row in history if legacy_compare_amounts(row["value"], amount)]
+
+    def integer_scan():
+        for receipt in receipts:
+            lo, hi = amount_range(parse_usdt(receipt))
+            [row["transaction_id"] for row in history if lo <= int(row["value"]) <= hi]
+
+    def integer_column():
+        for receipt in receipts:
+            lo, hi = amount_range(parse_usdt(receipt))
+            [i for i, value in enumerate(micro_column) if lo <= value <= hi]
+
+    def indexed():
+        for receipt in receipts:
+            conn.execute("SELECT txid FROM t WHERE amount_raw BETWEEN ? AND ?", amount_range(parse_usdt(receipt))).fetchall()
+
+    # All strategies must find the same rows.
+    for receipt in receipts[:5]:
+        lo, hi = amount_range(parse_usdt(receipt))
+        expected = {row["transaction_id"] for row in history if legacy_compare_amounts(row["value"], float(receipt.replace(",", "")))}
+        found = {r[0] for r in conn.execute("SELECT txid FROM t WHERE amount_raw BETWEEN ? AND ?", (lo, hi))}
+        if expected != found:
+            print(f"Mismatch for {receipt}")
+            return 1
+
+    print(f"Transfers: {args.transfers}  lookups: {args.lookups}")
+    baseline = None
+    for name, fn in (("float compare_amounts scan", legacy), ("integer scan, raw strings", integer_scan),
+                     ("integer scan, int column", integer_column), ("sqlite range lookup", indexed)):
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{name:28} {best * 1000:10.1f} ms  {best / args.lookups * 1000:8.3f} ms/lookup  x{baseline / best:8.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
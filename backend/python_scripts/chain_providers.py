@@ -0,0 +1,307 @@
+"""
+USDT (TRC-20) chain data from several providers with health-based routing.
+
+Providers answer up to three questions, each with normalized output:
+  - transfers_page(address, page, page_size): one page of the wallet's USDT
+    transfers, newest first, as {"txid", "time" (epoch s), "from", "to", "value" (micro-USDT)}
+  - incoming_transfers(address, min_timestamp_ms, max_pages): confirmed transfers
+    to the wallet since a time, as {"txid", "to", "value", "timestamp_ms"}
+  - tx_transfers(txid): {"success": bool, "transfers": [{"contract", "to", "value"}]}
+    with Base58 addresses; raises TxNotFound when the provider does not know the tx
+
+ChainRouter tries providers in order of measured latency (EWMA), skipping
+providers that do not support an operation and providers cooling down after
+repeated failures, and falls over to the next one on any error. A provider that
+does not know a transaction (an explorer lagging behind the chain) is not a
+fault, but the next provider is still asked; TxNotFound only reaches the caller
+when none knows it. Pages of one wallet listing are only consistent within a
+provider, so callers walking transfers_page pin the provider that served page 1
+(call_with_provider). Base URLs are configurable (TRONGRID_BASE_URL,
+TRONSCAN_BASE_URL, TOKENVIEW_BASE_URL).
+
+    CHAIN_PROVIDERS=tokenview,trongrid,tronscan   # order used until latencies are known
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from trongrid_client import get_trongrid_client
+from tron_address import normalize_tron_address, normalize_tron_addresses
+
+USDT_TRON_CONTRACT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+TOKENVIEW = "https://usdt.tokenview.io"
+TRONSCAN = "https://apilist.tronscanapi.com"
+
+BROWSER_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+}
+
+def _session(pool_size: int = 16) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+class TxNotFound(LookupError):
+    """The provider has no record of the transaction (yet)."""
+
+class ChainProvider:
+    name = "base"
+
+    def transfers_page(self, address: str, page: int, page_size: int) -> list[dict]:
+        raise NotImplementedError
+
+    def incoming_transfers(self, address: str, min_timestamp_ms: int, max_pages: int = 5) -> list[dict]:
+        raise NotImplementedError
+
+    def tx_transfers(self, txid: str) -> dict:
+        raise NotImplementedError
+
+class TronGridProvider(ChainProvider):
+    """Goes through trongrid_client, so the shared rate limit and immutable cache apply."""
+    name = "trongrid"
+
+    def __init__(self, max_cursors: int = 1024):
+        # (address, page) -> fingerprint of the next page; one entry per walk in progress.
+        self._cursors = OrderedDict()
+        self._cursors_lock = threading.Lock()
+        self.max_cursors = max_cursors
+        self._events_pool = ThreadPoolExecutor(max_workers=4)
+
+    def transfers_page(self, address, page, page_size):
+        params = {"limit": min(page_size, 50), "contract_address": USDT_TRON_CONTRACT}
+        if page > 1:
+            # TronGrid pages by cursor; only pages reached from page 1 on this provider can be served.
+            with self._cursors_lock:
+                fingerprint = self._cursors.pop((address, page), None)
+            if not fingerprint:
+                raise LookupError(f"No TronGrid cursor for page {page}")
+            params["fingerprint"] = fingerprint
+        data = get_trongrid_client().get(f"/v1/accounts/{address}/transactions/trc20", params)
+        fingerprint = (data.get("meta") or {}).get("fingerprint")
+        if fingerprint:
+            with self._cursors_lock:
+                self._cursors[(address, page + 1)] = fingerprint
+                while len(self._cursors) > self.max_cursors:
+                    self._cursors.popitem(last=False)
+        return [{"txid": row.get("transaction_id"), "time": int(row.get("block_timestamp") or 0) // 1000,
+                 "from": row.get("from"), "to": row.get("to"), "value": row.get("value")}
+                for row in data.get("data", [])]
+
+    def incoming_transfers(self, address, min_timestamp_ms, max_pages=5):
+        params = {"limit": 200, "contract_address": USDT_TRON_CONTRACT, "only_confirmed": "true",
+                  "only_to": "true", "order_by": "block_timestamp,desc", "min_timestamp": min_timestamp_ms}
+        rows = []
+        for _ in range(max_pages):
+            data = get_trongrid_client().get(f"/v1/accounts/{address}/transactions/trc20", params)
+            rows.extend({"txid": row["transaction_id"], "to": row.get("to"), "value": row.get("value"),
+                         "timestamp_ms": int(row["block_timestamp"])}
+                        for row in data.get("data", [])
+                        if (row.get("token_info") or {}).get("address") == USDT_TRON_CONTRACT)
+            fingerprint = (data.get("meta") or {}).get("fingerprint")
+            if not fingerprint:
+                break
+            params = dict(params, fingerprint=fingerprint)
+        return rows
+
+    def tx_transfers(self, txid):
+        client = get_trongrid_client()
+        events_future = self._events_pool.submit(client.get_tx_events, txid)
+        info = client.get_tx_info(txid)
+        events = events_future.result().get("data", [])
+        if not info:
+            raise TxNotFound(f"TronGrid does not know {txid}")
+        transfers = [e for e in events if e.get("event_name") == "Transfer"]
+        contracts = normalize_tron_addresses([e.get("contract_address") for e in transfers])
+        recipients = normalize_tron_addresses([e.get("result", {}).get("to") for e in transfers])
+        return {
+            "success": info.get("receipt", {}).get("result") == "SUCCESS",
+            "transfers": [{"contract": contract, "to": to, "value": e.get("result", {}).get("value")}
+                          for e, contract, to in zip(transfers, contracts, recipients)],
+        }
+
+class TronscanProvider(ChainProvider):
+    name = "tronscan"
+
+    def __init__(self, base_url: str = TRONSCAN, api_key: str | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"TRON-PRO-API-KEY": api_key} if api_key else {}
+        self.session = _session()
+
+    def _get(self, path: str, params: dict) -> dict:
+        r = self.session.get(f"{self.base_url}{path}", params=params, headers=self.headers, timeout=20)
+        r.raise_for_status()
+        return r.json()
+
+    @staticmethod
+    def _rows(data: dict) -> list[dict]:
+        return data.get("token_transfers") or []
+
+    def transfers_page(self, address, page, page_size):
+        data = self._get("/api/token_trc20/transfers", {
+            "relatedAddress": address, "contract_address": USDT_TRON_CONTRACT,
+            "limit": page_size, "start": (page - 1) * page_size, "sort": "-timestamp",
+        })
+        return [{"txid": row.get("transaction_id"), "time": int(row.get("block_ts") or 0) // 1000,
+                 "from": row.get("from_address"), "to": row.get("to_address"), "value": row.get("quant")}
+                for row in self._rows(data)]
+
+    def incoming_transfers(self, address, min_timestamp_ms, max_pages=5):
+        rows = []
+        for page in range(max_pages):
+            data = self._get("/api/token_trc20/transfers", {
+                "toAddress": address, "contract_address": USDT_TRON_CONTRACT, "confirm": "true",
+                "start_timestamp": min_timestamp_ms, "limit": 50, "start": page * 50, "sort": "-timestamp",
+            })
+            batch = self._rows(data)
+            rows.extend({"txid": row.get("transaction_id"), "to": row.get("to_address"), "value": row.get("quant"),
+                         "timestamp_ms": int(row.get("block_ts") or 0)}
+                        for row in batch if row.get("confirmed", True))
+            if len(batch) < 50:
+                break
+        return rows
+
+    def tx_transfers(self, txid):
+        data = self._get("/api/transaction-info", {"hash": txid})
+        if not data or not data.get("hash"):
+            raise TxNotFound(f"Tronscan does not know {txid}")
+        return {
+            "success": data.get("contractRet") == "SUCCESS",
+            "transfers": [{"contract": normalize_tron_address(t.get("contract_address")),
+                           "to": normalize_tron_address(t.get("to_address")), "value": t.get("amount_str")}
+                          for t in data.get("trc20TransferInfo") or []],
+        }
+
+class TokenviewProvider(ChainProvider):
+    """The public explorer's own JSON endpoint; wallet listings only."""
+    name = "tokenview"
+
+    def __init__(self, base_url: str = TOKENVIEW):
+        self.base_url = base_url.rstrip("/")
+        self.session = _session()
+
+    def transfers_page(self, address, page, page_size):
+        headers = dict(BROWSER_HEADERS, Referer=f"{self.base_url}/en/address/{address}")
+        r = self.session.get(f"{self.base_url}/api/usdt/addresstxlist/{address}/{page}/{min(page_size, 50)}",
+                             headers=headers, timeout=20)
+        r.raise_for_status()
+        txs = (r.json().get("data") or {}).get("txs") or []
+        return [{"txid": tx.get("txid"), "time": tx.get("time"), "from": tx.get("from"), "to": tx.get("to"),
+                 "value": tx.get("value")} for tx in txs]
+
+@dataclass
+class ProviderHealth:
+    latency_ms: float | None = None
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    down_until: float = 0.0
+    last_error: str | None = None
+
+class ChainRouter:
+    def __init__(self, providers: list[ChainProvider], failure_threshold: int = 3, cooldown_seconds: float = 60.0,
+                 alpha: float = 0.3):
+        self.providers = providers
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.alpha = alpha
+        self.health = {p.name: ProviderHealth() for p in providers}
+        self._lock = threading.Lock()
+
+    def ordered(self) -> list[ChainProvider]:
+        """Healthy providers by latency (untried ones first, in configured order), then those cooling down."""
+        now = time.monotonic()
+        with self._lock:
+            position = {p.name: i for i, p in enumerate(self.providers)}
+            healthy = [p for p in self.providers if self.health[p.name].down_until <= now]
+            cooling = [p for p in self.providers if self.health[p.name].down_until > now]
+            healthy.sort(key=lambda p: (self.health[p.name].latency_ms or 0.0, position[p.name]))
+            cooling.sort(key=lambda p: self.health[p.name].down_until)
+        return healthy + cooling
+
+    def _record(self, name: str, elapsed_ms: float | None = None, error: Exception | None = None):
+        with self._lock:
+            health = self.health[name]
+            if error is None:
+                health.successes += 1
+                health.consecutive_failures = 0
+                health.down_until = 0.0
+                health.latency_ms = elapsed_ms if health.latency_ms is None else \
+                    self.alpha * elapsed_ms + (1 - self.alpha) * health.latency_ms
+                return
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = str(error)[:200]
+            over = health.consecutive_failures - self.failure_threshold
+            if over >= 0:
+                health.down_until = time.monotonic() + min(600.0, self.cooldown_seconds * 2 ** over)
+
+    def call(self, operation: str, *args, **kwargs):
+        """Runs the operation on the best provider, failing over on errors; raises the last error if all fail."""
+        return self.call_with_provider(operation, *args, **kwargs)[1]
+
+    def call_with_provider(self, operation: str, *args, pin: str | None = None, exclude=(), **kwargs):
+        """
+        Like call, but returns (provider name, result). pin runs the operation on that provider
+        only (no failover); exclude skips providers, e.g. one that already failed a walk.
+        """
+        last_error = None
+        for provider in self.ordered():
+            if provider.name in exclude or (pin is not None and provider.name != pin):
+                continue
+            started = time.monotonic()
+            try:
+                result = getattr(provider, operation)(*args, **kwargs)
+            except NotImplementedError:
+                continue
+            except LookupError as e:
+                # The request does not apply to this provider (a page without a cursor, a tx it has not
+                # indexed); not a fault.
+                last_error = e
+                continue
+            except Exception as e:
+                self._record(provider.name, error=e)
+                print(f"[CHAIN] {provider.name}.{operation} failed, trying next provider: {e}", file=sys.stderr)
+                last_error = e
+                continue
+            self._record(provider.name, (time.monotonic() - started) * 1000)
+            return provider.name, result
+        raise last_error or RuntimeError(f"No chain provider supports {operation}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {name: {"latency_ms": round(h.latency_ms, 1) if h.latency_ms is not None else None,
+                           "successes": h.successes, "failures": h.failures, "healthy": h.down_until <= now,
+                           "last_error": h.last_error}
+                    for name, h in self.health.items()}
+
+_PROVIDER_FACTORIES = {
+    "trongrid": TronGridProvider,
+    "tronscan": lambda: TronscanProvider(os.getenv("TRONSCAN_BASE_URL") or TRONSCAN, os.getenv("TRONSCAN_API_KEY")),
+    "tokenview": lambda: TokenviewProvider(os.getenv("TOKENVIEW_BASE_URL") or TOKENVIEW),
+}
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_chain_router() -> ChainRouter:
+    """Process-wide router over CHAIN_PROVIDERS (default "tokenview,trongrid,tronscan")."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            names = [n.strip() for n in os.getenv("CHAIN_PROVIDERS", "tokenview,trongrid,tronscan").split(",") if n.strip()]
+            _router = ChainRouter(
+                [_PROVIDER_FACTORIES[n]() for n in names if n in _PROVIDER_FACTORIES],
+                failure_threshold=int(os.getenv("CHAIN_PROVIDER_FAILURE_THRESHOLD", "3")),
+                cooldown_seconds=float(os.getenv("CHAIN_PROVIDER_COOLDOWN_SECONDS", "60")),
+            )
+        return _router
@@ -1,6 +1,10 @@
 import sys
 import os
 import json
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from pathlib import Path # Import the modern Path library for robust path handling
 
@@ -13,6 +17,9 @@ load_dotenv(dotenv_path=dotenv_path)
 
 # This must be imported AFTER load_dotenv has run.
 from utils import * 
+from prompts import prompt_2_version
+from ocr_cache import get_ocr_cache
+from ocr_backends import get_ocr_router
 
 # --- Fail loudly if API key is still missing ---
 api_key = os.getenv('GOOGLE_API_KEY')
@@ -26,37 +33,164 @@ EMPTY_RESPONSE = {
     "additional_data": "OCR_FAILED", "image_type": "unknown"
 }
 
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
 def process_file(file_path):
     if not os.path.exists(file_path):
         return {"error": f"File not found at path: {file_path}"}
 
     _, file_extension = os.path.splitext(file_path)
     file_extension = file_extension.lower()
-    
-    raw_response_text = None
+    if file_extension not in IMAGE_EXTENSIONS and file_extension != ".pdf":
+        return EMPTY_RESPONSE
+
+    try:
+        with open(file_path, "rb") as f:
+            file_data = f.read()
+    except Exception as e:
+        return {"error": f"Error reading file: {str(e)}"}
+
+    # --- Duplicate receipts are answered from the cache without calling Gemini ---
+    ocr_cache = get_ocr_cache()
+    cache_key = None
+    if ocr_cache:
+        cache_key = ocr_cache.make_key(
+            file_data, f"{prompt_2_version}+{preprocess_signature()}+{get_ocr_router().signature}", GEMINI_MODEL)
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    json_output = None
     try:
-        if file_extension in [".jpg", ".jpeg", ".png", ".webp"]:
-            with open(file_path, "rb") as image_file:
-                image_data = image_file.read()
-            raw_response_text = gemini_img_ocr(image_data, file_extension)
-        elif file_extension == ".pdf":
-            with open(file_path, "rb") as pdf_file:
-                pdf_data = pdf_file.read()
-            raw_response_text = gemini_pdf_ocr(pdf_data)
+        if file_extension in IMAGE_EXTENSIONS:
+            image_data, mime_type, stats = preprocess_image(file_data)
+            if stats["bytes_out"] != stats["bytes_in"]:
+                print(f"[OCR-PREPROCESS] {os.path.basename(file_path)}: {stats['bytes_in']} -> {stats['bytes_out']} bytes "
+                      f"({stats['size_in']} -> {stats['size_out']}) in {stats['elapsed_ms']}ms", file=sys.stderr)
+            ocr_result = get_ocr_router().extract(image_data, mime_type or image_mime_type(file_extension))
+            json_output = ocr_result.data
+            if json_output and ocr_result.backend != "gemini":
+                json_output["ocr_backend"] = ocr_result.backend
+            if json_output and ocr_result.details.get("template"):
+                json_output["ocr_template"] = ocr_result.details["template"]
+        else:
+            pages = gemini_pdf_ocr_pages(file_data)
+            if len(pages) == 1:
+                json_output = pages[0]
+            else:
+                # Callers expect one receipt: surface the first page with an amount and attach every page.
+                receipts = [page for page in pages if page.get("amount")]
+                json_output = dict(receipts[0] if receipts else pages[0])
+                json_output["pages"] = pages
     except Exception as e:
         return {"error": f"Error reading file: {str(e)}"}
 
-    if raw_response_text:
-        json_output = clean_text_and_load_json(raw_response_text)
-        if json_output:
-            return json_output
+    if json_output:
+        # API failures come back as {"error": ...}, also per page of a PDF; those must be retried, not cached.
+        failed = "error" in json_output or any("error" in page for page in json_output.get("pages", []))
+        if ocr_cache and not failed:
+            ocr_cache.put(cache_key, json_output)
+        return json_output
     
     return EMPTY_RESPONSE
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        file_path_arg = sys.argv[1]
-        response_dict = process_file(file_path_arg)
+def handle_process_file(request):
+    """Server-mode handler for {"op": "process_file", "path": "..."} requests."""
+    file_path = request.get("path")
+    if not file_path:
+        return {"error": "No file path provided"}
+    return process_file(file_path)
+
+def handle_cache_stats(request):
+    ocr_cache = get_ocr_cache()
+    return ocr_cache.stats() if ocr_cache else {"enabled": False}
+
+def collect_batch_inputs(source):
+    """
+    Expands a batch source into file paths: a directory (searched recursively),
+    a manifest (.txt/.lst with one path per line, or .jsonl with a "path" key),
+    or a glob pattern.
+    """
+    supported = tuple(IMAGE_EXTENSIONS + [".pdf"])
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(supported))
+        return sorted(paths)
+    if os.path.isfile(source) and source.lower().endswith((".txt", ".lst", ".jsonl")):
+        paths = []
+        with open(source, "r", encoding="utf-8") as manifest:
+            for line in manifest:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                paths.append(json.loads(line)["path"] if line.startswith("{") else line)
+        return paths
+    return sorted(glob.glob(source, recursive=True))
+
+def run_batch(paths, workers, rate_per_minute):
+    """Runs process_file over `paths` and prints one JSON line per item as it finishes."""
+    from rate_limit import RateLimiter
+    # Every Gemini request (each PDF page, each re-ask) takes a slot; cache and local-backend hits do not.
+    get_gemini_client().rate_limiter = RateLimiter(rate_per_minute)
+
+    def timed(path):
+        started = time.monotonic()
+        result = process_file(path)
+        return result, int((time.monotonic() - started) * 1000)
+
+    started = time.monotonic()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(timed, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result, elapsed_ms = future.result()
+            except Exception as e:
+                result, elapsed_ms = {"error": str(e)}, None
+            if "error" in result:
+                failed += 1
+            print(json.dumps({"path": path, "elapsed_ms": elapsed_ms, "result": result}), flush=True)
+
+    elapsed = time.monotonic() - started
+    print(f"[BATCH] Processed {len(paths)} file(s) in {elapsed:.1f}s, {failed} error(s).", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini OCR for invoice receipts.")
+    parser.add_argument("file_path", nargs="?", help="Receipt image or PDF to process once.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a resident OCR worker speaking newline-delimited JSON.")
+    parser.add_argument("--socket", default=os.getenv("OCR_SOCKET_PATH"),
+                        help="Unix socket path for --serve (default: OCR_SOCKET_PATH, else stdin/stdout).")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("OCR_WORKERS", "4")),
+                        help="Maximum concurrent process_file requests in --serve mode.")
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="Process a directory, glob pattern or manifest file, printing one JSON line per receipt.")
+    parser.add_argument("--rate-per-minute", type=float, default=float(os.getenv("OCR_RATE_PER_MINUTE", "0")),
+                        help="Upper bound on Gemini requests per minute in --batch mode, counting every PDF "
+                             "page and re-ask (0 = unlimited).")
+    parser.add_argument("--cache-stats", action="store_true", help="Print OCR cache counters and exit.")
+    args = parser.parse_args()
+
+    if args.serve:
+        from ndjson_server import serve
+        # Warm the model and the async client before the first request arrives.
+        get_vision_model()
+        get_gemini_client()
+        serve(
+            {"process_file": handle_process_file, "cache_stats": handle_cache_stats},
+            socket_path=args.socket, max_concurrency=args.workers,
+        )
+    elif args.batch:
+        run_batch(collect_batch_inputs(args.batch), args.workers, args.rate_per_minute)
+    elif args.cache_stats:
+        print(json.dumps(handle_cache_stats({}), indent=2))
+    elif args.file_path:
+        response_dict = process_file(args.file_path)
         print(json.dumps(response_dict, indent=2))
     else:
         print(json.dumps({"error": "No file path provided"}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Newline-delimited JSON request server shared by the resident Python workers.
+
+Each request is one JSON object per line, e.g.
+    {"id": 1, "op": "process_file", "path": "/tmp/receipt.jpg"}
+and each response is one JSON object per line carrying the same id:
+    {"id": 1, "ok": true, "result": {...}}
+
+Requests on the same connection are handled concurrently, so responses may
+come back out of order; callers must match them by id.
+"""
+import os
+import sys
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _StdoutWriter:
+    """Minimal StreamWriter stand-in so stdio and socket modes share one code path."""
+
+    def write(self, data: bytes):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def drain(self):
+        return None
+
+    def close(self):
+        return None
+
+
+async def _dispatch(handlers: dict, line: bytes, semaphore: asyncio.Semaphore) -> dict:
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "ok": False, "error": f"Invalid JSON request: {e}"}
+    if not isinstance(request, dict):
+        return {"id": None, "ok": False, "error": "Request must be a JSON object"}
+
+    request_id = request.get("id")
+    op = request.get("op")
+    if op == "ping":
+        return {"id": request_id, "ok": True, "result": "pong"}
+
+    handler = handlers.get(op)
+    if handler is None:
+        return {"id": request_id, "ok": False, "error": f"Unknown op: {op}"}
+
+    async with semaphore:
+        try:
+            result = await asyncio.to_thread(handler, request)
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+    return {"id": request_id, "ok": True, "result": result}
+
+
+async def _handle_stream(reader, writer, handlers: dict, semaphore: asyncio.Semaphore):
+    write_lock = asyncio.Lock()
+    pending = set()
+
+    async def respond(line: bytes):
+        response = await _dispatch(handlers, line, semaphore)
+        async with write_lock:
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.create_task(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        writer.close()
+
+
+async def _serve(handlers: dict, socket_path: str | None, max_concurrency: int):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(
+            lambda r, w: _handle_stream(r, w, handlers, semaphore), path=socket_path
+        )
+        os.chmod(socket_path, 0o660)
+        print(f"[NDJSON-SERVER] Listening on {socket_path} (concurrency={max_concurrency})", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+    else:
+        reader = asyncio.StreamReader(limit=2 ** 20)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        print(f"[NDJSON-SERVER] Serving on stdin/stdout (concurrency={max_concurrency})", file=sys.stderr)
+        await _handle_stream(reader, _StdoutWriter(), handlers, semaphore)
+
+
+def serve(handlers: dict, socket_path: str | None = None, max_concurrency: int = 4):
+    """
+    Runs the request loop until interrupted (socket mode) or stdin closes (stdio mode).
+    `handlers` maps an op name to a blocking callable that takes the request dict
+    and returns a JSON-serializable result; each call runs in a worker thread.
+    """
+    try:
+        asyncio.run(_serve(handlers, socket_path, max(1, int(max_concurrency))))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,193 @@
+"""
+Pluggable OCR backends and the router that picks between them.
+
+Two receipt kinds are supported, matching the two JSON shapes the system uses:
+  - "invoice": the PIX/USDT invoice JSON produced by prompts.prompt_2 (main.py)
+  - "usdt":    the TRC-20 fields used by usdt_validator.py
+
+Routing: when the local engine is available it first reads only a downscaled
+strip from the top of the image and looks for a template anchor there (a
+fraction of a full OCR pass). Without one, the full local pass is skipped,
+since its result could not be accepted anyway. Otherwise the full text is
+matched against the known receipt templates (receipt_templates.py), and the
+local result is accepted only for a recognised layout with confidence of at
+least OCR_LOCAL_MIN_CONFIDENCE and, for invoices, an amount and the printed
+end-to-end id (a synthetic id would change duplicate detection downstream).
+Everything else goes to Gemini, using the template's compact prompt for
+recognised Pix layouts and the full prompt otherwise. Results depend on the
+backends in use, so cache keys include OcrRouter.signature.
+"""
+import os
+import sys
+import threading
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from prompts import usdt_extract_prompt, reask_field_prompt
+from utils import get_gemini_client, gemini_img_ocr
+from receipt_schema import (USDT_RESPONSE_SCHEMA, REASK_RESPONSE_SCHEMA, FIELD_DESCRIPTIONS,
+                            parse_model_json, validate_receipt, set_path)
+from receipt_extractors import extract_pix_fields, extract_usdt_fields, is_printed_transaction_id
+from receipt_templates import TemplateIndex, get_template_index, build_prompt
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # Local OCR is optional; Gemini keeps working without it.
+    pytesseract = None
+
+@dataclass
+class OcrResult:
+    data: dict | None
+    confidence: float
+    backend: str
+    details: dict = field(default_factory=dict)
+
+class OcrBackend:
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    def extract(self, image_data: bytes, mime_type: str, kind: str = "invoice", prompt: str | None = None) -> OcrResult:
+        raise NotImplementedError
+
+class GeminiBackend(OcrBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: str | None = None):
+        self.model_name = model_name
+
+    def extract(self, image_data, mime_type, kind="invoice", prompt=None):
+        if kind == "usdt":
+            response = get_gemini_client().generate(
+                [{"text": usdt_extract_prompt}, {"mime_type": mime_type, "data": image_data}],
+                model_name=self.model_name,
+                generation_config={"temperature": 0.0, "response_mime_type": "application/json",
+                                   "response_schema": USDT_RESPONSE_SCHEMA},
+            )
+            data = parse_model_json(getattr(response, "text", "")) or {}
+        else:
+            # gemini_img_ocr turns API failures into {"error": ...}, which callers already handle.
+            data = parse_model_json(gemini_img_ocr(
+                image_data, None, mime_type=mime_type, model_name=self.model_name, prompt=prompt))
+
+        data, missing = validate_receipt(data, kind)
+        reasked = []
+        for field_name in missing:
+            value = self.reask_field(image_data, mime_type, field_name)
+            if value:
+                set_path(data, field_name, value)
+                reasked.append(field_name)
+        if reasked:
+            data, _ = validate_receipt(data, kind)
+        return OcrResult(data=data, confidence=1.0 if data else 0.0, backend=self.name,
+                         details={"reasked": reasked} if reasked else {})
+
+    def reask_field(self, image_data, mime_type, field_name):
+        """Asks Gemini for a single missing field instead of redoing the whole extraction."""
+        try:
+            response = get_gemini_client().generate(
+                [{"mime_type": mime_type, "data": image_data},
+                 {"text": reask_field_prompt.format(description=FIELD_DESCRIPTIONS.get(field_name, field_name))}],
+                model_name=self.model_name,
+                generation_config={"temperature": 0.0, "response_mime_type": "application/json",
+                                   "response_schema": REASK_RESPONSE_SCHEMA},
+            )
+        except Exception as e:
+            print(f"[OCR-REASK] Could not re-ask for {field_name}: {e}", file=sys.stderr)
+            return None
+        return ((parse_model_json(getattr(response, "text", "")) or {}).get("value") or "").strip() or None
+
+# Share of the image height and width cap used for the template pre-check in TesseractBackend.read_header.
+HEADER_SHARE = 0.25
+HEADER_WIDTH = 800
+
+class TesseractBackend(OcrBackend):
+    """CPU-only OCR via Tesseract followed by the regex field extractors."""
+    name = "local"
+
+    def __init__(self, lang: str | None = None):
+        self.lang = lang or os.getenv('OCR_LOCAL_LANG', 'por+eng')
+        self._available = None
+
+    def available(self) -> bool:
+        if self._available is None:
+            try:
+                self._available = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+            except Exception:  # pytesseract installed but the tesseract binary is missing
+                self._available = False
+        return self._available
+
+    def read_header(self, image_data: bytes) -> str:
+        """Text of the top HEADER_SHARE of the image, downscaled to at most HEADER_WIDTH px wide."""
+        with Image.open(BytesIO(image_data)) as im:
+            header = im.crop((0, 0, im.width, max(1, int(im.height * HEADER_SHARE))))
+            if header.width > HEADER_WIDTH:
+                header = header.resize((HEADER_WIDTH, max(1, header.height * HEADER_WIDTH // header.width)))
+            return pytesseract.image_to_string(header, lang=self.lang)
+
+    def extract(self, image_data, mime_type, kind="invoice", prompt=None):
+        with Image.open(BytesIO(image_data)) as im:
+            text = pytesseract.image_to_string(im, lang=self.lang)
+        extractor = extract_usdt_fields if kind == "usdt" else extract_pix_fields
+        data, confidence = extractor(text)
+        return OcrResult(data=data, confidence=confidence, backend=self.name, details={"text": text})
+
+class OcrRouter:
+    def __init__(self, local: OcrBackend | None, remote: OcrBackend, templates: TemplateIndex | None = None,
+                 min_confidence: float = 0.8):
+        self.local = local if local and local.available() else None
+        self.remote = remote
+        self.templates = templates
+        self.min_confidence = min_confidence
+
+    @property
+    def signature(self) -> str:
+        """Identifies the routing setup for result caches, e.g. "local+gemini@0.8"."""
+        backends = [b.name for b in (self.local, self.remote) if b]
+        return f"{'+'.join(backends)}@{self.min_confidence}"
+
+    def _accepts_local(self, result: OcrResult, kind: str) -> bool:
+        if not result.data or result.confidence < self.min_confidence:
+            return False
+        if kind == "invoice":
+            return bool(result.data.get("amount")) and is_printed_transaction_id(result.data.get("transaction_id"))
+        return True
+
+    def extract(self, image_data: bytes, mime_type: str, kind: str = "invoice") -> OcrResult:
+        match = None
+        if self.local and self.templates and mime_type.startswith("image/"):
+            try:
+                if self.templates.header_candidates(self.local.read_header(image_data)):
+                    result = self.local.extract(image_data, mime_type, kind)
+                    match = self.templates.match_text(result.details.get("text"))
+                if match and self._accepts_local(result, kind):
+                    result.details["template"] = match.name
+                    return result
+            except Exception as e:
+                print(f"[OCR-ROUTER] Local OCR failed, using {self.remote.name}: {e}", file=sys.stderr)
+
+        prompt = build_prompt(match) if kind == "invoice" else None
+        result = self.remote.extract(image_data, mime_type, kind, prompt=prompt)
+        if match:
+            result.details["template"] = match.name
+        return result
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+def get_ocr_router(model_name: str | None = None) -> OcrRouter:
+    """
+    Process-wide router. OCR_BACKENDS lists the engines to use, e.g. "local,gemini"
+    (the default) or "gemini" to disable the local engine.
+    """
+    with _routers_lock:
+        if model_name not in _routers:
+            backends = [b.strip() for b in os.getenv('OCR_BACKENDS', 'local,gemini').split(',')]
+            local = TesseractBackend() if "local" in backends else None
+            _routers[model_name] = OcrRouter(
+                local, GeminiBackend(model_name), get_template_index(),
+                min_confidence=float(os.getenv('OCR_LOCAL_MIN_CONFIDENCE', '0.8')),
+            )
+        return _routers[model_name]
@@ -0,0 +1,125 @@
+"""
+Persistent, content-addressed cache for parsed OCR results.
+
+Entries are keyed by the SHA-256 of the receipt bytes plus the prompt version
+and model name, so re-sent or forwarded receipts skip the Gemini call, while a
+prompt or model change naturally invalidates old results.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / '.cache' / 'ocr_cache.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    cache_key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used_at);
+CREATE TABLE IF NOT EXISTS ocr_cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class OcrCache:
+    def __init__(self, path, max_entries: int = 20000, ttl_seconds: float = 30 * 86400):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # One-shot main.py runs and the resident worker may share the file, hence WAL.
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_key(file_bytes: bytes, prompt_version: str, model_name: str) -> str:
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        return f"{digest}:{prompt_version}:{model_name}"
+
+    def _bump_counter(self, name: str):
+        self._conn.execute(
+            "INSERT INTO ocr_cache_counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM ocr_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute(
+                    "UPDATE ocr_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?", (now, key)
+                )
+                self._bump_counter("hits")
+                self.hits += 1
+                return json.loads(row[0])
+            if row:
+                self._conn.execute("DELETE FROM ocr_cache WHERE cache_key = ?", (key,))
+            self._bump_counter("misses")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (cache_key, result, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, 0)",
+                (key, json.dumps(result), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM ocr_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM ocr_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM ocr_cache ORDER BY last_used_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+            totals = dict(self._conn.execute("SELECT name, value FROM ocr_cache_counters").fetchall())
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "process": {"hits": self.hits, "misses": self.misses},
+            "total": {"hits": totals.get("hits", 0), "misses": totals.get("misses", 0)},
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_ocr_cache() -> OcrCache | None:
+    """Returns the process-wide cache configured from the environment, or None when disabled."""
+    global _cache
+    if os.getenv('OCR_CACHE_ENABLED', '1').strip().lower() in ('0', 'false', 'no'):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = OcrCache(
+                os.getenv('OCR_CACHE_PATH') or DEFAULT_CACHE_PATH,
+                max_entries=int(os.getenv('OCR_CACHE_MAX_ENTRIES', '20000')),
+                ttl_seconds=float(os.getenv('OCR_CACHE_TTL_DAYS', '30')) * 86400,
+            )
+        return _cache
@@ -1,3 +1,5 @@
+import hashlib
+
 prompt_2 = f"""
     You are an expert AI data extractor. Your task is to analyze an invoice image and extract specific fields into a structured JSON format. You must follow all rules precisely.
 
@@ -140,4 +142,50 @@ prompt_2 = f"""
           "image_type": ""
         }}
         ```
-    """
\ No newline at end of file
+    """
+
+usdt_extract_prompt = """
+    You are an invoice OCR/IE agent for USDT TRC-20 receipts. Extract ONLY these fields and return STRICT JSON.
+    {
+      "txid": "string | null (The 64-character transaction hash)",
+      "explorer_url": "string | null (If a URL like tronscan.org/... is present)",
+      "from_address": "string | null (The sender's 'T...' address)",
+      "to_address": "string | null (The recipient's 'T...' address)",
+      "amount": "number | null (The amount of USDT, always positive)",
+      "timestamp": "string | null (The UTC timestamp of the transaction if available, e.g., '2025-11-05 11:47:45')"
+    }
+    """
+
+# Short prompt for receipts whose layout was recognised by receipt_templates.py.
+# Filled with str.format(bank=..., layout_hint=...), hence the doubled braces.
+compact_pix_prompt = """
+    Extract this {bank} Pix receipt into JSON. Layout: {layout_hint}
+    Pre-checks, return every field empty if any applies:
+    - it is not a payment receipt, or it is a "statement of account" (any case) or shows debit and credit entries;
+    - it is mainly handwritten text/numbers or on-hand calculations;
+    - the transfer is scheduled (agendado/agendamento), pending, failed, cancelled or refunded (devolvido), not completed.
+    Rules:
+    - transaction_id: the transaction/E2E id exactly as printed, keeping every zero. If absent, build amount-date(dmy)-time(hms)-sender(first letter).
+    - amount: the main value only (never fees/tarifa/commission), comma thousands, period decimals, always two decimals, e.g. "13,544.00", "357.00".
+    - sender.name: payer name; if missing, the payer institution.
+    - recipient.name: containing "troca coin" or "mks intermediacoes" -> "TROCA COIN NEGÓCIOS DIGITAIS E INTERMEDIAÇÕES LTDA"; "alfa trust" -> "ALFA TRUST INTERMEDIACAO DE NEGOCIOS LTDA"; "upgrade zone", or recipient institution "CARTOS SCD S.A." -> "UPGRADE ZONE SERVICOS E COMERCIO DE EQUIPAMENTOS LTDA". Drop a trailing "...".
+    - image_type: screenshot, replay (photo of a screen), live (photo of paper) or others.
+    - Use "" for anything not visible. Never guess.
+    Return only:
+    {{"transaction_id": "", "transaction_number": "", "payment_method": "Pix", "invoice_date": "", "invoice_time": "", "amount": "", "currency": "R$", "sender": {{"name": "", "cnpj/cpf": "", "institution": "", "institution_cnpj": ""}}, "recipient": {{"name": "", "cnpj/cpf": "", "institution": "", "pix_key": ""}}, "additional_data": "", "image_type": ""}}
+    """
+
+# Follow-up when a required field came back empty; filled with str.format(description=...).
+reask_field_prompt = """
+    Look at this receipt again and find only the {description}.
+    Return JSON {{"value": "..."}} with the value exactly as printed, or {{"value": ""}} if it is not visible. Never guess.
+    """
+
+# Candidates compared by bench_prompts.py; "full" is what production sends for unknown layouts.
+PROMPT_VARIANTS = {
+    "full": prompt_2,
+    "compact": compact_pix_prompt.format(bank="banking app", layout_hint="any Pix receipt layout."),
+}
+
+# Changes automatically whenever prompt_2 or compact_pix_prompt is edited; keys cached OCR results.
+prompt_2_version = hashlib.sha256((prompt_2 + compact_pix_prompt).encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,32 @@
+import time
+import threading
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls evenly to at most `rate_per_minute`.
+    Each acquire() reserves the next free slot and sleeps until it arrives,
+    so concurrent workers share one budget instead of bursting.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute and rate_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reserves the next free slot without waiting; returns the seconds until it arrives."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        return slot - now
+
+    def acquire(self) -> float:
+        """Blocks until the caller may proceed; returns the seconds spent waiting."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
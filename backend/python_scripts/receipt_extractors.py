@@ -0,0 +1,211 @@
+"""
+Deterministic field extractors that turn plain receipt text (from a local OCR
+engine) into the same JSON shapes the Gemini prompts produce.
+
+Each extractor returns (fields, confidence), where confidence is the weighted
+share of the important fields that were found; the OCR router uses it to
+decide whether the local result is good enough or Gemini must be asked.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from tron_address import is_valid_tron_address
+
+_PT_MONTHS = {
+    "jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+    "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12,
+}
+
+_AMOUNT_RE = re.compile(r"R\$\s*(-?\s*[\d.,]+\d)")
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_WORD_DATE_RE = re.compile(r"\b(\d{1,2})\s+(?:de\s+)?([a-zç]{3})[a-zç]*\.?\s+(?:de\s+)?(\d{4})\b", re.IGNORECASE)
+_TIME_RE = re.compile(r"\b(\d{2}):(\d{2})(?::(\d{2}))?\b")
+_E2E_ID_RE = re.compile(r"\b(E\d{20}[A-Za-z0-9]{11})\b")
+_PIX_KEY_RE = re.compile(r"chave(?:\s+pix)?\s*:?\s*(.+)", re.IGNORECASE)
+_FEE_RE = re.compile(r"tarifa|taxa|fee|comiss", re.IGNORECASE)
+
+_TXID_RE = re.compile(r"\b([0-9a-fA-F]{64})\b")
+_TRON_ADDRESS_RE = re.compile(r"\b(T[1-9A-HJ-NP-Za-km-z]{33})\b")
+_USDT_AMOUNT_RE = re.compile(r"(-?[\d.,]*\d)\s*USDT|USDT\s*(-?[\d.,]*\d)", re.IGNORECASE)
+_UTC_TIMESTAMP_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})\b")
+
+_SENDER_LABELS = ("de", "origem", "pagador", "dados do pagador", "quem pagou", "remetente", "conta de origem")
+_RECIPIENT_LABELS = ("para", "destino", "recebedor", "dados do recebedor", "quem recebeu", "favorecido",
+                     "destinatário", "destinatario", "conta de destino")
+_USDT_FROM_LABELS = ("from", "de", "sender", "remitente", "origen")
+_USDT_TO_LABELS = ("to", "para", "recipient", "receiver", "destino", "dirección", "direccion")
+
+_PIX_WEIGHTS = {"amount": 0.35, "recipient": 0.25, "transaction_id": 0.2, "sender": 0.1, "invoice_date": 0.1}
+_USDT_WEIGHTS = {"amount": 0.4, "to_address": 0.4, "txid": 0.2}
+
+def format_brl_amount(raw: str) -> str:
+    """'13.544,00' -> '13,544.00'; returns '' when the value cannot be parsed."""
+    cleaned = re.sub(r"[^\d,.]", "", raw or "")
+    if not cleaned:
+        return ""
+    last_sep = max(cleaned.rfind(","), cleaned.rfind("."))
+    if last_sep != -1 and len(cleaned) - last_sep - 1 in (1, 2):
+        integer, decimals = cleaned[:last_sep], cleaned[last_sep + 1:]
+    else:
+        integer, decimals = cleaned, "0"
+    try:
+        value = Decimal(re.sub(r"[,.]", "", integer) or "0") + Decimal(f"0.{decimals}")
+    except InvalidOperation:
+        return ""
+    return f"{value:,.2f}"
+
+def apply_recipient_rules(name: str, institution: str = "") -> str:
+    """Same canonical recipient names the Gemini prompt enforces."""
+    lowered = (name or "").lower()
+    if (institution or "").strip().lower() == "cartos scd s.a.":
+        return "UPGRADE ZONE SERVICOS E COMERCIO DE EQUIPAMENTOS LTDA"
+    if "troca coin" in lowered or "mks intermediacoes" in lowered:
+        return "TROCA COIN NEGÓCIOS DIGITAIS E INTERMEDIAÇÕES LTDA"
+    if "alfa trust" in lowered:
+        return "ALFA TRUST INTERMEDIACAO DE NEGOCIOS LTDA"
+    if "upgrade zone" in lowered:
+        return "UPGRADE ZONE SERVICOS E COMERCIO DE EQUIPAMENTOS LTDA"
+    name = (name or "").strip()
+    if name.endswith("..."):
+        name = name[:-3].strip()
+    return name
+
+def _lines(text: str) -> list[str]:
+    return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+def _label_value(line: str, labels) -> str | None:
+    """Returns the text after 'Label:' (possibly empty) when the line starts with one of the labels."""
+    lowered = line.lower()
+    for label in labels:
+        if lowered == label or lowered.startswith((label + ":", label + " ")):
+            return line[len(label):].lstrip(" :").strip()
+    return None
+
+def _section(lines: list[str], labels, size: int = 6) -> list[str]:
+    for i, line in enumerate(lines):
+        value = _label_value(line, labels)
+        if value is not None:
+            return ([value] if value else []) + lines[i + 1:i + 1 + size]
+    return []
+
+def _party(section: list[str]) -> tuple[str, str]:
+    """Picks (name, institution) out of the lines that follow a party header."""
+    name = institution = ""
+    for line in section:
+        nome = _label_value(line, ("nome",))
+        inst = _label_value(line, ("instituição", "instituicao", "banco"))
+        if nome:
+            name = name or nome
+        elif inst:
+            institution = institution or inst
+        elif not name and re.fullmatch(r"[A-Za-zÀ-ÿ.&' ]{5,}", line) and " " in line:
+            name = line
+    return name, institution
+
+def is_printed_transaction_id(value: str | None) -> bool:
+    """True for a Pix end-to-end id as printed on receipts, False for the synthetic fallback id."""
+    return bool(_E2E_ID_RE.fullmatch(value or ""))
+
+def extract_pix_fields(text: str) -> tuple[dict, float]:
+    lines = _lines(text)
+    found = {}
+
+    amount = ""
+    for line in lines:
+        match = _AMOUNT_RE.search(line)
+        if match and not _FEE_RE.search(line):
+            amount = format_brl_amount(match.group(1))
+            if line.lower().startswith("valor"):
+                break
+    found["amount"] = bool(amount)
+
+    invoice_date = ""
+    date_match = _NUMERIC_DATE_RE.search(text or "")
+    if date_match:
+        invoice_date = "/".join(date_match.groups())
+    else:
+        word_match = _WORD_DATE_RE.search(text or "")
+        if word_match and word_match.group(2).lower()[:3] in _PT_MONTHS:
+            month = _PT_MONTHS[word_match.group(2).lower()[:3]]
+            invoice_date = f"{int(word_match.group(1)):02d}/{month:02d}/{word_match.group(3)}"
+    found["invoice_date"] = bool(invoice_date)
+
+    time_match = _TIME_RE.search(text or "")
+    invoice_time = ""
+    if time_match:
+        invoice_time = f"{time_match.group(1)}:{time_match.group(2)}:{time_match.group(3) or '00'}"
+
+    sender_name, sender_institution = _party(_section(lines, _SENDER_LABELS))
+    recipient_name, recipient_institution = _party(_section(lines, _RECIPIENT_LABELS))
+    sender_name = sender_name or sender_institution
+    recipient_name = apply_recipient_rules(recipient_name, recipient_institution)
+    found["sender"] = bool(sender_name)
+    found["recipient"] = bool(recipient_name)
+
+    pix_key = ""
+    for line in lines:
+        key_match = _PIX_KEY_RE.match(line)
+        if key_match:
+            pix_key = key_match.group(1).strip()
+            break
+
+    e2e_match = _E2E_ID_RE.search(text or "")
+    transaction_id = e2e_match.group(1) if e2e_match else ""
+    found["transaction_id"] = bool(transaction_id)
+    if not transaction_id and amount and invoice_date:
+        # Same fallback id the Gemini prompt builds: amount-date(dmy)-time(hms)-sender initial.
+        transaction_id = f"{amount}-{invoice_date.replace('/', '')}-{invoice_time.replace(':', '')}-{sender_name[:1]}"
+
+    fields = {
+        "transaction_id": transaction_id, "transaction_number": "", "payment_method": "Pix",
+        "invoice_date": invoice_date, "invoice_time": invoice_time, "amount": amount, "currency": "R$",
+        "sender": {"name": sender_name, "cnpj/cpf": "", "institution": sender_institution, "institution_cnpj": ""},
+        "recipient": {"name": recipient_name, "cnpj/cpf": "", "institution": recipient_institution, "pix_key": pix_key},
+        "additional_data": "", "image_type": "screenshot",
+    }
+    confidence = sum(weight for field, weight in _PIX_WEIGHTS.items() if found.get(field))
+    return fields, round(confidence, 2)
+
+def _labelled_address(lines: list[str], labels) -> str | None:
+    for i, line in enumerate(lines):
+        if _label_value(line, labels) is None:
+            continue
+        for candidate in lines[i:i + 2]:
+            match = _TRON_ADDRESS_RE.search(candidate)
+            if match:
+                return match.group(1)
+    return None
+
+def extract_usdt_fields(text: str) -> tuple[dict, float]:
+    lines = _lines(text)
+    addresses = _TRON_ADDRESS_RE.findall(text or "")
+    from_address = _labelled_address(lines, _USDT_FROM_LABELS)
+    to_address = _labelled_address(lines, _USDT_TO_LABELS)
+    if not to_address and len(set(addresses)) == 1:
+        to_address = addresses[0]
+    # A misread character breaks the checksum; leave the field empty so the router asks Gemini.
+    from_address = from_address if is_valid_tron_address(from_address) else None
+    to_address = to_address if is_valid_tron_address(to_address) else None
+
+    amount = None
+    amount_match = _USDT_AMOUNT_RE.search(text or "")
+    if amount_match:
+        raw = (amount_match.group(1) or amount_match.group(2)).lstrip("-").replace(",", "")
+        try:
+            amount = float(raw)
+        except ValueError:
+            amount = None
+
+    txid_match = _TXID_RE.search(text or "")
+    ts_match = _UTC_TIMESTAMP_RE.search(text or "")
+    fields = {
+        "txid": txid_match.group(1) if txid_match else None,
+        "explorer_url": None,
+        "from_address": from_address,
+        "to_address": to_address,
+        "amount": amount,
+        "timestamp": f"{ts_match.group(1)} {ts_match.group(2)}" if ts_match else None,
+    }
+    found = {"amount": amount is not None and amount > 0, "to_address": bool(to_address), "txid": bool(fields["txid"])}
+    confidence = sum(weight for field, weight in _USDT_WEIGHTS.items() if found[field])
+    return fields, round(confidence, 2)
@@ -0,0 +1,181 @@
+"""
+Typed receipt schemas and the single validator for OCR responses.
+
+The schemas are sent to Gemini as `response_schema`, so the model returns
+well-formed JSON of the expected shape. validate_receipt() then normalizes
+amounts, dates and transaction ids in one pass and reports the required
+fields that are still missing, so only those need to be re-asked.
+"""
+import re
+import json
+
+from receipt_extractors import format_brl_amount
+
+_STRING = {"type": "string"}
+
+INVOICE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "transaction_id": _STRING,
+        "transaction_number": _STRING,
+        "payment_method": _STRING,
+        "invoice_date": _STRING,
+        "invoice_time": _STRING,
+        "amount": _STRING,
+        "currency": _STRING,
+        "sender": {
+            "type": "object",
+            "properties": {"name": _STRING, "cnpj/cpf": _STRING, "institution": _STRING,
+                           "institution_cnpj": _STRING, "wallet_address": _STRING},
+        },
+        "recipient": {
+            "type": "object",
+            "properties": {"name": _STRING, "cnpj/cpf": _STRING, "institution": _STRING,
+                           "pix_key": _STRING, "wallet_address": _STRING},
+        },
+        "additional_data": _STRING,
+        "image_type": _STRING,
+    },
+}
+
+USDT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "txid": {"type": "string", "nullable": True},
+        "explorer_url": {"type": "string", "nullable": True},
+        "from_address": {"type": "string", "nullable": True},
+        "to_address": {"type": "string", "nullable": True},
+        "amount": {"type": "number", "nullable": True},
+        "timestamp": {"type": "string", "nullable": True},
+    },
+}
+
+REASK_RESPONSE_SCHEMA = {"type": "object", "properties": {"value": _STRING}}
+
+# What to ask for when a required field comes back empty.
+FIELD_DESCRIPTIONS = {
+    "amount": "main transaction amount (not fees or commissions)",
+    "recipient.name": "full name of the recipient (payee)",
+    "to_address": "recipient's TRON wallet address starting with 'T'",
+}
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_DATE_DMY_RE = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$")
+_DATE_YMD_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_HEX64_RE = re.compile(r"[0-9a-fA-F]{64}")
+_TXID_URL_RE = re.compile(r"/transaction/([0-9a-fA-F]{64})")
+
+def parse_model_json(text: str | None) -> dict | None:
+    """Parses the JSON object in a model reply, tolerating ```json fences and surrounding prose."""
+    text = _FENCE_RE.sub("", (text or "").strip())
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            value = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+    return value if isinstance(value, dict) else None
+
+def get_path(data: dict, dotted_key: str):
+    value = data
+    for part in dotted_key.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def set_path(data: dict, dotted_key: str, value):
+    parts = dotted_key.split(".")
+    target = data
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+def _normalize_date(value: str) -> str:
+    value = value.strip()
+    match = _DATE_DMY_RE.match(value)
+    if match:
+        return f"{int(match.group(1)):02d}/{int(match.group(2)):02d}/{match.group(3)}"
+    match = _DATE_YMD_RE.match(value)
+    if match:
+        return f"{int(match.group(3)):02d}/{int(match.group(2)):02d}/{match.group(1)}"
+    return value
+
+def _normalize_time(value: str) -> str:
+    match = _TIME_RE.match(value.strip())
+    if not match:
+        return value.strip()
+    return f"{int(match.group(1)):02d}:{match.group(2)}:{match.group(3) or '00'}"
+
+def _plain_amount(value) -> str:
+    """USDT amounts: positive, no thousands separators, period decimals."""
+    cleaned = str(value).replace(",", "").replace(" ", "").lstrip("-")
+    try:
+        float(cleaned)
+    except ValueError:
+        return ""
+    return cleaned
+
+def _is_receipt_like(data: dict) -> bool:
+    if (data.get("image_type") or "").lower() == "others":
+        return False
+    return any(get_path(data, key) for key in ("transaction_id", "amount", "sender.name", "recipient.name",
+                                                "recipient.pix_key"))
+
+def validate_invoice(data: dict) -> tuple[dict, list[str]]:
+    is_usdt = (data.get("currency") or "").upper() == "USDT" or \
+        (get_path(data, "recipient.name") or "") == "USDT_RECIPIENT"
+
+    txid = _WHITESPACE_RE.sub("", str(data.get("transaction_id") or ""))
+    # Legacy rule: the model confuses the letter O with zero in ids.
+    data["transaction_id"] = txid.replace("O", "0")
+
+    amount = data.get("amount")
+    if amount not in (None, ""):
+        data["amount"] = _plain_amount(amount) if is_usdt else format_brl_amount(str(amount))
+    if data.get("invoice_date"):
+        data["invoice_date"] = _normalize_date(str(data["invoice_date"]))
+    if data.get("invoice_time"):
+        data["invoice_time"] = _normalize_time(str(data["invoice_time"]))
+    for party in ("sender", "recipient"):
+        if isinstance(data.get(party), dict) and data[party].get("wallet_address"):
+            data[party]["wallet_address"] = _WHITESPACE_RE.sub("", data[party]["wallet_address"])
+
+    missing = []
+    if _is_receipt_like(data):
+        if not data.get("amount"):
+            missing.append("amount")
+        if not get_path(data, "recipient.name") and not get_path(data, "recipient.pix_key"):
+            missing.append("recipient.name")
+    return data, missing
+
+def validate_usdt(data: dict) -> tuple[dict, list[str]]:
+    txid = _WHITESPACE_RE.sub("", str(data.get("txid") or ""))
+    if not _HEX64_RE.fullmatch(txid):
+        url_match = _TXID_URL_RE.search(data.get("explorer_url") or "")
+        txid = url_match.group(1) if url_match else ""
+    data["txid"] = txid or None
+
+    for key in ("from_address", "to_address"):
+        data[key] = _WHITESPACE_RE.sub("", str(data.get(key) or "")) or None
+
+    amount = _plain_amount(data.get("amount")) if data.get("amount") not in (None, "") else ""
+    data["amount"] = float(amount) if amount else None
+
+    missing = []
+    if data["amount"] or data["to_address"] or data["txid"]:
+        if not data["amount"]:
+            missing.append("amount")
+        if not data["to_address"]:
+            missing.append("to_address")
+    return data, missing
+
+def validate_receipt(data: dict | None, kind: str = "invoice") -> tuple[dict | None, list[str]]:
+    """Normalizes a parsed OCR response in place; returns (data, missing_required_fields)."""
+    if not isinstance(data, dict) or "error" in data:
+        return data, []
+    return validate_usdt(data) if kind == "usdt" else validate_invoice(data)
@@ -0,0 +1,117 @@
+"""
+Layout recognition for recurring bank receipt templates.
+
+Known layouts live in receipt_templates.json. A receipt matches a template
+when, in its local OCR text, one of the template's anchors (the bank or app
+name) appears in the header lines and every one of its field labels appears
+anywhere. Anchors alone are not enough: bank names also show up in the
+payer/payee institution lines of other banks' receipts. Short labels such as
+"de" or "para" occur in nearly every receipt, so each template needs at least
+MIN_DISTINCT_LABELS distinctive ones (several words, or one long word).
+Matched templates
+get a compact per-template prompt or the deterministic extractor; unknown
+layouts keep the full prompt.
+
+    python receipt_templates.py receipt_text.txt
+"""
+import os
+import re
+import sys
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from prompts import compact_pix_prompt
+
+TEMPLATES_PATH = Path(__file__).resolve().parent / 'receipt_templates.json'
+# Non-empty lines treated as the receipt header (logo/title area) when looking for anchors.
+HEADER_LINES = 6
+# Distinctive labels each template must require, and what makes a label distinctive.
+MIN_DISTINCT_LABELS = 2
+DISTINCT_LABEL_MIN_WORDS = 2
+DISTINCT_LABEL_MIN_LENGTH = 8
+
+@dataclass
+class TemplateMatch:
+    template: dict
+    method: str
+
+    @property
+    def name(self) -> str:
+        return self.template["name"]
+
+def _phrase_pattern(phrases) -> re.Pattern | None:
+    """Whole-word, case-insensitive match of any of the phrases."""
+    if not phrases:
+        return None
+    return re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b", re.IGNORECASE)
+
+def is_distinctive_label(label: str) -> bool:
+    words = re.findall(r"\w+", label)
+    return len(words) >= DISTINCT_LABEL_MIN_WORDS or len(label) >= DISTINCT_LABEL_MIN_LENGTH
+
+def header_text(text: str | None) -> str:
+    lines = [line for line in (text or "").splitlines() if line.strip()]
+    return "\n".join(lines[:HEADER_LINES])
+
+class TemplateIndex:
+    def __init__(self, path=TEMPLATES_PATH):
+        self.path = Path(path)
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.templates = json.load(f)["templates"]
+        for template in self.templates:
+            if sum(map(is_distinctive_label, template.get("labels", []))) < MIN_DISTINCT_LABELS:
+                raise ValueError(f"Template {template.get('name')!r} needs at least {MIN_DISTINCT_LABELS} "
+                                 f"distinctive labels in {self.path}")
+        self._patterns = [
+            (t, _phrase_pattern(t.get("anchors", [])), [_phrase_pattern([label]) for label in t.get("labels", [])])
+            for t in self.templates
+        ]
+
+    def header_candidates(self, header: str | None) -> list[dict]:
+        """Templates whose anchor appears in a receipt header (e.g. OCR of the top of the image)."""
+        if not header:
+            return []
+        return [template for template, anchors, _ in self._patterns if anchors is not None and anchors.search(header)]
+
+    def match_text(self, text: str | None) -> TemplateMatch | None:
+        if not text:
+            return None
+        header = header_text(text)
+        for template, anchors, labels in self._patterns:
+            if anchors is None or not anchors.search(header):
+                continue
+            if all(label.search(text) for label in labels):
+                return TemplateMatch(template, "anchor")
+        return None
+
+def build_prompt(match: TemplateMatch | None) -> str | None:
+    """Compact prompt for known Pix layouts; None means use the full prompt_2."""
+    if match is None or match.template.get("kind") != "pix":
+        return None
+    return compact_pix_prompt.format(bank=match.template["bank"], layout_hint=match.template.get("layout_hint", ""))
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_template_index() -> TemplateIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TemplateIndex(os.getenv('OCR_TEMPLATES_PATH') or TEMPLATES_PATH)
+        return _index
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: receipt_templates.py <ocr_text_file>...")
+        return 1
+    index = get_template_index()
+    for path in sys.argv[1:]:
+        with open(path, "r", encoding="utf-8") as f:
+            match = index.match_text(f.read())
+        print(json.dumps({"path": path, "template": match.name if match else None}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
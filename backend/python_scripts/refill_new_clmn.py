@@ -1,8 +1,8 @@
 import os
-import re
 from pathlib import Path
 from dotenv import load_dotenv
 import mysql.connector
+from telegram_parsing import normalize_name as shared_normalize_name
 
 # --- Load Environment Variables ---
 # Ensures we connect to the correct database
@@ -28,17 +28,12 @@ def get_db_connection():
 
 def normalize_name(raw_name):
     """
-    The exact same normalization logic from the listener.
-    Removes numbers, common business suffixes, and extra whitespace.
+    The exact same normalization logic from the listener (telegram_parsing.normalize_name).
+    Returns None for an empty name so the row is skipped.
     """
     if not raw_name:
         return None
-    # Remove all numbers, punctuation (except spaces), and common suffixes
-    normalized = re.sub(r'[\d.,-]', '', raw_name)
-    normalized = re.sub(r'\b(ltda|me|sa|eireli|epp)\b', '', normalized, flags=re.IGNORECASE)
-    # Collapse multiple spaces into one and trim
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
-    return normalized.lower()
+    return shared_normalize_name(raw_name)
 
 def main():
     """Main execution function to backfill the data."""
@@ -0,0 +1,146 @@
+"""
+Fuzzy sender matching over normalized payer names (telegram_parsing.normalize_name,
+the same normalization stored in sender_name_normalized).
+
+OCR misreads a letter or two of a payer name often enough that exact or
+substring comparison sends valid receipts to manual review. Names are compared
+by trigram similarity (Dice coefficient over pg_trgm-style word trigrams). A
+name containing the searched name as whole words scores at least
+CONTAINS_SCORE, but only for queries of CONTAINS_MIN_LENGTH characters or
+more: a bare "silva" is contained in far too many unrelated names.
+
+Candidates come from a persisted trigram index, telegram_sender_trigrams
+(trigram, sender_name_normalized), which telegram_store fills with every batch
+it writes. A name can only reach a Dice score m if it shares at least
+min_shared_trigrams(query, m) trigrams with the query, so the candidate query
+keeps the names that do (one GROUP BY over the query's trigrams) and joins
+them to the amount bucket (amount +/- tolerance) served by
+idx_telegram_tx_match. Only those rows are scored in Python: rank_candidates
+keeps the best row per distinct name and returns the top k, and
+confident_match only accepts the best name when it clears the minimum score
+and leads the next name by a margin. See bench_sender_matcher.py.
+
+Rows stored before the index existed are added with:
+    python sender_matcher.py backfill
+"""
+import os
+import sys
+import math
+import heapq
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
+
+from telegram_parsing import normalize_name
+
+CONTAINS_SCORE = 0.9
+CONTAINS_MIN_LENGTH = 8
+DEFAULT_MIN_SCORE = 0.7
+DEFAULT_MARGIN = 0.1
+
+class SenderMatch(NamedTuple):
+    row_id: int
+    sender_name: str
+    amount: Decimal
+    score: float
+
+@lru_cache(maxsize=65536)
+def trigrams(normalized_name: str) -> frozenset:
+    """Word trigrams padded like pg_trgm: 'ana' -> {'  a', ' an', 'ana', 'na '}."""
+    grams = set()
+    for word in normalized_name.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+def min_shared_trigrams(query: str, min_score: float) -> int:
+    """Fewest trigrams a name must share with the query to score min_score (Dice, or the containment bonus)."""
+    # Dice = 2s / (|q| + |n|) >= m with |n| >= s needs s >= m * |q| / (2 - m); a containing name shares all of |q|.
+    count = len(trigrams(query))
+    return max(1, min(count, math.ceil(max(0.0, min_score) * count / (2 - max(0.0, min_score)) - 1e-9)))
+
+def similarity(query: str, name: str) -> float:
+    """Both arguments already normalized; 1.0 for identical names."""
+    if not query or not name:
+        return 0.0
+    if query == name:
+        return 1.0
+    score = _dice(trigrams(query), trigrams(name))
+    if len(query) >= CONTAINS_MIN_LENGTH and f" {query} " in f" {name} ":
+        return max(CONTAINS_SCORE, score)
+    return score
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+def rank_candidates(candidates, sender: str, k: int = 5, min_score: float = 0.0) -> list[SenderMatch]:
+    """
+    candidates: (row_id, sender_name_normalized, amount) tuples, preferred rows first.
+    Best k distinct names scoring at least min_score, each with its first row.
+    """
+    query = normalize_name(sender)
+    first_rows = {}
+    for row_id, name, amount in candidates:
+        first_rows.setdefault(name or "", (row_id, amount))
+    scored = ((similarity(query, name), name) for name in first_rows)
+    best = heapq.nlargest(k, (item for item in scored if item[0] >= min_score), key=lambda item: item[0])
+    return [SenderMatch(first_rows[name][0], name, Decimal(str(first_rows[name][1])), round(score, 3))
+            for score, name in best]
+
+def confident_match(ranked: list[SenderMatch], min_score: float = DEFAULT_MIN_SCORE,
+                    margin: float = DEFAULT_MARGIN) -> SenderMatch | None:
+    """The best of rank_candidates' output, or None when it is below min_score or the runner-up is within margin."""
+    if not ranked or ranked[0].score < min_score:
+        return None
+    if len(ranked) > 1 and ranked[0].score - ranked[1].score < margin:
+        return None
+    return ranked[0]
+
+# --- Persisted trigram index ---
+SAVE_TRIGRAMS_SQL = "INSERT IGNORE INTO telegram_sender_trigrams (trigram, sender_name_normalized) VALUES {values}"
+
+def save_name_trigrams(cursor, names, chunk_size: int = 1000):
+    """Adds names (normalized) to telegram_sender_trigrams; names already indexed are ignored."""
+    pairs = [(gram, name) for name in set(names) if name for gram in trigrams(name)]
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        cursor.execute(SAVE_TRIGRAMS_SQL.format(values=", ".join(["(%s, %s)"] * len(chunk))),
+                       [value for pair in chunk for value in pair])
+
+def backfill(conn, batch_size: int = 5000) -> int:
+    """Indexes every distinct sender_name_normalized of telegram_transactions; returns the number of names."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT sender_name_normalized FROM telegram_transactions")
+        names = [row[0] for row in cursor.fetchall()]
+        for start in range(0, len(names), batch_size):
+            save_name_trigrams(cursor, names[start:start + batch_size])
+            conn.commit()
+            print(f"[SENDER-TRIGRAMS] Indexed {min(start + batch_size, len(names))}/{len(names)} names...",
+                  file=sys.stderr)
+    finally:
+        cursor.close()
+    return len(names)
+
+def main():
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: sender_matcher.py backfill")
+        return 1
+    from pathlib import Path
+    from dotenv import load_dotenv
+    import mysql.connector
+    load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'), database=os.getenv('DB_DATABASE'),
+    )
+    try:
+        print(f"[SENDER-TRIGRAMS] Done: {backfill(conn)} names indexed.")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,16 @@
 import sys
 import os
 import json
-import re
 from pathlib import Path
 from dotenv import load_dotenv
 from telethon.sync import TelegramClient
 from telethon.sessions import StringSession
 import asyncio
+from decimal import Decimal
+import mysql.connector
+from telegram_parsing import extract_fields, normalize_name, parse_brl_amount
+from telegram_store import LISTENER_HEARTBEAT
+from sender_matcher import confident_match, min_shared_trigrams, rank_candidates, trigrams
 
 # --- Load Environment Variables ---
 script_dir = Path(__file__).resolve().parent
@@ -21,52 +25,141 @@ API_HASH = os.getenv('TELEGRAM_API_HASH')
 SESSION_STRING = os.getenv('TELEGRAM_SESSION_STRING')
 TARGET_GROUP_ID = os.getenv('TELEGRAM_TARGET_GROUP_ID')
 
-# --- Helper Functions (Unchanged) ---
-def parse_brl_amount(amount_str):
-    try:
-        cleaned_str = re.sub(r'[^\d,.]', '', amount_str).strip()
-        if ',' in cleaned_str and '.' in cleaned_str and cleaned_str.rfind('.') < cleaned_str.rfind(','):
-            cleaned_str = cleaned_str.replace(".", "").replace(",", ".")
-        else:
-            cleaned_str = cleaned_str.replace(",", ".")
-        return float(cleaned_str)
-    except (ValueError, TypeError):
-        return 0.0
+# --- Lookup Configuration ---
+# auto: answer from telegram_transactions while the listener heartbeat is fresh, else scan Telegram
+# db: always answer from telegram_transactions; live: always scan the last 50 Telegram messages
+CHECKER_MODE = os.getenv('TELEGRAM_CHECKER_MODE', 'auto')
+HEARTBEAT_STALE_SECONDS = int(os.getenv('TELEGRAM_HEARTBEAT_STALE_SECONDS', '180'))
+WINDOW_HOURS = int(os.getenv('TELEGRAM_CHECKER_WINDOW_HOURS', '168'))
+# Names scoring at least this trigram similarity (sender_matcher) match despite OCR typos; 1 disables it.
+# The best name must also lead the next differently named candidate by FUZZY_MARGIN.
+FUZZY_MIN_SCORE = float(os.getenv('TELEGRAM_CHECKER_FUZZY_MIN_SCORE', '0.7'))
+FUZZY_MARGIN = float(os.getenv('TELEGRAM_CHECKER_FUZZY_MARGIN', '0.1'))
+AMOUNT_TOLERANCE = Decimal(os.getenv('TELEGRAM_CHECKER_AMOUNT_TOLERANCE', '0'))
+# Most fuzzy candidate rows scored per lookup; hitting it is logged, as the true match may be cut off.
+FUZZY_CANDIDATE_LIMIT = int(os.getenv('TELEGRAM_CHECKER_FUZZY_CANDIDATE_LIMIT', '5000'))
 
+# --- Helper Functions ---
 def find_match(messages, target_amount, target_sender):
     target_sender_lower = target_sender.lower().strip()
-    amount_regex = re.compile(r"Amount:\s*R\$\s*([\d.,]+)")
-    sender_block_regex = re.compile(r"Sender Information:\s*-+\s*(.+?)(?=\n\n|\Z)", re.DOTALL)
-    sender_name_regex = re.compile(r"Name:\s*([^\n]+)")
+    if not target_sender_lower:
+        return False
+    candidates = []
 
     for message in messages:
         if not message or not message.text:
             continue
-        text = message.text
-        amount_match = amount_regex.search(text)
-        sender_block_match = sender_block_regex.search(text)
-        if not (amount_match and sender_block_match):
+        fields = extract_fields(message.text)
+        if not (fields.amount and fields.sender_name is not None):
             continue
-        sender_block_text = sender_block_match.group(1)
-        sender_name_match = sender_name_regex.search(sender_block_text)
-        if sender_name_match:
-            try:
-                msg_amount_str = amount_match.group(1)
-                msg_sender_name = sender_name_match.group(1).strip()
-                msg_amount_float = parse_brl_amount(msg_amount_str)
-                msg_sender_lower = msg_sender_name.lower()
-                if msg_amount_float == target_amount and target_sender_lower in msg_sender_lower:
-                    return True
-            except Exception:
+        try:
+            if abs(Decimal(str(parse_brl_amount(fields.amount))) - Decimal(str(target_amount))) > AMOUNT_TOLERANCE:
                 continue
-    return False
+            if target_sender_lower in fields.sender_name.lower():
+                return True
+            candidates.append((message.id, normalize_name(fields.sender_name), parse_brl_amount(fields.amount)))
+        except Exception:
+            continue
+    return confident_match(rank_candidates(candidates, target_sender, k=2), FUZZY_MIN_SCORE, FUZZY_MARGIN) is not None
+
+# --- Database Lookup ---
+# Only unused transactions of TARGET_GROUP_ID count, as in the live scan of that group.
+# All use idx_telegram_tx_match (channel_id, is_used, amount, sender_name_normalized,
+# transaction_date): the exact query as a full index range, the fallbacks on the amount prefix.
+EXACT_MATCH_SQL = """
+    SELECT id FROM telegram_transactions
+    WHERE channel_id = %s AND is_used = 0 AND amount = %s AND sender_name_normalized = %s
+      AND transaction_date >= NOW() - INTERVAL %s HOUR
+    LIMIT 1
+"""
+CONTAINS_MATCH_SQL = """
+    SELECT id FROM telegram_transactions
+    WHERE channel_id = %s AND is_used = 0 AND amount = %s AND transaction_date >= NOW() - INTERVAL %s HOUR
+      AND sender_name_normalized LIKE %s
+    LIMIT 1
+"""
+# Fuzzy fallback: names sharing enough trigrams with the sender (telegram_sender_trigrams), joined to the
+# amount bucket, newest first; only these rows are scored in Python by sender_matcher.
+FUZZY_CANDIDATES_SQL = """
+    SELECT t.id, t.sender_name_normalized, t.amount
+    FROM (
+        SELECT sender_name_normalized FROM telegram_sender_trigrams
+        WHERE trigram IN ({trigrams})
+        GROUP BY sender_name_normalized
+        HAVING COUNT(*) >= %s
+    ) AS names
+    JOIN telegram_transactions t ON t.sender_name_normalized = names.sender_name_normalized
+    WHERE t.channel_id = %s AND t.is_used = 0 AND t.amount BETWEEN %s AND %s
+      AND t.transaction_date >= NOW() - INTERVAL %s HOUR
+    ORDER BY t.transaction_date DESC
+    LIMIT %s
+"""
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def find_match_in_db(target_amount, target_sender, require_fresh=True):
+    """
+    Looks the transaction up in telegram_transactions. Returns the JSON result, or
+    None when require_fresh is set and the listener heartbeat is missing or stale.
+    """
+    if not TARGET_GROUP_ID:
+        raise ValueError("TELEGRAM_TARGET_GROUP_ID is not configured.")
+    # Same containment test as find_match, on the normalized names the listener stores.
+    sender = normalize_name(target_sender)
+    if not sender:
+        # An empty name would turn the LIKE into '%%' and match every transaction of that amount.
+        return {"status": "not_found", "source": "db"}
+    channel_id = int(TARGET_GROUP_ID)
+
+    db = mysql.connector.connect(
+        host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'), database=os.getenv('DB_DATABASE'),
+    )
+    try:
+        cursor = db.cursor()
+        if require_fresh:
+            cursor.execute(
+                "SELECT TIMESTAMPDIFF(SECOND, last_seen_at, NOW()) FROM service_heartbeats WHERE service = %s",
+                (LISTENER_HEARTBEAT,),
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] > HEARTBEAT_STALE_SECONDS:
+                return None
+
+        amount = Decimal(f"{target_amount:.2f}")
+        cursor.execute(EXACT_MATCH_SQL, (channel_id, amount, sender, WINDOW_HOURS))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(CONTAINS_MATCH_SQL, (channel_id, amount, WINDOW_HOURS, f"%{escape_like(sender)}%"))
+            row = cursor.fetchone()
+        if row is not None:
+            cursor.close()
+            return {"status": "found", "source": "db", "transaction_id": row[0]}
+
+        # Runners-up down to FUZZY_MIN_SCORE - FUZZY_MARGIN can veto a match, so they are fetched too.
+        query_trigrams = sorted(trigrams(sender))
+        cursor.execute(
+            FUZZY_CANDIDATES_SQL.format(trigrams=", ".join(["%s"] * len(query_trigrams))),
+            (*query_trigrams, min_shared_trigrams(sender, FUZZY_MIN_SCORE - FUZZY_MARGIN), channel_id,
+             amount - AMOUNT_TOLERANCE, amount + AMOUNT_TOLERANCE, WINDOW_HOURS, FUZZY_CANDIDATE_LIMIT + 1),
+        )
+        candidates = cursor.fetchall()
+        cursor.close()
+        if len(candidates) > FUZZY_CANDIDATE_LIMIT:
+            print(f"[FUZZY-WARN] More than {FUZZY_CANDIDATE_LIMIT} candidate rows for amount {amount} and sender "
+                  f"'{sender}'; only the newest were scored.", file=sys.stderr)
+            candidates = candidates[:FUZZY_CANDIDATE_LIMIT]
+        match = confident_match(rank_candidates(candidates, sender, k=2), FUZZY_MIN_SCORE, FUZZY_MARGIN)
+        if match is None:
+            return {"status": "not_found", "source": "db"}
+        return {"status": "found", "source": "db", "transaction_id": match.row_id,
+                "matched_sender": match.sender_name, "score": match.score}
+    finally:
+        db.close()
 
 # --- Main Execution ---
 async def main():
-    if not all([API_ID, API_HASH, TARGET_GROUP_ID, SESSION_STRING]):
-        print(json.dumps({"status": "error", "message": "Telegram API credentials or SESSION_STRING are not configured."}))
-        return
-
     try:
         target_amount_str = sys.argv[1]
         target_sender_name = sys.argv[2]
@@ -75,7 +168,24 @@ async def main():
         return
         
     target_amount_float = parse_brl_amount(target_amount_str)
-    
+
+    if CHECKER_MODE != "live":
+        try:
+            result = find_match_in_db(target_amount_float, target_sender_name, require_fresh=CHECKER_MODE != "db")
+        except Exception as e:
+            if CHECKER_MODE == "db":
+                print(json.dumps({"status": "error", "message": str(e)}))
+                return
+            print(f"[DB-ERROR] Lookup failed, scanning Telegram instead: {e}", file=sys.stderr)
+            result = None
+        if result is not None:
+            print(json.dumps(result))
+            return
+
+    if not all([API_ID, API_HASH, TARGET_GROUP_ID, SESSION_STRING]):
+        print(json.dumps({"status": "error", "message": "Telegram API credentials or SESSION_STRING are not configured."}))
+        return
+
     # === THE DEFINITIVE CACHING FIX ===
     # Use an in-memory StringSession to force a fresh connection every time.
     client = TelegramClient(StringSession(SESSION_STRING), int(API_ID), API_HASH)
@@ -90,9 +200,9 @@ async def main():
         messages = await client.get_messages(target_group, limit=50) # Limit can be smaller now
 
         if find_match(messages, target_amount_float, target_sender_name):
-            print(json.dumps({"status": "found"}))
+            print(json.dumps({"status": "found", "source": "live"}))
         else:
-            print(json.dumps({"status": "not_found"}))
+            print(json.dumps({"status": "not_found", "source": "live"}))
 
     except Exception as e:
         print(json.dumps({"status": "error", "message": str(e)}), file=sys.stderr)
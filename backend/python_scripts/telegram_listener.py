@@ -1,13 +1,12 @@
 import os
-import re
 import json
 import asyncio
-from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
-import mysql.connector
+from telegram_store import create_telegram_store, LISTENER_HEARTBEAT
+from telegram_parsing import extract_fields, normalize_name, parse_brl_amount, parse_transaction_date
 
 # --- Load Environment Variables ---
 script_dir = Path(__file__).resolve().parent
@@ -24,6 +23,15 @@ SESSION_STRING = os.getenv('TELEGRAM_SESSION_STRING')
 TARGET_GROUP_NAMES_STR = os.getenv('TELEGRAM_TARGET_GROUP_NAMES')
 TARGET_GROUP_NAMES = [name.strip() for name in TARGET_GROUP_NAMES_STR.split(',')] if TARGET_GROUP_NAMES_STR else []
 
+# Seconds between connection checks; each successful one also refreshes the DB heartbeat
+HEARTBEAT_SECONDS = int(os.getenv('TELEGRAM_HEARTBEAT_SECONDS', '60'))
+# Messages scanned for a group that has no sync checkpoint yet
+INITIAL_SYNC_LIMIT = int(os.getenv('TELEGRAM_INITIAL_SYNC_LIMIT', '10000'))
+# Scans of one group's history when DB batches of it are dropped during the scan
+HISTORY_SYNC_ATTEMPTS = 3
+# Messages scanned between checkpoint saves during a history sync
+HISTORY_CHECKPOINT_EVERY = int(os.getenv('TELEGRAM_HISTORY_CHECKPOINT_EVERY', '1000'))
+
 DB_HOST = os.getenv('DB_HOST')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
@@ -31,85 +39,45 @@ DB_DATABASE = os.getenv('DB_DATABASE')
 
 # This global list will hold the resolved numeric IDs of the target groups
 resolved_group_ids = []
+# Pooled, batched writer for telegram_transactions; created in main()
+store = None
+# The DB heartbeat is only written once the history sync has caught up
+history_synced = False
 
 # --- Helper Functions ---
-def parse_brl_amount(amount_str):
-    try:
-        cleaned_str = re.sub(r'[^\d,.]', '', amount_str).strip()
-        if ',' in cleaned_str and '.' in cleaned_str and cleaned_str.rfind('.') < cleaned_str.rfind(','):
-            cleaned_str = cleaned_str.replace(".", "").replace(",", ".")
-        else:
-            cleaned_str = cleaned_str.replace(",", ".")
-        return float(cleaned_str)
-    except (ValueError, TypeError):
-        return 0.0
-
-def get_db_connection():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_DATABASE
-    )
-
-def parse_and_store_message(message_text, message_id, channel_id):
-    """Parses a message and stores the transaction in the database with a normalized name."""
-    amount_regex = re.compile(r"Amount:\s*R\$\s*([\d.,]+)")
-    sender_block_regex = re.compile(r"Sender Information:\s*-+\s*(.+?)(?=\n\n|\Z)", re.DOTALL)
-    sender_name_regex = re.compile(r"Name:\s*([^\n]+)")
-    date_regex = re.compile(r"Date:\s*(\d{2}/\d{2}/\d{4}\s\d{2}:\d{2}:\d{2})")
+def parse_message(message_text, message_id, channel_id):
+    """Parses a message into a telegram_transactions row (telegram_store.TELEGRAM_COLUMNS order), or None."""
+    fields = extract_fields(message_text)
 
-    amount_match = amount_regex.search(message_text)
-    sender_block_match = sender_block_regex.search(message_text)
-    date_match = date_regex.search(message_text)
+    if not (fields.amount and fields.sender_block and fields.date):
+        return None
 
-    if not (amount_match and sender_block_match and date_match):
-        return False
-
-    sender_block_text = sender_block_match.group(1)
-    sender_name_match = sender_name_regex.search(sender_block_text)
-
-    if not sender_name_match:
+    if fields.sender_name is None:
         print(f"[PARSE-WARN] Could not find sender name in message ID {message_id}. Skipping.")
-        return False
+        return None
 
     try:
-        amount = parse_brl_amount(amount_match.group(1))
-        sender_name_raw = sender_name_match.group(1).strip()
-        
+        amount = parse_brl_amount(fields.amount)
+        sender_name_raw = fields.sender_name
+
         if not sender_name_raw:
             print(f"[PARSE-WARN] Found empty sender name in message ID {message_id}. Skipping.")
-            return False
-
-        # --- Perform normalization ---
-        normalized_name = re.sub(r'[\d.,-]', '', sender_name_raw)
-        normalized_name = re.sub(r'\b(ltda|me|sa|eireli|epp)\b', '', normalized_name, flags=re.IGNORECASE)
-        normalized_name = re.sub(r'\s+', ' ', normalized_name).strip().lower()
-        
-        tx_date = datetime.strptime(date_match.group(1), '%d/%m/%Y %H:%M:%S')
-
-        db = get_db_connection()
-        cursor = db.cursor()
-        
-        sql = """
-            INSERT INTO telegram_transactions 
-            (telegram_message_id, channel_id, amount, sender_name, sender_name_normalized, transaction_date, raw_text)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE telegram_message_id=telegram_message_id;
-        """
-        values = (message_id, channel_id, amount, sender_name_raw, normalized_name, tx_date, message_text)
-        
-        cursor.execute(sql, values)
-        db.commit()
-        
-        cursor.close()
-        db.close()
-        
-        print(f"[DB INSERT] Stored TX from Msg ID {message_id}: Amount={amount}, Sender='{sender_name_raw}'")
-        return True
+            return None
+
+        tx_date = parse_transaction_date(fields.date)
+
+        return (message_id, channel_id, amount, sender_name_raw, normalize_name(sender_name_raw), tx_date, message_text)
     except Exception as e:
-        print(f"[ERROR] Failed to parse or store message ID {message_id}: {e}")
+        print(f"[ERROR] Failed to parse message ID {message_id}: {e}")
+        return None
+
+async def parse_and_store_message(message_text, message_id, channel_id):
+    """Parses a message and queues the transaction for the batched DB writer; never waits on MySQL."""
+    row = parse_message(message_text, message_id, channel_id)
+    if row is None:
         return False
+    await store.put(row)
+    return True
 
 # --- Main Listener Logic ---
 print("--- Telegram Listener Service (Name-Based) starting... ---")
@@ -123,49 +91,93 @@ client = TelegramClient(StringSession(SESSION_STRING), int(API_ID), API_HASH)
 async def new_message_handler(event):
     """Handles real-time new messages from any of the resolved groups."""
     print(f"\n[REAL-TIME] New message detected (ID: {event.message.id}) in Group ID {event.chat_id}.")
-    # This function already contains the correct normalization and DB insertion logic.
-    parse_and_store_message(event.raw_text, event.message.id, event.chat_id)
-
-async def sync_history():
-    """Scans historical messages for ALL resolved groups and back-fills the database."""
+    # Parsing is cheap; the DB write happens on the store's background task.
+    await parse_and_store_message(event.raw_text, event.message.id, event.chat_id)
+
+async def initial_sync_start(group_id):
+    """Message ID just below a group's INITIAL_SYNC_LIMIT most recent messages (0 for smaller groups)."""
+    older = await client.get_messages(group_id, limit=1, add_offset=INITIAL_SYNC_LIMIT)
+    return older[0].id if older else 0
+
+async def advance_history_checkpoint(group_id, checkpoint, message_id):
+    """Once everything queued so far is stored, moves the group's pin and checkpoint up to message_id."""
+    await store.queue.join()
+    if not store.advance_pin(group_id, checkpoint, message_id):
+        return False
+    await asyncio.to_thread(store.save_checkpoint, group_id, message_id)
+    return True
+
+async def sync_group_history(group_id, checkpoint):
+    """Back-fills one group from its checkpoint (pinned by main); returns the number of transactions queued."""
+    entity = await client.get_entity(group_id)
+    count_per_group = 0
+    for attempt in range(1, HISTORY_SYNC_ATTEMPTS + 1):
+        print(f"\n[SYNC] Checking history for Group '{entity.title}' (ID: {group_id}) after message {checkpoint}...")
+        existing_ids = await asyncio.to_thread(store.existing_message_ids, group_id, checkpoint)
+        scanned, last_id, pin_held = 0, checkpoint, True
+        # Oldest first and streamed, so checkpoints only ever cover stored messages.
+        async for message in client.iter_messages(entity, min_id=checkpoint, reverse=True):
+            scanned += 1
+            last_id = message.id
+            if message.raw_text and message.id not in existing_ids:
+                if await parse_and_store_message(message.raw_text, message.id, message.chat_id):
+                    count_per_group += 1
+            if scanned % HISTORY_CHECKPOINT_EVERY == 0:
+                if not await advance_history_checkpoint(group_id, checkpoint, last_id):
+                    pin_held = False
+                    break
+                checkpoint = last_id
+
+        await store.queue.join()
+        if pin_held and store.unpin_checkpoint(group_id, checkpoint):
+            if last_id > checkpoint:
+                await asyncio.to_thread(store.save_checkpoint, group_id, last_id)
+            break
+        # A batch of this group was dropped meanwhile: the pin stays, and the scan repeats to fill the gap.
+        checkpoint = store.repin_checkpoint(group_id)
+        print(f"[SYNC-WARN] Group '{entity.title}' lost a DB batch during attempt {attempt}/{HISTORY_SYNC_ATTEMPTS}; "
+              f"rescanning after message {checkpoint}.")
+    print(f"[SYNC] Finished Group '{entity.title}'. Scanned {scanned} messages, queued {count_per_group} new transactions.")
+    return count_per_group
+
+async def sync_history(checkpoints):
+    """Catches up ALL resolved groups concurrently from their per-channel checkpoints."""
     print("\n--- Starting historical message sync for all resolved groups... ---")
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT channel_id, telegram_message_id FROM telegram_transactions")
-    existing_entries = {(row['channel_id'], row['telegram_message_id']) for row in cursor.fetchall()}
-    cursor.close()
-    db.close()
-    
-    print(f"[SYNC] Found {len(existing_entries)} existing messages in DB.")
-    
+    results = await asyncio.gather(
+        *(sync_group_history(group_id, checkpoints.get(group_id, 0)) for group_id in resolved_group_ids),
+        return_exceptions=True,
+    )
     total_added = 0
-    for group_id in resolved_group_ids:
-        try:
-            entity = await client.get_entity(group_id)
-            print(f"\n[SYNC] Checking history for Group '{entity.title}' (ID: {group_id})...")
-            count_per_group = 0
-            async for message in client.iter_messages(entity, limit=10000):
-                if not message or not message.raw_text:
-                    continue
-                if (message.chat_id, message.id) not in existing_entries:
-                    if parse_and_store_message(message.raw_text, message.id, message.chat_id):
-                        count_per_group += 1
-            
-            print(f"[SYNC] Finished Group '{entity.title}'. Added {count_per_group} new transactions.")
-            total_added += count_per_group
-        except Exception as e:
-            print(f"[SYNC-ERROR] Could not sync history for Group ID {group_id}: {e}")
-    
+    for group_id, result in zip(resolved_group_ids, results):
+        if isinstance(result, Exception):
+            print(f"[SYNC-ERROR] Could not sync history for Group ID {group_id}: {result}")
+        else:
+            total_added += result
+
     print(f"\n[SYNC] Historical sync complete. Total new transactions added: {total_added}.")
 
+async def touch_db_heartbeat():
+    """Tells telegram_checker.py that telegram_transactions is current."""
+    if not history_synced:
+        return
+    if store.queue.qsize() >= store.batch_size:
+        print(f"[HEARTBEAT-WARN] {store.queue.qsize()} rows waiting for the DB; not refreshing the DB heartbeat.")
+        return
+    try:
+        await asyncio.to_thread(store.touch_heartbeat, LISTENER_HEARTBEAT, store.stats())
+    except Exception as e:
+        print(f"[HEARTBEAT-ERROR] Could not write DB heartbeat: {e}")
+
 async def heartbeat():
     """Periodically performs a lightweight action to ensure the connection is alive and synced."""
     while True:
-        await asyncio.sleep(300) # Sleep for 5 minutes
+        await asyncio.sleep(HEARTBEAT_SECONDS)
         try:
             me = await client.get_me()
             if me:
                 print(f"[HEARTBEAT] Connection check OK. Listener is active as {me.username}.")
+                print(f"[DB-STATS] {json.dumps(store.stats())}")
+                await touch_db_heartbeat()
             else:
                 # Should not happen if client is connected, but a good safeguard
                 print(f"[HEARTBEAT-WARN] Connection check returned no user. Attempting to stay connected.")
@@ -174,7 +186,9 @@ async def heartbeat():
 
 async def main():
     """Main function to find groups by name, then connect, sync, and run."""
-    global resolved_group_ids
+    global resolved_group_ids, store, history_synced
+    store = create_telegram_store()
+    store.start()
     await client.start()
     print("--- Client connected. ---")
 
@@ -195,16 +209,31 @@ async def main():
         print("FATAL ERROR: Could not resolve any target group names. Exiting.")
         return
 
+    # Pin every group at its checkpoint before realtime messages can arrive: their batches
+    # must not move a checkpoint past history that has not been scanned yet.
+    checkpoints = await asyncio.to_thread(store.load_checkpoints)
+    print(f"[SYNC] Loaded checkpoints for {len(checkpoints)} channel(s).")
+    for group_id in resolved_group_ids:
+        if group_id not in checkpoints:
+            # Without a checkpoint, only the most recent messages are scanned, as before checkpoints existed.
+            checkpoints[group_id] = await initial_sync_start(group_id)
+        store.pin_checkpoint(group_id, checkpoints.get(group_id, 0))
+
     # Attach the real-time event handler ONLY to the groups we successfully found
     client.add_event_handler(new_message_handler, events.NewMessage(chats=resolved_group_ids))
     
     # Start the self-healing heartbeat task to run in the background
     asyncio.create_task(heartbeat())
     
-    await sync_history()
-    
+    await sync_history(checkpoints)
+    history_synced = True
+    await touch_db_heartbeat()
+
     print(f"\n--- Listener is now running on {len(resolved_group_ids)} group(s) and waiting for new messages... ---")
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        await store.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Parsing and name normalization for the Telegram transaction messages that
+telegram_listener.py ingests and telegram_checker.py searches:
+
+    Amount: R$ 1.234,56
+    Sender Information:
+    --------------------
+    Name: ACME LTDA 12.345.678/0001-90
+    ...
+
+    Date: 01/02/2024 10:11:12
+
+Patterns are compiled once at import and extract_fields runs one search per
+field. (A single alternation pass over the message was measured slower: each
+field pattern starts with a literal, which re scans for much faster than for
+an alternation of three.) normalize_name is memoized: the same payers recur
+across thousands of messages and exports. See bench_telegram_parsing.py.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+_AMOUNT_RE = re.compile(r"Amount:\s*R\$\s*([\d.,]+)")
+_SENDER_BLOCK_RE = re.compile(r"Sender Information:\s*-+\s*(.+?)(?=\n\n|\Z)", re.DOTALL)
+_DATE_RE = re.compile(r"Date:\s*(\d{2}/\d{2}/\d{4}\s\d{2}:\d{2}:\d{2})")
+_NAME_RE = re.compile(r"Name:\s*([^\n]+)")
+_NON_AMOUNT_RE = re.compile(r"[^\d,.]")
+_NAME_STRIP_RE = re.compile(r"[\d.,-]")
+_NAME_SUFFIX_RE = re.compile(r"\b(ltda|me|sa|eireli|epp)\b", re.IGNORECASE)
+
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+class MessageFields(NamedTuple):
+    amount: str | None        # raw amount text, e.g. '1.234,56'
+    sender_block: str | None
+    sender_name: str | None   # stripped 'Name:' line of the sender block
+    date: str | None          # raw date text, see DATE_FORMAT
+
+def parse_brl_amount(amount_str) -> float:
+    """'1.234,56' or '1,234.56' -> 1234.56; 0.0 when unparseable."""
+    try:
+        cleaned_str = _NON_AMOUNT_RE.sub("", amount_str).strip()
+        if "," in cleaned_str and "." in cleaned_str and cleaned_str.rfind(".") < cleaned_str.rfind(","):
+            cleaned_str = cleaned_str.replace(".", "").replace(",", ".")
+        else:
+            cleaned_str = cleaned_str.replace(",", ".")
+        return float(cleaned_str)
+    except (ValueError, TypeError):
+        return 0.0
+
+@lru_cache(maxsize=16384)
+def normalize_name(raw_name: str | None) -> str:
+    """Drops digits/punctuation and company suffixes, collapses whitespace, lowercases; '' for empty input."""
+    if not raw_name:
+        return ""
+    name = _NAME_SUFFIX_RE.sub("", _NAME_STRIP_RE.sub("", raw_name))
+    return " ".join(name.split()).lower()
+
+def extract_fields(text: str) -> MessageFields:
+    """First match of every field; fields missing from the message are None."""
+    amount_match = _AMOUNT_RE.search(text)
+    sender_block_match = _SENDER_BLOCK_RE.search(text)
+    date_match = _DATE_RE.search(text)
+    sender_block = sender_block_match.group(1) if sender_block_match else None
+    name_match = _NAME_RE.search(sender_block) if sender_block else None
+    return MessageFields(
+        amount_match.group(1) if amount_match else None,
+        sender_block,
+        name_match.group(1).strip() if name_match else None,
+        date_match.group(1) if date_match else None,
+    )
+
+def parse_transaction_date(date_text: str) -> datetime:
+    """'dd/mm/YYYY HH:MM:SS' (DATE_FORMAT) as matched by extract_fields; ValueError for impossible dates."""
+    # Fixed positions are guaranteed by the pattern, and slicing is several times faster than strptime.
+    return datetime(int(date_text[6:10]), int(date_text[3:5]), int(date_text[:2]),
+                    int(date_text[11:13]), int(date_text[14:16]), int(date_text[17:19]))
@@ -0,0 +1,253 @@
+"""
+Database layer for telegram_listener.py.
+
+Writes never run on the Telethon event loop: parsed rows go into a bounded
+asyncio.Queue and one background task drains it in micro-batches (up to
+TELEGRAM_DB_BATCH_SIZE rows, or whatever arrived within TELEGRAM_DB_FLUSH_MS
+of the first one), each written as one multi-row INSERT ... ON DUPLICATE KEY
+on a pooled connection in a worker thread. When the queue is full, put()
+waits for room instead of dropping messages.
+
+Each batch also adds its sender names to the trigram index used by
+telegram_checker.py's fuzzy matching (sender_matcher.save_name_trigrams) and
+advances telegram_sync_checkpoints (highest ingested message
+ID per channel) in the same transaction, so a restarted listener only asks
+Telegram for messages after the checkpoint. A dropped batch pins its
+channels' checkpoints below the dropped messages for the rest of the run,
+and keeps a history scan of the channel from advancing or lifting its pin
+(the scan is repeated instead).
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from mysql.connector import pooling
+from sender_matcher import save_name_trigrams
+
+TELEGRAM_COLUMNS = ("telegram_message_id", "channel_id", "amount", "sender_name", "sender_name_normalized",
+                    "transaction_date", "raw_text")
+
+# service_heartbeats row refreshed by the listener; telegram_checker.py trusts the DB while it is fresh.
+LISTENER_HEARTBEAT = "telegram_listener"
+
+CHECKPOINT_SQL = (
+    "INSERT INTO telegram_sync_checkpoints (channel_id, last_message_id) VALUES {values} "
+    "ON DUPLICATE KEY UPDATE last_message_id = GREATEST(last_message_id, VALUES(last_message_id))"
+)
+
+class TelegramStore:
+    def __init__(self, pool_size: int = 4, queue_size: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 0.2, max_attempts: int = 3):
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="telegram_listener", pool_size=pool_size,
+            host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'), database=os.getenv('DB_DATABASE'),
+        )
+        # get_connection() raises PoolError instead of waiting when the pool is exhausted, so worker
+        # threads (history sync of every group, the drain, the heartbeat) queue here for a connection.
+        self._pool_slots = threading.BoundedSemaphore(pool_size)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.metrics = {"queued": 0, "written": 0, "inserted": 0, "dropped": 0, "batches": 0, "full_waits": 0,
+                        "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self._task = None
+        # channel_id -> highest checkpoint allowed this run (set when a batch is dropped)
+        self._checkpoint_caps = {}
+        # channels with a dropped batch since their pin was last (re)set
+        self._dropped_channels = set()
+
+    @contextmanager
+    def connection(self):
+        """Blocks the calling (worker) thread until a pooled connection is free."""
+        with self._pool_slots:
+            conn = self.pool.get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()  # returns it to the pool
+
+    # --- Checkpoints ---
+    def load_checkpoints(self) -> dict:
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT channel_id, last_message_id FROM telegram_sync_checkpoints")
+            checkpoints = dict(cursor.fetchall())
+            cursor.close()
+        return checkpoints
+
+    def existing_message_ids(self, channel_id: int, after_id: int) -> set:
+        """IDs already stored for a channel above after_id (an index range scan, not the whole table)."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT telegram_message_id FROM telegram_transactions WHERE channel_id = %s AND telegram_message_id > %s",
+                (channel_id, after_id),
+            )
+            ids = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        return ids
+
+    def _checkpoint_values(self, checkpoints: dict) -> list[tuple]:
+        values = []
+        for channel_id, message_id in checkpoints.items():
+            cap = self._checkpoint_caps.get(channel_id)
+            values.append((channel_id, message_id if cap is None else min(message_id, cap)))
+        return values
+
+    def _save_checkpoints(self, cursor, checkpoints: dict):
+        values = self._checkpoint_values(checkpoints)
+        if values:
+            cursor.execute(CHECKPOINT_SQL.format(values=", ".join(["(%s, %s)"] * len(values))),
+                           [value for pair in values for value in pair])
+
+    def pin_checkpoint(self, channel_id: int, message_id: int):
+        """Keeps batches from advancing a channel past message_id (while its history is still being scanned)."""
+        self._checkpoint_caps[channel_id] = min(self._checkpoint_caps.get(channel_id, message_id), message_id)
+
+    def advance_pin(self, channel_id: int, pinned_id: int, message_id: int) -> bool:
+        """
+        Moves a pin set by pin_checkpoint from pinned_id up to message_id once everything up to it is
+        stored; False (pin kept) when a batch of the channel was dropped meanwhile.
+        """
+        if channel_id in self._dropped_channels or self._checkpoint_caps.get(channel_id) != pinned_id:
+            return False
+        self._checkpoint_caps[channel_id] = message_id
+        return True
+
+    def unpin_checkpoint(self, channel_id: int, message_id: int) -> bool:
+        """Lifts a pin set by pin_checkpoint; False (pin kept) when a batch of the channel was dropped meanwhile."""
+        if channel_id in self._dropped_channels or self._checkpoint_caps.get(channel_id) != message_id:
+            return False
+        del self._checkpoint_caps[channel_id]
+        return True
+
+    def repin_checkpoint(self, channel_id: int) -> int:
+        """After a failed unpin: forgets the drops and returns the message ID a rescan has to start from."""
+        self._dropped_channels.discard(channel_id)
+        return self._checkpoint_caps[channel_id]
+
+    def save_checkpoint(self, channel_id: int, message_id: int):
+        """Advances a channel's checkpoint after a history scan (messages without a transaction included)."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._save_checkpoints(cursor, {channel_id: message_id})
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def touch_heartbeat(self, service: str, details: dict | None = None):
+        """Stamps service_heartbeats with the database clock, so readers compare against the same clock."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO service_heartbeats (service, last_seen_at, details) VALUES (%s, NOW(), %s) "
+                    "ON DUPLICATE KEY UPDATE last_seen_at = VALUES(last_seen_at), details = VALUES(details)",
+                    (service, json.dumps(details) if details is not None else None),
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+    # --- Write path ---
+    async def put(self, row: tuple):
+        """Queues one row (values in TELEGRAM_COLUMNS order); waits only when the queue is full."""
+        if self.queue.full():
+            self.metrics["full_waits"] += 1
+        await self.queue.put(row)
+        self.metrics["queued"] += 1
+
+    def _write(self, rows: list[tuple]) -> int:
+        placeholders = "(" + ", ".join(["%s"] * len(TELEGRAM_COLUMNS)) + ")"
+        sql = (f"INSERT INTO telegram_transactions ({', '.join(TELEGRAM_COLUMNS)}) "
+               f"VALUES {', '.join([placeholders] * len(rows))} "
+               "ON DUPLICATE KEY UPDATE telegram_message_id=telegram_message_id")
+        checkpoints = {}
+        for row in rows:
+            checkpoints[row[1]] = max(checkpoints.get(row[1], 0), row[0])
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, [value for row in rows for value in row])
+                # Duplicates affect 0 rows, so rowcount is the number of new messages.
+                inserted = max(cursor.rowcount, 0)
+                save_name_trigrams(cursor, [row[4] for row in rows])
+                self._save_checkpoints(cursor, checkpoints)
+                conn.commit()
+                return inserted
+            finally:
+                cursor.close()
+
+    async def _flush(self, rows: list[tuple]):
+        started = time.monotonic()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                inserted = await asyncio.to_thread(self._write, rows)
+                break
+            except Exception as e:
+                print(f"[DB-ERROR] Batch of {len(rows)} failed (attempt {attempt}/{self.max_attempts}): {e}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(attempt)
+        else:
+            self.metrics["dropped"] += len(rows)
+            for message_id, channel_id, *_ in rows:
+                self._checkpoint_caps[channel_id] = min(self._checkpoint_caps.get(channel_id, message_id), message_id - 1)
+                self._dropped_channels.add(channel_id)
+            print(f"[DB-ERROR] Dropped message IDs {[row[0] for row in rows]}; the next history sync will retry them.")
+            return
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.metrics["batches"] += 1
+        self.metrics["written"] += len(rows)
+        self.metrics["inserted"] += inserted
+        self.metrics["last_flush_ms"] = round(elapsed_ms, 1)
+        self.metrics["max_flush_ms"] = round(max(self.metrics["max_flush_ms"], elapsed_ms), 1)
+        self.metrics["total_flush_ms"] += elapsed_ms
+        print(f"[DB INSERT] Batch of {len(rows)} message(s), {inserted} new, in {elapsed_ms:.0f} ms.")
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(rows)
+            finally:
+                for _ in rows:
+                    self.queue.task_done()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+
+    async def close(self):
+        """Waits for queued rows to be written, then stops the drain task."""
+        if self._task is not None:
+            await self.queue.join()
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        stats = dict(self.metrics, queue_depth=self.queue.qsize(), queue_size=self.queue.maxsize)
+        stats["avg_flush_ms"] = round(stats.pop("total_flush_ms") / stats["batches"], 1) if stats["batches"] else 0.0
+        return stats
+
+def create_telegram_store() -> TelegramStore:
+    return TelegramStore(
+        pool_size=int(os.getenv("TELEGRAM_DB_POOL_SIZE", "4")),
+        queue_size=int(os.getenv("TELEGRAM_DB_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("TELEGRAM_DB_BATCH_SIZE", "200")),
+        flush_interval=int(os.getenv("TELEGRAM_DB_FLUSH_MS", "200")) / 1000,
+    )
@@ -0,0 +1,246 @@
+"""
+Failover tests for chain_providers.py against local stub HTTP servers
+(no network access or API keys needed):
+
+    cd backend/python_scripts && python -m unittest test_chain_providers
+"""
+import os
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+import trongrid_client
+import usdt_sync
+from chain_providers import (USDT_TRON_CONTRACT, ChainRouter, TokenviewProvider, TronGridProvider, TronscanProvider,
+                             TxNotFound)
+from rate_limit import RateLimiter
+
+WALLET = "TXYZopYRdj2D9XRtbG411XZZ3kM5VkAeBf"
+
+class StubServer:
+    """
+    Serves handler(path, query) -> (status, body) on 127.0.0.1 and records request paths.
+    For POST requests query is the JSON body.
+    """
+
+    def __init__(self, handler):
+        stub = self
+        self.handler = handler
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.respond(url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.respond(urlparse(self.path).path, json.loads(self.rfile.read(length) or b"{}"))
+
+            def respond(self, path, query):
+                stub.requests.append(path)
+                status, body = stub.handler(path, query)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def tx(n: int) -> dict:
+    """Normalized transfer number n; higher n is newer."""
+    return {"txid": f"{n:064x}", "time": 1_700_000_000 + n, "from": "TFrom", "to": WALLET, "value": str(n * 1_000_000)}
+
+def tokenview_handler(txs, fail_pages=()):
+    def handle(path, query):
+        page, size = (int(part) for part in path.rstrip("/").split("/")[-2:])
+        if page in fail_pages:
+            return 500, {"error": "stub failure"}
+        return 200, {"data": {"txs": txs[(page - 1) * size:page * size]}}
+    return handle
+
+def tronscan_handler(txs):
+    def handle(path, query):
+        start, limit = int(query["start"]), int(query["limit"])
+        return 200, {"token_transfers": [
+            {"transaction_id": t["txid"], "block_ts": t["time"] * 1000, "from_address": t["from"],
+             "to_address": t["to"], "quant": t["value"]} for t in txs[start:start + limit]]}
+    return handle
+
+def failing_handler(path, query):
+    return 500, {"error": "stub failure"}
+
+class StubServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def temp_path(self, name: str) -> str:
+        """Path under a per-test temporary directory that is removed after the test."""
+        if not hasattr(self, "_tmp"):
+            self._tmp = tempfile.TemporaryDirectory()
+            self.addCleanup(self._tmp.cleanup)
+        return os.path.join(self._tmp.name, name)
+
+    def stub(self, handler) -> StubServer:
+        server = StubServer(handler)
+        self.servers.append(server)
+        return server
+
+class ChainRouterFailoverTest(StubServerTestCase):
+    def test_fails_over_and_cools_down_failing_provider(self):
+        txs = [tx(n) for n in range(3, 0, -1)]
+        broken = self.stub(failing_handler)
+        working = self.stub(tronscan_handler(txs))
+        router = ChainRouter([TokenviewProvider(broken.url), TronscanProvider(working.url)],
+                             failure_threshold=2, cooldown_seconds=60)
+
+        for _ in range(2):
+            self.assertEqual([t["txid"] for t in router.call("transfers_page", WALLET, 1, 50)],
+                             [t["txid"] for t in txs])
+        stats = router.stats()
+        self.assertEqual(stats["tokenview"]["failures"], 2)
+        self.assertFalse(stats["tokenview"]["healthy"])
+        self.assertEqual(stats["tronscan"]["successes"], 2)
+
+        # Cooling down: the next call goes to tronscan without touching tokenview.
+        requests_before = len(broken.requests)
+        self.assertEqual(router.call_with_provider("transfers_page", WALLET, 1, 50)[0], "tronscan")
+        self.assertEqual(len(broken.requests), requests_before)
+
+    def test_raises_when_every_provider_fails(self):
+        router = ChainRouter([TokenviewProvider(self.stub(failing_handler).url),
+                              TronscanProvider(self.stub(failing_handler).url)])
+        with self.assertRaises(Exception):
+            router.call("transfers_page", WALLET, 1, 50)
+        self.assertEqual([h["failures"] for h in router.stats().values()], [1, 1])
+
+    def test_pinned_call_does_not_fail_over(self):
+        router = ChainRouter([TokenviewProvider(self.stub(failing_handler).url),
+                              TronscanProvider(self.stub(tronscan_handler([tx(1)])).url)])
+        with self.assertRaises(Exception):
+            router.call_with_provider("transfers_page", WALLET, 2, 50, pin="tokenview")
+
+    def test_missing_trongrid_cursor_is_not_a_provider_failure(self):
+        trongrid = self.stub(failing_handler)
+        client = trongrid_client.TronGridClient(state_path=self.temp_path("trongrid.sqlite3"), rate_per_second=0,
+                                                max_retries=0, base_url=trongrid.url)
+        with mock.patch.object(trongrid_client, "_client", client):
+            router = ChainRouter([TronGridProvider(), TronscanProvider(self.stub(tronscan_handler([tx(1)])).url)])
+            provider, _ = router.call_with_provider("transfers_page", WALLET, 2, 50)
+        self.assertEqual(provider, "tronscan")
+        self.assertEqual(router.stats()["trongrid"]["failures"], 0)
+        self.assertEqual(trongrid.requests, [])
+
+    def test_trongrid_cursor_map_is_bounded(self):
+        trongrid = self.stub(lambda path, query: (200, {"data": [], "meta": {"fingerprint": "next"}}))
+        client = trongrid_client.TronGridClient(state_path=self.temp_path("trongrid.sqlite3"), rate_per_second=0,
+                                                max_retries=0, base_url=trongrid.url)
+        provider = TronGridProvider(max_cursors=3)
+        with mock.patch.object(trongrid_client, "_client", client):
+            for i in range(5):
+                provider.transfers_page(f"T{i}", 1, 50)
+            self.assertEqual(list(provider._cursors), [("T2", 2), ("T3", 2), ("T4", 2)])
+            provider.transfers_page("T4", 2, 50)  # a consumed cursor is replaced by the next page's
+        self.assertEqual(list(provider._cursors), [("T2", 2), ("T3", 2), ("T4", 3)])
+
+    def test_unknown_tx_is_asked_of_the_next_provider(self):
+        txid = "ab" * 32
+        # Tronscan has not indexed the fresh tx yet; the TronGrid node has it.
+        tronscan = self.stub(lambda path, query: (200, {}))
+        trongrid = self.stub(lambda path, query: (200, {"data": [
+            {"event_name": "Transfer", "contract_address": USDT_TRON_CONTRACT,
+             "result": {"to": WALLET, "value": "5000000"}}]} if path.endswith("/events") else
+            {"id": txid, "blockNumber": 1, "receipt": {"result": "SUCCESS"}}))
+        client = trongrid_client.TronGridClient(state_path=self.temp_path("trongrid.sqlite3"), rate_per_second=0,
+                                                max_retries=0, base_url=trongrid.url)
+        router = ChainRouter([TronscanProvider(tronscan.url), TronGridProvider()])
+        with mock.patch.object(trongrid_client, "_client", client):
+            provider, result = router.call_with_provider("tx_transfers", txid)
+        self.assertEqual(provider, "trongrid")
+        self.assertEqual(result, {"success": True, "transfers": [
+            {"contract": USDT_TRON_CONTRACT, "to": WALLET, "value": "5000000"}]})
+        self.assertEqual(tronscan.requests, ["/api/transaction-info"])
+        self.assertEqual(router.stats()["tronscan"]["failures"], 0)
+
+    def test_tx_unknown_to_every_provider_raises_not_found(self):
+        router = ChainRouter([TronscanProvider(self.stub(lambda path, query: (200, {})).url)])
+        with self.assertRaises(TxNotFound):
+            router.call("tx_transfers", "ab" * 32)
+
+class TronGridTxInfoTest(StubServerTestCase):
+    def test_tx_info_takes_one_request_and_is_cached_once_solidified(self):
+        solid_head = {"number": 99}
+        trongrid = self.stub(lambda path, query: (200, {"block_header": {"raw_data": solid_head}}
+                                                  if path == "/walletsolidity/getnowblock" else
+                                                  {"id": query["value"], "blockNumber": 100,
+                                                   "receipt": {"result": "SUCCESS"}}))
+        client = trongrid_client.TronGridClient(state_path=self.temp_path("trongrid.sqlite3"), rate_per_second=0,
+                                                max_retries=0, base_url=trongrid.url, solid_head_refresh_seconds=60)
+        txids = ["%064x" % n for n in range(3)]
+
+        for txid in txids:
+            client.get_tx_info(txid)
+        # One full-node lookup per tx; the solidified head is read once for all of them.
+        self.assertEqual(trongrid.requests.count("/wallet/gettransactioninfobyid"), 3)
+        self.assertEqual(trongrid.requests.count("/walletsolidity/getnowblock"), 1)
+        self.assertEqual(client.stats()["cache_entries"], 0)
+
+        solid_head["number"] = 100
+        client.solid_head_refresh_seconds = 0
+        client.get_tx_info(txids[0])
+        requests_before = len(trongrid.requests)
+        self.assertEqual(client.get_tx_info(txids[0])["id"], txids[0])
+        self.assertEqual(len(trongrid.requests), requests_before)
+
+class WalletWalkTest(StubServerTestCase):
+    def fetch(self, router) -> list[dict]:
+        rows = []
+        with mock.patch.object(usdt_sync, "get_chain_router", return_value=router), \
+                mock.patch.object(usdt_sync, "MAX_PAGE_SIZE", 2):
+            usdt_sync.fetch_wallet(WALLET, None, 10, RateLimiter(0), rows.extend)
+        return rows
+
+    def test_walk_stays_on_one_provider(self):
+        txs = [tx(n) for n in range(5, 0, -1)]
+        tokenview = self.stub(tokenview_handler(txs))
+        tronscan = self.stub(tronscan_handler(txs))
+        router = ChainRouter([TokenviewProvider(tokenview.url), TronscanProvider(tronscan.url)])
+        # Untried tokenview serves page 1; once its latency is measured, unpinned calls would prefer tronscan.
+        router.health["tronscan"].latency_ms = 0.001
+
+        rows = self.fetch(router)
+        self.assertEqual([r["txid"] for r in rows], [t["txid"] for t in txs])
+        self.assertEqual(len(tokenview.requests), 3)
+        self.assertEqual(tronscan.requests, [])
+
+    def test_walk_restarts_on_next_provider_without_duplicates(self):
+        txs = [tx(n) for n in range(5, 0, -1)]
+        tokenview = self.stub(tokenview_handler(txs, fail_pages={2}))
+        tronscan = self.stub(tronscan_handler(txs))
+        router = ChainRouter([TokenviewProvider(tokenview.url), TronscanProvider(tronscan.url)])
+
+        rows = self.fetch(router)
+        self.assertEqual([r["txid"] for r in rows], [t["txid"] for t in txs])
+        self.assertEqual(len(tronscan.requests), 3)
+
+if __name__ == "__main__":
+    unittest.main()
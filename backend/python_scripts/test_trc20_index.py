@@ -0,0 +1,65 @@
+"""
+Tests for trc20_index.py against a local stub TronGrid server:
+
+    cd backend/python_scripts && python -m unittest test_trc20_index
+"""
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+import trongrid_client
+from test_chain_providers import WALLET, StubServerTestCase
+from trc20_index import USDT_TRON_CONTRACT, Trc20Index
+
+def trongrid_transfer(txid: str, amount_raw: int, block_ms: int) -> dict:
+    return {"transaction_id": txid, "from": "TFrom", "to": WALLET, "value": str(amount_raw),
+            "block_timestamp": block_ms, "token_info": {"address": USDT_TRON_CONTRACT}}
+
+class Trc20IndexFindTest(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.index = Trc20Index(os.path.join(self.tmp, "index.sqlite3"), confirm_lag_seconds=0)
+        self.addCleanup(self.index._conn.close)
+
+    def use_trongrid(self, transfers):
+        trongrid = self.stub(lambda path, query: (200, {"data": [
+            t for t in transfers if t["block_timestamp"] >= int(query["min_timestamp"])]}))
+        client = trongrid_client.TronGridClient(state_path=os.path.join(self.tmp, "trongrid.sqlite3"),
+                                                rate_per_second=0, max_retries=0, base_url=trongrid.url)
+        self.addCleanup(client._conn.close)
+        patcher = mock.patch.object(trongrid_client, "_client", client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return trongrid
+
+    def test_syncs_unindexed_tail_even_when_older_rows_match(self):
+        now_ms = int(time.time() * 1000)
+        older = trongrid_transfer("a" * 64, 100_000_000, now_ms - 3_600_000)
+        fresh = trongrid_transfer("b" * 64, 100_000_000, now_ms - 60_000)
+        transfers = [older]
+        self.use_trongrid(transfers)
+        self.index.sync_wallet(WALLET, "")
+        # The fresh transfer lands after the last sync round.
+        self.index._conn.execute("UPDATE trc20_wallets SET synced_until = ?", (now_ms - 120_000,))
+        transfers.append(fresh)
+
+        rows = self.index.find(WALLET, 100_000_000, now_ms - 7_200_000, now_ms, "")
+        self.assertEqual([txid for txid, _ in rows], [fresh["transaction_id"], older["transaction_id"]])
+
+    def test_covered_window_is_answered_locally(self):
+        now_ms = int(time.time() * 1000)
+        trongrid = self.use_trongrid([trongrid_transfer("a" * 64, 100_000_000, now_ms - 3_600_000)])
+        self.index.sync_wallet(WALLET, "")
+        requests_before = len(trongrid.requests)
+
+        rows = self.index.find(WALLET, 100_000_000, now_ms - 7_200_000, now_ms - 600_000, "")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(len(trongrid.requests), requests_before)
+
+if __name__ == "__main__":
+    unittest.main()
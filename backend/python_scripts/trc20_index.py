@@ -0,0 +1,230 @@
+"""
+Local index of incoming USDT (TRC-20) transfers to our wallets.
+
+Transfers are stored per wallet keyed by (to_address, amount_raw) and ordered
+by block timestamp, so TxID discovery for a receipt becomes a local range
+lookup instead of paging through TronGrid. Each wallet records the time range
+it covers; lookups outside that range return None and the caller falls back to
+TronGrid.
+
+Keep the index fresh with the background sync (enabled wallets come from the
+usdt_wallets table unless addresses are given):
+    python trc20_index.py sync --interval 60
+    python trc20_index.py sync TXyz... --once
+    python trc20_index.py stats
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+
+from trongrid_client import get_trongrid_client
+from usdt_amount import DEFAULT_TOLERANCE, amount_range, from_raw
+
+USDT_TRON_CONTRACT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent / '.cache' / 'trc20_index.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trc20_transfers (
+    txid TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    from_address TEXT,
+    amount_raw INTEGER NOT NULL,
+    block_timestamp INTEGER NOT NULL,
+    PRIMARY KEY (txid, to_address)
+);
+CREATE INDEX IF NOT EXISTS idx_trc20_lookup ON trc20_transfers (to_address, amount_raw, block_timestamp);
+CREATE TABLE IF NOT EXISTS trc20_wallets (
+    address TEXT PRIMARY KEY,
+    synced_from INTEGER NOT NULL,
+    synced_until INTEGER NOT NULL,
+    last_sync_at REAL NOT NULL
+);
+"""
+
+class Trc20Index:
+    def __init__(self, path, backfill_hours: float = 48, confirm_lag_seconds: float = 90, max_pages: int = 50):
+        self.path = str(path)
+        self.backfill_ms = int(backfill_hours * 3600 * 1000)
+        # only_confirmed results trail the chain head; never claim coverage closer to "now" than this.
+        self.confirm_lag_ms = int(confirm_lag_seconds * 1000)
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # The sync daemon and validator processes share the file, hence WAL.
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def coverage(self, address: str) -> tuple[int, int] | None:
+        """(synced_from_ms, synced_until_ms) for a wallet, or None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_from, synced_until FROM trc20_wallets WHERE address = ?", (address,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def lookup(self, to_address: str, amount_micro: int, lo_ms: int, hi_ms: int, tolerance: int = DEFAULT_TOLERANCE):
+        """[(txid, block_timestamp)] newest first, for transfers within the amount tolerance and time range."""
+        amount_lo, amount_hi = amount_range(amount_micro, tolerance)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT txid, block_timestamp FROM trc20_transfers "
+                "WHERE to_address = ? AND amount_raw BETWEEN ? AND ? AND block_timestamp BETWEEN ? AND ? "
+                "ORDER BY block_timestamp DESC",
+                (to_address, amount_lo, amount_hi, lo_ms, hi_ms),
+            ).fetchall()
+
+    def find(self, to_address: str, amount_micro: int, lo_ms: int, hi_ms: int, api_key: str,
+             tolerance: int = DEFAULT_TOLERANCE):
+        """
+        Local candidate lookup. Returns None when the wallet is not indexed back to
+        lo_ms; when the newest part of the window is not indexed yet, pulls just that
+        part from TronGrid first, even if older rows already match: a fresh receipt's
+        transfer may be in the unsynced part while an older one has the same amount.
+        """
+        span = self.coverage(to_address)
+        if span is None or span[0] > lo_ms:
+            return None
+        if span[1] < hi_ms:
+            self.sync_wallet(to_address, api_key)
+        return self.lookup(to_address, amount_micro, lo_ms, hi_ms, tolerance)
+
+    def sync_wallet(self, address: str, api_key: str) -> int:
+        """Fetches confirmed incoming USDT transfers since the last sync; returns the number of rows seen."""
+        started_ms = int(time.time() * 1000)
+        span = self.coverage(address)
+        synced_from = span[0] if span else started_ms - self.backfill_ms
+        min_timestamp = span[1] if span else synced_from
+
+        params = {
+            "limit": 200, "contract_address": USDT_TRON_CONTRACT, "only_confirmed": "true",
+            "only_to": "true", "order_by": "block_timestamp,asc", "min_timestamp": min_timestamp,
+        }
+        path = f"/v1/accounts/{address}/transactions/trc20"
+        synced_until = started_ms - self.confirm_lag_ms
+        seen = 0
+        last_timestamp = min_timestamp
+        fingerprint = None
+        for _ in range(self.max_pages):
+            query = dict(params)
+            if fingerprint: query["fingerprint"] = fingerprint
+            data = get_trongrid_client().get(path, query, api_key=api_key)
+            rows = [
+                (row["transaction_id"], address, row.get("from"), from_raw(row.get("value")) or 0, int(row["block_timestamp"]))
+                for row in data.get("data", [])
+                if row.get("to") == address and (row.get("token_info") or {}).get("address") == USDT_TRON_CONTRACT
+            ]
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO trc20_transfers (txid, to_address, from_address, amount_raw, block_timestamp) "
+                    "VALUES (?, ?, ?, ?, ?)", rows,
+                )
+            seen += len(rows)
+            if data.get("data"):
+                last_timestamp = int(data["data"][-1]["block_timestamp"])
+            fingerprint = (data.get("meta") or {}).get("fingerprint")
+            if not fingerprint:
+                break
+        else:
+            # Page limit reached: only claim coverage up to what was actually read.
+            synced_until = min(synced_until, last_timestamp)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO trc20_wallets (address, synced_from, synced_until, last_sync_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(address) DO UPDATE SET synced_until = MAX(synced_until, excluded.synced_until), "
+                "last_sync_at = excluded.last_sync_at",
+                (address, synced_from, max(synced_until, min_timestamp), time.time()),
+            )
+        return seen
+
+    def stats(self) -> dict:
+        with self._lock:
+            transfers = self._conn.execute("SELECT COUNT(*) FROM trc20_transfers").fetchone()[0]
+            wallets = self._conn.execute(
+                "SELECT address, synced_from, synced_until, last_sync_at FROM trc20_wallets ORDER BY address"
+            ).fetchall()
+        return {
+            "transfers": transfers,
+            "wallets": [{"address": a, "synced_from": f, "synced_until": u, "last_sync_at": s} for a, f, u, s in wallets],
+        }
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_trc20_index() -> Trc20Index | None:
+    """Returns the process-wide index configured from the environment, or None when disabled."""
+    global _index
+    if os.getenv('TRC20_INDEX_ENABLED', '1').strip().lower() in ('0', 'false', 'no'):
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = Trc20Index(
+                os.getenv('TRC20_INDEX_PATH') or DEFAULT_INDEX_PATH,
+                backfill_hours=float(os.getenv('TRC20_INDEX_BACKFILL_HOURS', '48')),
+                confirm_lag_seconds=float(os.getenv('TRC20_INDEX_CONFIRM_LAG_SECONDS', '90')),
+            )
+        return _index
+
+def load_enabled_wallets() -> list[str]:
+    import mysql.connector
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'), database=os.getenv('DB_DATABASE'),
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT wallet_address FROM usdt_wallets WHERE is_enabled = 1")
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def run_sync(addresses: list[str], interval: float, once: bool):
+    index = get_trc20_index()
+    if index is None:
+        print("[TRC20-INDEX] Disabled by TRC20_INDEX_ENABLED.", file=sys.stderr)
+        return 1
+    api_key = os.getenv("TRONGRID_API_KEY", "")
+    while True:
+        started = time.monotonic()
+        try:
+            wallets = addresses or load_enabled_wallets()
+        except Exception as e:
+            print(f"[TRC20-INDEX] Could not load wallets: {e}", file=sys.stderr)
+            wallets = []
+        for address in wallets:
+            try:
+                seen = index.sync_wallet(address, api_key)
+                print(f"[TRC20-INDEX] {address}: {seen} transfer(s) fetched", file=sys.stderr)
+            except Exception as e:
+                print(f"[TRC20-INDEX] Sync failed for {address}: {e}", file=sys.stderr)
+        if once:
+            return 0
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Local index of incoming USDT transfers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync = sub.add_parser("sync", help="Incrementally sync wallets into the index.")
+    sync.add_argument("addresses", nargs="*", help="Wallets to sync (default: enabled rows of usdt_wallets).")
+    sync.add_argument("--interval", type=float, default=float(os.getenv('TRC20_INDEX_SYNC_INTERVAL', '60')),
+                      help="Seconds between sync rounds.")
+    sync.add_argument("--once", action="store_true", help="Run a single sync round and exit.")
+    sub.add_parser("stats", help="Print index coverage as JSON.")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        index = get_trc20_index()
+        print(json.dumps(index.stats() if index else {"enabled": False}, indent=2))
+        return 0
+    return run_sync(args.addresses, args.interval, args.once)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Base58Check codec for Tron addresses.
+
+Tron addresses are a 21-byte payload (0x41 prefix + 20-byte account id)
+followed by a 4-byte double-SHA256 checksum, Base58-encoded into 34
+characters starting with "T". Decoding verifies the checksum, so an address
+read by OCR with a single wrong character is rejected instead of being
+compared against our wallets.
+
+normalize_tron_address() accepts either form (hex as found in TronGrid event
+feeds, or Base58) and is memoized, since the same handful of wallets appear
+in almost every event.
+"""
+import hashlib
+from functools import lru_cache
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {ch: i for i, ch in enumerate(_B58_ALPHABET)}
+TRON_PREFIX = 0x41
+ADDRESS_LENGTH = 34
+
+def _checksum(payload: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+
+def b58encode(data: bytes) -> str:
+    n = int.from_bytes(data, "big")
+    digits = []
+    while n:
+        n, r = divmod(n, 58)
+        digits.append(_B58_ALPHABET[r])
+    pad = len(data) - len(data.lstrip(b"\0"))
+    return "1" * pad + "".join(reversed(digits))
+
+def b58decode(text: str) -> bytes | None:
+    """Returns the decoded bytes, or None if the text has characters outside the Base58 alphabet."""
+    n = 0
+    try:
+        for ch in text:
+            n = n * 58 + _B58_INDEX[ch]
+    except KeyError:
+        return None
+    pad = len(text) - len(text.lstrip("1"))
+    return b"\0" * pad + n.to_bytes((n.bit_length() + 7) // 8, "big")
+
+def b58check_encode(payload: bytes) -> str:
+    return b58encode(payload + _checksum(payload))
+
+def b58check_decode(text: str) -> bytes | None:
+    """Returns the payload when the checksum matches, otherwise None."""
+    raw = b58decode(text)
+    if raw is None or len(raw) < 5:
+        return None
+    payload, checksum = raw[:-4], raw[-4:]
+    return payload if _checksum(payload) == checksum else None
+
+def is_valid_tron_address(address: str | None) -> bool:
+    if not address or len(address) != ADDRESS_LENGTH or address[0] != "T":
+        return False
+    payload = b58check_decode(address)
+    return payload is not None and len(payload) == 21 and payload[0] == TRON_PREFIX
+
+@lru_cache(maxsize=4096)
+def _normalize(address: str) -> str | None:
+    if address.startswith("T"):
+        return address if is_valid_tron_address(address) else None
+    hex_part = address[2:] if address.startswith(("0x", "0X")) else address
+    if len(hex_part) == 40:
+        hex_part = "41" + hex_part
+    try:
+        raw = bytes.fromhex(hex_part)
+    except ValueError:
+        return None
+    if len(raw) != 21 or raw[0] != TRON_PREFIX:
+        return None
+    return b58check_encode(raw)
+
+def normalize_tron_address(address: str | None) -> str | None:
+    """Base58 form of a hex or Base58 address; None when it is malformed or fails the checksum."""
+    if not address:
+        return None
+    return _normalize(address.strip())
+
+def normalize_tron_addresses(addresses) -> list[str | None]:
+    """Batch form for event feeds; duplicates are converted once."""
+    unique = {a: normalize_tron_address(a) for a in set(addresses)}
+    return [unique[a] for a in addresses]
+
+def tron_base58_to_hex(address: str | None) -> str | None:
+    """41-prefixed hex form of a valid Base58 address."""
+    if not is_valid_tron_address(address):
+        return None
+    return b58check_decode(address).hex()
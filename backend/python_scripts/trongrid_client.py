@@ -0,0 +1,237 @@
+"""
+Shared TronGrid client for the USDT validator and the TRC-20 index sync.
+
+- One keep-alive requests.Session per process.
+- A token-bucket limiter whose state lives in a local sqlite file, so every
+  process on the host (validator service, one-shot validators, index sync)
+  draws from the same budget. Size it to the API-key tier with
+  TRONGRID_RATE_PER_SECOND / TRONGRID_BURST.
+- 429 and 5xx responses are retried with backoff (honouring Retry-After)
+  instead of surfacing as validation errors.
+- A persistent cache for results that can no longer change: transaction info
+  of solidified transactions and the events of confirmed transactions. Info
+  comes from the full node in one request; whether its block is solidified is
+  judged against a solidified head refreshed at most every
+  TRONGRID_SOLID_HEAD_REFRESH_SECONDS.
+
+    python trongrid_client.py stats
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import threading
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TRONGRID = "https://api.trongrid.io"
+DEFAULT_STATE_PATH = Path(__file__).resolve().parent / '.cache' / 'trongrid.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trongrid_bucket (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trongrid_cache (
+    cache_key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+class TronGridClient:
+    def __init__(self, api_key: str | None = None, state_path=DEFAULT_STATE_PATH, rate_per_second: float = 10.0,
+                 burst: int = 10, max_retries: int = 3, pool_size: int = 8, base_url: str = TRONGRID,
+                 solid_head_refresh_seconds: float = 30.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.metrics = {"requests": 0, "cache_hits": 0, "cache_misses": 0, "throttled": 0,
+                        "throttle_wait_seconds": 0.0, "http_429": 0, "retries": 0}
+        self._metrics_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.solid_head_refresh_seconds = solid_head_refresh_seconds
+        # (solidified block number, monotonic time it was read); see solidified_head
+        self._solid_head = (0, float("-inf"))
+        self._solid_head_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(state_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _count(self, name: str, amount=1):
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+    # --- Rate limiting ---
+    def _take_token(self) -> float:
+        """Takes one token from the shared bucket; returns 0 or the seconds to wait before retrying."""
+        now = time.time()
+        with self._db_lock:
+            # BEGIN IMMEDIATE serializes the read-modify-write across processes.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated_at FROM trongrid_bucket WHERE name = 'default'").fetchone()
+                tokens, updated_at = row if row else (float(self.burst), now)
+                tokens = min(float(self.burst), tokens + max(0.0, now - updated_at) * self.rate_per_second)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate_per_second
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO trongrid_bucket (name, tokens, updated_at) VALUES ('default', ?, ?)",
+                    (tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire(self) -> float:
+        """Blocks until the shared bucket grants a request; returns the seconds waited."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = self._take_token()
+            if not wait:
+                break
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            self._count("throttled")
+            self._count("throttle_wait_seconds", waited)
+        return waited
+
+    # --- Immutable result cache ---
+    def _cache_get(self, key: str):
+        with self._db_lock:
+            row = self._conn.execute("SELECT response FROM trongrid_cache WHERE cache_key = ?", (key,)).fetchone()
+        self._count("cache_hits" if row else "cache_misses")
+        return json.loads(row[0]) if row else None
+
+    def _cache_put(self, key: str, response):
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trongrid_cache (cache_key, response, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(response), time.time()),
+            )
+
+    # --- HTTP ---
+    def request(self, method: str, path: str, params: dict | None = None, json_body: dict | None = None,
+                api_key: str | None = None):
+        api_key = api_key or self.api_key
+        headers = {"TRON-PRO-API-KEY": api_key} if api_key else {}
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            self._count("requests")
+            r = self.session.request(method, url, params=params, json=json_body, headers=headers, timeout=30)
+            if r.status_code == 429 or r.status_code >= 500:
+                if r.status_code == 429:
+                    self._count("http_429")
+                if attempt < self.max_retries:
+                    self._count("retries")
+                    retry_after = r.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else min(8.0, 0.5 * 2 ** attempt)
+                    time.sleep(delay + random.uniform(0, 0.25))
+                    continue
+            r.raise_for_status()
+            return r.json()
+
+    def get(self, path: str, params: dict | None = None, api_key: str | None = None):
+        return self.request("GET", path, params=params, api_key=api_key)
+
+    def post(self, path: str, json_body: dict, api_key: str | None = None):
+        return self.request("POST", path, json_body=json_body, api_key=api_key)
+
+    def solidified_head(self, block_number: int, api_key: str | None = None) -> int:
+        """
+        Last known solidified block number. Refreshed from the solidity node only when block_number is
+        above it and the known value is older than solid_head_refresh_seconds, so fresh transactions
+        cost at most one extra request per interval, not one each.
+        """
+        with self._solid_head_lock:
+            head, checked_at = self._solid_head
+            if block_number <= head or time.monotonic() - checked_at < self.solid_head_refresh_seconds:
+                return head
+            block = self.post("/walletsolidity/getnowblock", {}, api_key=api_key)
+            head = int(((block.get("block_header") or {}).get("raw_data") or {}).get("number") or head)
+            self._solid_head = (head, time.monotonic())
+            return head
+
+    def get_tx_info(self, txid: str, api_key: str | None = None) -> dict:
+        key = f"txinfo:{txid}"
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        info = self.post("/wallet/gettransactioninfobyid", {"value": txid}, api_key=api_key)
+        # Only transactions in solidified blocks are cached: no fork can drop them any more.
+        block_number = info.get("blockNumber") if info else None
+        if block_number and info.get("receipt", {}).get("result") and \
+                block_number <= self.solidified_head(block_number, api_key=api_key):
+            self._cache_put(key, info)
+        return info
+
+    def get_tx_events(self, txid: str, api_key: str | None = None) -> dict:
+        key = f"events:{txid}"
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        events = self.get(f"/v1/transactions/{txid}/events", {}, api_key=api_key)
+        data = events.get("data") or []
+        if data and not any(event.get("_unconfirmed") for event in data):
+            self._cache_put(key, events)
+        return events
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM trongrid_cache").fetchone()[0]
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics["throttle_wait_seconds"] = round(metrics["throttle_wait_seconds"], 3)
+        return {"rate_per_second": self.rate_per_second, "burst": self.burst, "cache_entries": entries,
+                "process": metrics}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_trongrid_client() -> TronGridClient:
+    """Returns the process-wide client configured from the environment."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TronGridClient(
+                api_key=os.getenv("TRONGRID_API_KEY"),
+                state_path=os.getenv("TRONGRID_STATE_PATH") or DEFAULT_STATE_PATH,
+                rate_per_second=float(os.getenv("TRONGRID_RATE_PER_SECOND", "10")),
+                burst=int(os.getenv("TRONGRID_BURST", "10")),
+                max_retries=int(os.getenv("TRONGRID_MAX_RETRIES", "3")),
+                pool_size=int(os.getenv("USDT_VALIDATOR_WORKERS", "4")) * 2,
+                base_url=os.getenv("TRONGRID_BASE_URL") or TRONGRID,
+                solid_head_refresh_seconds=float(os.getenv("TRONGRID_SOLID_HEAD_REFRESH_SECONDS", "30")),
+            )
+        return _client
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+    if sys.argv[1:] != ["stats"]:
+        print("Usage: trongrid_client.py stats")
+        return 1
+    print(json.dumps(get_trongrid_client().stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
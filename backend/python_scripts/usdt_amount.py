@@ -0,0 +1,58 @@
+"""
+Exact USDT amounts as integer micro-USDT (1 USDT = 1_000_000).
+
+TRC-20 USDT has 6 decimals, so the on-chain raw value already is micro-USDT.
+Receipts and sync output are converted once at the edge; matching is then
+integer equality or a range test, with no float math per row.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, ROUND_DOWN
+
+USDT_DECIMALS = 6
+MICRO = 10 ** USDT_DECIMALS
+# On-chain values may differ from the receipt by one micro-unit of rounding.
+DEFAULT_TOLERANCE = 1
+
+_QUANTUM = Decimal(1).scaleb(-USDT_DECIMALS)
+
+def parse_usdt(value) -> int | None:
+    """Human amount ('1,234.5', 1234.5, Decimal) -> micro-USDT; None when missing, invalid or negative."""
+    if value is None or isinstance(value, bool):
+        return None
+    text = str(value).replace(",", "").replace(" ", "").strip()
+    if not text:
+        return None
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount < 0:
+        return None
+    return int(amount.quantize(_QUANTUM, rounding=ROUND_HALF_UP) * MICRO)
+
+def from_raw(value) -> int | None:
+    """On-chain raw value (string or int, already in micro-USDT) -> int."""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        pass
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    # Fractions of a micro-unit are dropped, as the previous Decimal conversion did.
+    return int(amount) if amount.is_finite() else None
+
+def format_usdt(micro: int) -> str:
+    """micro-USDT -> '1.500000', the fixed 6-decimal string stored in usdt_transactions."""
+    return str((Decimal(micro) / MICRO).quantize(_QUANTUM, rounding=ROUND_DOWN))
+
+def to_float(micro: int) -> float:
+    """For JSON outputs that have always carried a number."""
+    return micro / MICRO
+
+def amount_range(micro: int, tolerance: int = DEFAULT_TOLERANCE) -> tuple[int, int]:
+    return micro - tolerance, micro + tolerance
+
+def amounts_match(raw, micro: int, tolerance: int = DEFAULT_TOLERANCE) -> bool:
+    value = from_raw(raw)
+    return value is not None and abs(value - micro) <= tolerance
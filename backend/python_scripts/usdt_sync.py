@@ -1,19 +1,51 @@
+"""
+Fetches USDT (TRC-20) transactions of our wallets for usdtSyncService.js.
+Pages come from the fastest healthy provider in CHAIN_PROVIDERS (tokenview,
+TronGrid, Tronscan; see chain_providers.py), failing over between them.
+
+With a single address it prints one JSON array, as it always has. With
+several addresses (arguments, or one per line on stdin with "-"), wallets are
+fetched concurrently over keep-alive sessions and a shared rate limit. Each
+page is streamed as an NDJSON line tagged by wallet:
+    {"wallet": "T...", "rows": [...]}
+    {"wallet": "T...", "done": true, "count": 12, "mark": {"txid": "...", "time": 1700000000}}
+    {"wallet": "T...", "error": "..."}
+
+With --to-db the rows are upserted straight into usdt_transactions in batched
+multi-row INSERTs over one reused connection, and only counts are printed
+({"wallet": ..., "done": true, "count": 12, "inserted": 3} per wallet).
+
+Each wallet keeps a high-water mark (newest txid and its time in epoch seconds) in
+.cache/usdt_sync_state.json. Pagination runs newest-first and stops at the
+first page that reaches already-seen transactions, so a steady-state cycle
+costs one page per wallet. --backfill ignores the mark and walks deep history.
+A mark only advances once the rows are stored: with --to-db after they are
+committed; otherwise the caller passes the "mark" of each wallet it stored
+back through --commit-marks (NDJSON {"wallet": ..., "mark": ...} on stdin).
+
+    python usdt_sync.py TXyz...
+    python usdt_sync.py TXyz... TAbc... --workers 4
+    printf 'TXyz...\nTAbc...\n' | python usdt_sync.py -
+    python usdt_sync.py TXyz... --backfill --max-pages 200
+    printf 'TXyz...\nTAbc...\n' | python usdt_sync.py - --to-db
+    printf '{"wallet": "TXyz...", "mark": {...}}\n' | python usdt_sync.py --commit-marks
+"""
+import os
 import sys
 import json
-import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from decimal import Decimal, ROUND_DOWN
-from urllib.parse import urljoin
+from pathlib import Path
 import requests
+from dotenv import load_dotenv
+from rate_limit import RateLimiter
+from usdt_amount import from_raw, format_usdt
+from chain_providers import get_chain_router
 
-BASE_URL = "https://usdt.tokenview.io"
 MAX_PAGE_SIZE = 50
-
-HEADERS = {
-    "Accept": "application/json, text/plain, */*",
-    "Accept-Language": "en-US,en;q=0.9",
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
-}
+DEFAULT_STATE_PATH = Path(__file__).resolve().parent / '.cache' / 'usdt_sync_state.json'
 
 def iso8601_from_epoch(seconds: int) -> str:
     try:
@@ -21,73 +53,269 @@ def iso8601_from_epoch(seconds: int) -> str:
     except (ValueError, TypeError):
         return ""
 
-def fetch_page(session: requests.Session, address: str, page: int, page_size: int, timeout: int = 20) -> dict:
-    page_size = min(page_size, MAX_PAGE_SIZE)
-    path = f"/api/usdt/addresstxlist/{address}/{page}/{page_size}"
-    url = urljoin(BASE_URL, path)
-    headers = HEADERS.copy()
-    headers["Referer"] = f"{BASE_URL}/en/address/{address}"
-    r = session.get(url, headers=headers, timeout=timeout)
-    r.raise_for_status()
-    return r.json()
-
 def normalize_tx(tx: dict) -> dict:
-    raw_value = tx.get("value") or "0"
-    try:
-        micro = Decimal(str(raw_value))
-        usdt = (micro / Decimal(1_000_000)).quantize(Decimal("0.000001"), rounding=ROUND_DOWN)
-    except Exception:
-        usdt = Decimal("0")
+    micro = from_raw(tx.get("value") or 0) or 0
 
     return {
         "txid": tx.get("txid"),
         "time_iso": iso8601_from_epoch(tx.get("time")),
         "from_address": tx.get("from"),
         "to_address": tx.get("to"),
-        "amount_usdt": str(usdt),
+        "amount_usdt": format_usdt(micro),
+        "amount_micro": micro,
     }
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "No address provided"}))
-        sys.exit(1)
-    
-    address_to_fetch = sys.argv[1]
-    
-    session = requests.Session()
+# --- High-water marks ---
+def tx_time(tx: dict) -> int:
+    try:
+        return int(tx.get("time") or 0)
+    except (ValueError, TypeError):
+        return 0
+
+def load_state(path) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+_state_lock = threading.Lock()
+
+def save_high_water_mark(path, address: str, mark: dict):
+    """Re-reads the file before writing so concurrent runs for other wallets are not lost."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _state_lock:
+        state = load_state(path)
+        state[address] = mark
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+
+def commit_marks(path, lines) -> int:
+    """Saves {"wallet": ..., "mark": ...} NDJSON lines; returns how many marks were saved."""
+    saved = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("wallet") and record.get("mark"):
+            save_high_water_mark(path, record["wallet"], record["mark"])
+            saved += 1
+    return saved
+
+def reaches_mark(txs: list, mark: dict | None) -> bool:
+    """True once a page contains the last seen txid or anything older than it."""
+    if not mark:
+        return False
+    return any((tx.get("txid") or "").lower() == mark["txid"] or tx_time(tx) < mark["time"] for tx in txs)
+
+def fetch_wallet(address: str, mark: dict | None, max_pages: int, rate_limiter: RateLimiter,
+                 on_rows) -> tuple[int, dict | None]:
+    """
+    Calls on_rows(rows) with the normalized rows of each page; returns (row count,
+    new high-water mark). Raises requests.RequestException once every provider failed a page.
+    """
+    router = get_chain_router()
     page = 1
     txids_seen = set()
-    all_rows = []
-    max_pages = 10 # Safety limit to prevent infinite loops
+    count = 0
+    newest = None
+    # Providers order and page differently, so one walk stays on the provider that served page 1.
+    # If it fails later, the walk restarts from page 1 on another one (seen txids are not re-emitted).
+    provider = None
+    failed_providers = set()
 
     while page <= max_pages:
+        rate_limiter.acquire() # Be respectful to the API: one budget shared by every wallet
         try:
-            resp = fetch_page(session, address_to_fetch, page, MAX_PAGE_SIZE)
-            data = resp.get("data", {})
-            txs = data.get("txs", [])
-
-            if not txs:
-                break
-
-            for tx in txs:
-                txid = (tx.get("txid") or "").lower()
-                if txid and txid not in txids_seen:
-                    txids_seen.add(txid)
-                    all_rows.append(normalize_tx(tx))
-            
-            if len(txs) < MAX_PAGE_SIZE:
-                break # Reached the last page
-
-            page += 1
-            time.sleep(0.5) # Be respectful to the API
-
-        except requests.RequestException as e:
-            # Output error as JSON so Node.js can see it
-            print(json.dumps({"error": f"Failed to fetch page {page} for {address_to_fetch}: {e}"}))
-            sys.exit(1)
+            provider, txs = router.call_with_provider("transfers_page", address, page, MAX_PAGE_SIZE,
+                                                      pin=provider, exclude=failed_providers)
+        except Exception as e:
+            if provider is None:
+                raise requests.RequestException(f"Failed to fetch page {page} for {address}: {e}") from e
+            print(f"[USDT-SYNC] {provider} failed page {page} for {address}, restarting on another provider: {e}",
+                  file=sys.stderr)
+            failed_providers.add(provider)
+            provider, page = None, 1
+            continue
+
+        if not txs:
+            break
+
+        rows = []
+        for tx in txs:
+            txid = (tx.get("txid") or "").lower()
+            if txid and txid not in txids_seen:
+                txids_seen.add(txid)
+                rows.append(normalize_tx(tx))
+                if newest is None or tx_time(tx) > newest["time"]:
+                    newest = {"txid": txid, "time": tx_time(tx)}
+        if rows:
+            on_rows(rows)
+            count += len(rows)
+
+        if len(txs) < MAX_PAGE_SIZE or reaches_mark(txs, mark):
+            break # Reached the last page or transactions already seen
+
+        page += 1
+
+    if mark and (newest is None or newest["time"] < mark["time"]):
+        newest = mark
+    return count, newest
+
+# --- Direct DB mode ---
+UPSERT_SQL = (
+    "INSERT INTO usdt_transactions (txid, time_iso, from_address, to_address, amount_usdt) "
+    "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE txid=txid"
+)
+
+def mysql_datetime(time_iso: str) -> str | None:
+    """Same local-time 'YYYY-MM-DD HH:MM:SS' string usdtSyncService's formatForMySQL produces."""
+    try:
+        return datetime.fromisoformat(time_iso).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+    except (ValueError, TypeError):
+        return None
+
+class DbWriter:
+    """One MySQL connection shared by the fetch threads; each page is written as multi-row INSERTs."""
+
+    def __init__(self, batch_size: int = 500):
+        import mysql.connector
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._conn = mysql.connector.connect(
+            host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'), database=os.getenv('DB_DATABASE'),
+        )
+
+    def write(self, rows: list) -> int:
+        """Upserts rows; returns how many were new (duplicates affect 0 rows)."""
+        values = [(r["txid"], mysql_datetime(r["time_iso"]), r["from_address"], r["to_address"], r["amount_usdt"])
+                  for r in rows]
+        inserted = 0
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                for start in range(0, len(values), self.batch_size):
+                    # mysql-connector rewrites executemany INSERTs into one multi-row statement.
+                    cursor.executemany(UPSERT_SQL, values[start:start + self.batch_size])
+                    inserted += max(cursor.rowcount, 0)
+                self._conn.commit()
+            finally:
+                cursor.close()
+        return inserted
+
+    def close(self):
+        self._conn.close()
+
+def read_addresses(values: list[str]) -> list[str]:
+    """Addresses from the arguments; "-" (or no arguments with piped input) reads one per line from stdin."""
+    if not values or values == ["-"]:
+        if not values and sys.stdin.isatty():
+            return []
+        values = sys.stdin.read().split()
+    return list(dict.fromkeys(v.strip() for v in values if v.strip()))
+
+def sync_one(address: str, args, rate_limiter: RateLimiter):
+    """Legacy single-wallet mode: prints one JSON array (or {"error": ...}); the mark is not advanced."""
+    mark = None if args.backfill else load_state(args.state_path).get(address)
+    all_rows = []
+    try:
+        fetch_wallet(address, mark, args.max_pages, rate_limiter, all_rows.extend)
+    except requests.RequestException as e:
+        # Output error as JSON so Node.js can see it
+        print(json.dumps({"error": str(e)}))
+        sys.exit(1)
 
     # Output the final result as a single JSON line
     print(json.dumps(all_rows))
 
+def sync_many(addresses: list[str], args, rate_limiter: RateLimiter, writer: DbWriter | None = None):
+    """Fetches wallets concurrently, streaming NDJSON lines tagged by wallet (only counts with a writer)."""
+    state = {} if args.backfill else load_state(args.state_path)
+    output_lock = threading.Lock()
+
+    def emit(record: dict):
+        line = json.dumps(record)
+        with output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def run(address: str):
+        inserted = 0
+        def on_rows(rows):
+            nonlocal inserted
+            if writer:
+                inserted += writer.write(rows)
+            else:
+                emit({"wallet": address, "rows": rows})
+        try:
+            count, newest = fetch_wallet(address, state.get(address), args.max_pages, rate_limiter, on_rows)
+        except Exception as e:  # fetch errors, and DB errors in --to-db mode
+            emit({"wallet": address, "error": str(e)})
+            return
+        done = {"wallet": address, "done": True, "count": count}
+        if writer:
+            # Every page is committed by now.
+            if newest:
+                save_high_water_mark(args.state_path, address, newest)
+            done["inserted"] = inserted
+        elif newest:
+            done["mark"] = newest  # saved via --commit-marks once the caller has stored the rows
+        emit(done)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        list(pool.map(run, addresses))
+
+def main():
+    load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+    parser = argparse.ArgumentParser(description="Fetch USDT transactions of wallets from the chain providers.")
+    parser.add_argument("addresses", nargs="*", help="Tron wallet addresses, or - to read them from stdin.")
+    parser.add_argument("--ndjson", action="store_true", help="Stream NDJSON even for a single address.")
+    parser.add_argument("--to-db", action="store_true",
+                        help="Upsert rows directly into usdt_transactions and print only counts.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("USDT_SYNC_WORKERS", "4")),
+                        help="Wallets fetched concurrently.")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Ignore the high-water mark and walk up to --max-pages of history.")
+    parser.add_argument("--max-pages", type=int,
+                        help="Page limit (default: 10, or USDT_SYNC_BACKFILL_PAGES with --backfill).")
+    parser.add_argument("--commit-marks", action="store_true",
+                        help="Save the high-water marks read as NDJSON from stdin, then exit.")
+    parser.add_argument("--state-path", default=os.getenv("USDT_SYNC_STATE_PATH") or DEFAULT_STATE_PATH,
+                        help="High-water mark file.")
+    args = parser.parse_args()
+
+    if args.commit_marks:
+        print(json.dumps({"saved": commit_marks(args.state_path, sys.stdin)}))
+        return
+
+    addresses = read_addresses(args.addresses)
+    if not addresses:
+        print(json.dumps({"error": "No address provided"}))
+        sys.exit(1)
+
+    args.max_pages = args.max_pages or (int(os.getenv("USDT_SYNC_BACKFILL_PAGES", "200")) if args.backfill else 10)
+    # Minimum spacing between page requests across all wallets.
+    page_delay = float(os.getenv("USDT_SYNC_PAGE_DELAY", "0.2"))
+    rate_limiter = RateLimiter(60.0 / page_delay if page_delay > 0 else 0)
+
+    if args.to_db:
+        try:
+            writer = DbWriter(int(os.getenv("USDT_SYNC_DB_BATCH", "500")))
+        except Exception as e:
+            print(json.dumps({"error": f"Could not connect to the database: {e}"}))
+            sys.exit(1)
+        try:
+            sync_many(addresses, args, rate_limiter, writer)
+        finally:
+            writer.close()
+    elif len(addresses) == 1 and not args.ndjson and args.addresses != ["-"]:
+        sync_one(addresses[0], args, rate_limiter)
+    else:
+        sync_many(addresses, args, rate_limiter)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
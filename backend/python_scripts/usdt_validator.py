@@ -1,76 +1,28 @@
 import os
-import re
 import sys
 import json
-import hashlib
-import requests
-from io import BytesIO
-from PIL import Image
+import asyncio
+import argparse
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from utils import preprocess_image, get_vision_model, get_gemini_client
+from ocr_backends import get_ocr_router
+from trc20_index import get_trc20_index
+from trongrid_client import get_trongrid_client
+from chain_providers import TxNotFound, get_chain_router
+from tron_address import normalize_tron_address
+from usdt_amount import parse_usdt, amounts_match, amount_range, from_raw, to_float
 
 # --- Constants ---
 USDT_TRON_CONTRACT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
-USDT_DECIMALS = 6
-TRONGRID = "https://api.trongrid.io"
-
-# --- Address Normalization ---
-_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
-
-def _b58encode(b: bytes) -> str:
-    n = int.from_bytes(b, "big")
-    res = ""
-    while n > 0:
-        n, r = divmod(n, 58)
-        res = _B58_ALPHABET[r] + res
-    pad = 0
-    for ch in b:
-        if ch == 0:
-            pad += 1
-        else:
-            break
-    return "1" * pad + res
-
-def _b58check_encode(payload: bytes) -> str:
-    chk = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
-    return _b58encode(payload + chk)
-
-def tron_hex_to_base58(addr: str) -> str | None:
-    if not addr: return None
-    a = addr.strip()
-    if a.startswith("T") and len(a) >= 34: return a
-    if a.startswith(("0x", "0X")): a = a[2:]
-    if len(a) == 40: a = "41" + a
-    try:
-        raw = bytes.fromhex(a)
-    except ValueError:
-        return None
-    if len(raw) != 21 or raw[0] != 0x41: return None
-    return _b58check_encode(raw)
-
-def normalize_tron_address(addr: str) -> str | None:
-    return tron_hex_to_base58(addr)
 
 # --- Helpers ---
-def extract_txid_from_url(url: str) -> str | None:
-    m = re.search(r'/transaction/([0-9a-fA-F]{64})', url or "")
-    return m.group(1) if m else None
-
-def load_image_bytes(path: str) -> bytes:
-    with Image.open(path) as im:
-        buf = BytesIO()
-        im.save(buf, format=im.format or "PNG")
-        return buf.getvalue()
-
-def safe_json_loads(s: str) -> dict:
-    s = (s or "").strip()
-    s = re.sub(r"^```json\s*|\s*```$", "", s)
-    try:
-        return json.loads(s)
-    except json.JSONDecodeError:
-        m = re.search(r"\{[\s\S]*\}", s)
-        if m: return json.loads(m.group(0))
-        return {}
+def load_image_bytes(path: str) -> tuple[bytes, str]:
+    """Reads a receipt and runs it through the shared pre-processing; returns (bytes, mime_type)."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    data, mime_type, _ = preprocess_image(raw)
+    return data, mime_type or "image/png"
 
 def parse_utc(ts_str: str | None) -> datetime | None:
     if not ts_str: return None
@@ -81,167 +33,197 @@ def parse_utc(ts_str: str | None) -> datetime | None:
     except ValueError:
         return None
 
-# --- Gemini ---
-def call_gemini_extract(image_bytes: bytes, model_name: str, google_api_key: str) -> dict:
-    import google.generativeai as genai
-    genai.configure(api_key=google_api_key)
-
-    system_prompt = """
-    You are an invoice OCR/IE agent for USDT TRC-20 receipts. Extract ONLY these fields and return STRICT JSON.
-    {
-      "txid": "string | null (The 64-character transaction hash)",
-      "explorer_url": "string | null (If a URL like tronscan.org/... is present)",
-      "from_address": "string | null (The sender's 'T...' address)",
-      "to_address": "string | null (The recipient's 'T...' address)",
-      "amount": "number | null (The amount of USDT, always positive)",
-      "timestamp": "string | null (The UTC timestamp of the transaction if available, e.g., '2025-11-05 11:47:45')"
-    }
-    """
-    img_part = {"mime_type": "image/png", "data": image_bytes}
-    model = genai.GenerativeModel(model_name)
-    resp = model.generate_content(
-        [{"text": system_prompt}, img_part],
-        generation_config={"temperature": 0.0, "response_mime_type": "application/json"}
-    )
-    return safe_json_loads(getattr(resp, "text", "") or "{}")
+# --- OCR ---
+def extract_receipt_fields(image_bytes: bytes, mime_type: str, model_name: str) -> dict:
+    """Routes the receipt through the OCR backends (local engine first, Gemini fallback)."""
+    return get_ocr_router(model_name).extract(image_bytes, mime_type, kind="usdt").data or {}
 
 # --- TronGrid ---
+# Calls go through the shared client: keep-alive session, host-wide rate limit,
+# 429 retries and the immutable-result cache.
 def trongrid_post(path: str, json_body: dict, api_key: str):
-    r = requests.post(f"{TRONGRID}{path}", json=json_body, headers={"TRON-PRO-API-KEY": api_key}, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return get_trongrid_client().post(path, json_body, api_key=api_key)
 
 def trongrid_get(path: str, params: dict, api_key: str):
-    r = requests.get(f"{TRONGRID}{path}", params=params, headers={"TRON-PRO-API-KEY": api_key}, timeout=30)
-    r.raise_for_status()
-    return r.json()
-
-def get_tx_info(txid: str, api_key: str) -> dict:
-    return trongrid_post("/wallet/gettransactioninfobyid", {"value": txid}, api_key)
+    return get_trongrid_client().get(path, params, api_key=api_key)
 
 def get_latest_block(api_key: str) -> int | None:
     j = trongrid_post("/wallet/getnowblock", {}, api_key)
     return (j.get("block_header", {}).get("raw_data", {})).get("number")
 
-def compare_amounts(onchain_value_raw: str | int, invoice_amount: float, decimals: int = USDT_DECIMALS, tol=1):
-    try:
-        raw = int(onchain_value_raw)
-    except (ValueError, TypeError):
-        return False
-    target_raw = int(round(invoice_amount * (10 ** decimals)))
-    return abs(raw - target_raw) <= tol
-
 # --- TxID Discovery ---
-def find_candidate_txids(to_address_b58: str, amount_human: float, approx_utc: datetime | None, trongrid_key: str, window_minutes: int, max_pages: int = 5):
-    params = {
-        "limit": 200, "contract_address": USDT_TRON_CONTRACT,
-        "only_confirmed": "true", "order_by": "block_timestamp,desc"
-    }
+def find_candidate_txids(to_address_b58: str, amount_micro: int, approx_utc: datetime | None, trongrid_key: str, window_minutes: int, max_pages: int = 5):
+    """Looks the transfer up in the local TRC-20 index; scans TronGrid only when the index cannot answer."""
     if approx_utc:
-        lo = int((approx_utc - timedelta(minutes=window_minutes)).timestamp() * 1000)
-        hi = int((approx_utc + timedelta(minutes=window_minutes)).timestamp() * 1000)
-        params["min_timestamp"] = lo
-
-    headers = {"TRON-PRO-API-KEY": trongrid_key}
-    url = f"{TRONGRID}/v1/accounts/{to_address_b58}/transactions/trc20"
-    amount_raw_target = int(round(amount_human * (10 ** USDT_DECIMALS)))
-    
+        index = get_trc20_index()
+        if index is not None:
+            lo = int((approx_utc - timedelta(minutes=window_minutes)).timestamp() * 1000)
+            hi = min(int((approx_utc + timedelta(minutes=window_minutes)).timestamp() * 1000),
+                     int(datetime.now(timezone.utc).timestamp() * 1000))
+            try:
+                rows = index.find(to_address_b58, amount_micro, lo, hi, trongrid_key)
+                if rows is not None:
+                    return rows
+            except Exception as e:
+                print(f"[TRC20-INDEX] Lookup failed, scanning TronGrid: {e}", file=sys.stderr)
+    return scan_candidate_txids(to_address_b58, amount_micro, approx_utc, window_minutes, max_pages)
+
+def scan_candidate_txids(to_address_b58: str, amount_micro: int, approx_utc: datetime | None, window_minutes: int, max_pages: int = 5):
+    """Scans the wallet's recent incoming transfers on the fastest healthy chain provider."""
+    min_timestamp = int((approx_utc - timedelta(minutes=window_minutes)).timestamp() * 1000) if approx_utc else 0
+    rows = get_chain_router().call("incoming_transfers", to_address_b58, min_timestamp, max_pages)
+    amount_lo, amount_hi = amount_range(amount_micro)
+
     candidates = []
-    fingerprint = None
-    for _ in range(max_pages):
-        q = dict(params)
-        if fingerprint: q["fingerprint"] = fingerprint
-        r = requests.get(url, params=q, headers=headers, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-
-        for row in data.get("data", []):
-            if (row.get("token_info", {}).get("address") != USDT_TRON_CONTRACT or 
-                row.get("to") != to_address_b58):
-                continue
-            if not compare_amounts(row.get("value", "0"), amount_human):
-                continue
-            
-            candidates.append((row["transaction_id"], row["block_timestamp"]))
-
-        fingerprint = (data.get("meta", {})).get("fingerprint")
-        if not fingerprint: break
-    
+    for row in rows:
+        if row.get("to") != to_address_b58:
+            continue
+        value = from_raw(row.get("value"))
+        if value is None or not amount_lo <= value <= amount_hi:
+            continue
+        candidates.append((row["txid"], row["timestamp_ms"]))
+
     return sorted(candidates, key=lambda x: x[1], reverse=True)
 
+# --- Chain Verification ---
+def check_transfer(txid: str, tx: dict | None, to_address_b58: str, amount_micro: int) -> dict:
+    """tx is a chain_providers tx_transfers result, or None when no provider knows the transaction."""
+    if not tx or not tx["success"]:
+        return {"status": "CHAIN_REJECTED", "reason": "Transaction not found or failed on-chain."}
+    for transfer in tx["transfers"]:
+        if (transfer["contract"] == USDT_TRON_CONTRACT and transfer["to"] == to_address_b58
+                and amounts_match(transfer["value"], amount_micro)):
+            return {"status": "CONFIRMED", "txid": txid, "amount": to_float(amount_micro)}
+    return {"status": "VALIDATION_FAILED", "reason": "TxID was valid but event details did not match."}
+
+async def verify_txid(txid: str, to_address_b58: str, amount_micro: int) -> dict:
+    """Looks the transaction up on the fastest healthy provider, failing over to the others."""
+    try:
+        tx = await asyncio.to_thread(get_chain_router().call, "tx_transfers", txid)
+    except TxNotFound:
+        tx = None
+    return check_transfer(txid, tx, to_address_b58, amount_micro)
+
+async def verify_candidates(candidates, to_address_b58: str, amount_micro: int, approx_utc: datetime,
+                            max_candidates: int | None = None) -> dict:
+    """
+    Verifies the discovery candidates closest in time to the message in parallel
+    and returns the closest confirmed one; otherwise the closest candidate's failure.
+    """
+    max_candidates = max_candidates or int(os.getenv("USDT_VALIDATOR_MAX_CANDIDATES", "5"))
+    approx_ms = approx_utc.timestamp() * 1000
+    ordered = sorted(candidates, key=lambda c: abs(c[1] - approx_ms))[:max_candidates]
+    results = await asyncio.gather(
+        *(verify_txid(txid, to_address_b58, amount_micro) for txid, _ in ordered),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, dict) and result["status"] == "CONFIRMED":
+            return result
+    first = results[0]
+    if isinstance(first, Exception):
+        raise first
+    return first
+
 # --- Main Logic ---
-def main():
-    if len(sys.argv) < 5:
-        print(json.dumps({"status": "ERROR", "reason": "Insufficient arguments"}))
-        sys.exit(1)
+_MISSING_KEYS = {"status": "ERROR", "reason": "Missing API keys in .env"}
 
-    image_path = sys.argv[1]
-    discover_flag = sys.argv[2] == '--discover-txid'
-    our_wallets_json = sys.argv[3]
-    message_timestamp_utc = sys.argv[4]
+def has_api_keys() -> bool:
+    return bool(os.getenv("GOOGLE_API_KEY") and os.getenv("TRONGRID_API_KEY"))
 
-    load_dotenv()
-    google_api_key = os.getenv("GOOGLE_API_KEY")
+def validate_usdt_receipt(image_path: str, our_wallets, message_timestamp_utc: str | None = None,
+                          discover_txid: bool = False) -> dict:
+    """Runs OCR and on-chain verification for one receipt; returns the status dict the CLI prints."""
     trongrid_api_key = os.getenv("TRONGRID_API_KEY")
     model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    if not has_api_keys():
+        return dict(_MISSING_KEYS)
 
-    if not all([google_api_key, trongrid_api_key]):
-        print(json.dumps({"status": "ERROR", "reason": "Missing API keys in .env"}))
-        sys.exit(1)
-
-    our_wallets = set(json.loads(our_wallets_json))
-
+    our_wallets = set(our_wallets)
     try:
-        img_bytes = load_image_bytes(image_path)
-        extracted = call_gemini_extract(img_bytes, model_name, google_api_key)
-
-        if not extracted.get("txid") and extracted.get("explorer_url"):
-            extracted["txid"] = extract_txid_from_url(extracted["explorer_url"])
+        img_bytes, mime_type = load_image_bytes(image_path)
+        extracted = extract_receipt_fields(img_bytes, mime_type, model_name)
 
         to_addr_invoice = normalize_tron_address(extracted.get("to_address"))
-        amount_invoice = float(extracted.get("amount", 0))
+        amount_invoice = parse_usdt(extracted.get("amount")) or 0
         txid = extracted.get("txid")
 
+        if extracted.get("to_address") and not to_addr_invoice:
+            return {"status": "OCR_FAILURE", "reason": "Recipient address failed the Base58Check checksum (likely misread)."}
         if not to_addr_invoice or amount_invoice <= 0:
-            print(json.dumps({"status": "OCR_FAILURE", "reason": "Missing recipient address or amount from OCR."}))
-            return
+            return {"status": "OCR_FAILURE", "reason": "Missing recipient address or amount from OCR."}
 
         is_incoming = to_addr_invoice in our_wallets
         if not is_incoming:
-            print(json.dumps({"status": "OUTGOING", "reason": "Recipient address not in our wallet list."}))
-            return
+            return {"status": "OUTGOING", "reason": "Recipient address not in our wallet list."}
 
-        if not txid and discover_flag:
+        if not txid and discover_txid:
             approx_time = parse_utc(message_timestamp_utc) or datetime.now(timezone.utc)
             candidates = find_candidate_txids(to_addr_invoice, amount_invoice, approx_time, trongrid_api_key, window_minutes=180)
-            if candidates:
-                txid = candidates[0][0]
-            else:
-                print(json.dumps({"status": "DISCOVERY_FAILED", "reason": "Could not find a matching transaction on-chain."}))
-                return
+            if not candidates:
+                return {"status": "DISCOVERY_FAILED", "reason": "Could not find a matching transaction on-chain."}
+            return asyncio.run(verify_candidates(candidates, to_addr_invoice, amount_invoice, approx_time))
 
         if not txid:
-            print(json.dumps({"status": "MANUAL_REQUIRED", "reason": "Incoming transaction but no TxID found on receipt."}))
-            return
-
-        info = get_tx_info(txid, trongrid_api_key)
-        if not info or info.get("receipt", {}).get("result") != "SUCCESS":
-            print(json.dumps({"status": "CHAIN_REJECTED", "reason": "Transaction not found or failed on-chain."}))
-            return
-
-        events = trongrid_get(f"/v1/transactions/{txid}/events", {}, trongrid_api_key).get("data", [])
-        
-        for event in events:
-            if event.get("contract_address") == USDT_TRON_CONTRACT and event.get("event_name") == "Transfer":
-                ev_to = normalize_tron_address(event.get("result", {}).get("to"))
-                if ev_to == to_addr_invoice and compare_amounts(event.get("result", {}).get("value"), amount_invoice):
-                    print(json.dumps({"status": "CONFIRMED", "txid": txid, "amount": amount_invoice}))
-                    return
-        
-        print(json.dumps({"status": "VALIDATION_FAILED", "reason": "TxID was valid but event details did not match."}))
+            return {"status": "MANUAL_REQUIRED", "reason": "Incoming transaction but no TxID found on receipt."}
+
+        return asyncio.run(verify_txid(txid, to_addr_invoice, amount_invoice))
 
     except Exception as e:
-        print(json.dumps({"status": "ERROR", "reason": str(e)}))
+        return {"status": "ERROR", "reason": str(e)}
+
+def handle_validate(request):
+    """Server-mode handler for {"op": "validate", "image_path", "wallets", "message_timestamp_utc", "discover_txid"}."""
+    if not request.get("image_path"):
+        return {"status": "ERROR", "reason": "No image_path provided"}
+    return validate_usdt_receipt(
+        request["image_path"], request.get("wallets") or [],
+        request.get("message_timestamp_utc"), bool(request.get("discover_txid")),
+    )
+
+def serve_main(argv):
+    from ndjson_server import serve
+    parser = argparse.ArgumentParser(description="Resident USDT receipt validator speaking newline-delimited JSON.")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--socket", default=os.getenv("USDT_VALIDATOR_SOCKET_PATH"),
+                        help="Unix socket path (default: USDT_VALIDATOR_SOCKET_PATH, else stdin/stdout).")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("USDT_VALIDATOR_WORKERS", "4")),
+                        help="Maximum concurrent validate requests.")
+    args = parser.parse_args(argv)
+
+    # Warm the Gemini model, async client, OCR router and chain clients before the first request.
+    model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    get_vision_model(model_name)
+    get_gemini_client()
+    get_ocr_router(model_name)
+    get_trongrid_client()
+    get_chain_router()
+    serve({
+        "validate": handle_validate,
+        "trongrid_stats": lambda request: get_trongrid_client().stats(),
+        "chain_stats": lambda request: get_chain_router().stats(),
+    }, socket_path=args.socket, max_concurrency=args.workers)
+
+def main():
+    load_dotenv()
+    if "--serve" in sys.argv[1:]:
+        serve_main(sys.argv[1:])
+        return
+
+    if len(sys.argv) < 5:
+        print(json.dumps({"status": "ERROR", "reason": "Insufficient arguments"}))
+        sys.exit(1)
+
+    image_path = sys.argv[1]
+    discover_flag = sys.argv[2] == '--discover-txid'
+    our_wallets_json = sys.argv[3]
+    message_timestamp_utc = sys.argv[4]
+
+    if not has_api_keys():
+        print(json.dumps(_MISSING_KEYS))
+        sys.exit(1)
+
+    print(json.dumps(validate_usdt_receipt(image_path, json.loads(our_wallets_json), message_timestamp_utc, discover_flag)))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
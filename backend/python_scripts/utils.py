@@ -1,11 +1,27 @@
 import json
 import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from io import BytesIO
 from prompts import prompt_2
+from receipt_schema import INVOICE_RESPONSE_SCHEMA, parse_model_json, validate_receipt
 import google.generativeai as genai
-from pdf2image import convert_from_path
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from PIL import Image, ImageOps
 
 # Do NOT configure the API key here at the top level.
 
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+
+# Configured models are shared by every call in this process, so resident
+# workers (main.py --serve) only pay the client setup once.
+_vision_models = {}
+_vision_model_lock = threading.Lock()
+
 def _configure_genai():
     """Helper function to configure the API key just in time."""
     api_key = os.getenv('GOOGLE_API_KEY')
@@ -15,33 +31,231 @@ def _configure_genai():
         # This will cause the main script to fail with a clear error
         raise ValueError("GOOGLE_API_KEY is not set in the environment.")
 
-def clean_text_and_load_json(response_text):
-    try:
-        start = response_text.find('{')
-        end = response_text.rfind('}') + 1
-        if start == -1 or end == 0:
+def get_vision_model(model_name=None):
+    """Returns the process-wide GenerativeModel for model_name, configuring the API key on first use."""
+    model_name = model_name or GEMINI_MODEL
+    with _vision_model_lock:
+        if model_name not in _vision_models:
+            if not _vision_models:
+                _configure_genai()
+            _vision_models[model_name] = genai.GenerativeModel(model_name=model_name)
+        return _vision_models[model_name]
+
+# --- Async Gemini client ---
+def _is_retryable(exc):
+    """Timeouts, 429s and 5xx responses are worth another attempt; everything else is final."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+class GeminiClient:
+    """
+    asyncio front-end for generate_content with per-call deadlines, jittered
+    exponential retries on 429/5xx, a concurrency semaphore and optional
+    hedged requests (a second attempt is fired once the first exceeds the
+    observed p95 latency, and whichever finishes first wins).
+
+    The client owns a background event loop, so synchronous callers (threads
+    in main.py --serve/--batch, usdt_validator) share one semaphore and one
+    latency history with async callers. An optional rate_limiter
+    (rate_limit.RateLimiter) is taken once per generate call, before its
+    deadline starts; retries and hedges of that call do not take it again.
+    """
+
+    def __init__(self, max_concurrency=4, timeout=60.0, max_retries=3, backoff_base=1.0, backoff_max=20.0,
+                 hedge=False, hedge_min_samples=20, rate_limiter=None):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "timeouts": 0, "failures": 0}
+        self._latencies = deque(maxlen=200)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="gemini-client", daemon=True).start()
+
+    def _hedge_delay(self):
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
             return None
+        ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    async def _attempt(self, model, contents, generation_config, timeout):
+        async with self._semaphore:
+            started = time.monotonic()
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, generation_config=generation_config), timeout
+            )
+            self._latencies.append(time.monotonic() - started)
+            return response
 
-        json_str = response_text[start:end]
-        response_dict = json.loads(json_str)
-        
-        response_dict["transaction_id"] = response_dict.get("transaction_id", "").replace("O", "0")
-        return response_dict
-    except (json.JSONDecodeError, TypeError):
+    async def _hedged_attempt(self, model, contents, generation_config, timeout):
+        delay = self._hedge_delay()
+        first = asyncio.ensure_future(self._attempt(model, contents, generation_config, timeout))
+        if delay is None or delay >= timeout:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.stats["hedges"] += 1
+        pending = {first, asyncio.ensure_future(self._attempt(model, contents, generation_config, timeout - delay))}
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+
+    async def agenerate(self, contents, model_name=None, generation_config=None, deadline=None):
+        """Awaitable generate_content; `deadline` caps the total seconds spent across all retries."""
+        model = get_vision_model(model_name)
+        if self.rate_limiter:
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        self.stats["calls"] += 1
+        give_up_at = time.monotonic() + (deadline or self.timeout * (self.max_retries + 1))
+        attempt = 0
+        while True:
+            remaining = give_up_at - time.monotonic()
+            try:
+                return await self._hedged_attempt(model, contents, generation_config, min(self.timeout, remaining))
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if not _is_retryable(e) or attempt >= self.max_retries or time.monotonic() + backoff >= give_up_at:
+                    self.stats["failures"] += 1
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff)
+
+    def submit(self, contents, **kwargs):
+        """Schedules a call on the client loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self.agenerate(contents, **kwargs), self._loop)
+
+    def generate(self, contents, **kwargs):
+        """Blocking wrapper for synchronous callers."""
+        return self.submit(contents, **kwargs).result()
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client():
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = GeminiClient(
+                max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')),
+                timeout=float(os.getenv('GEMINI_TIMEOUT_SECONDS', '60')),
+                max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '3')),
+                hedge=_env_flag('GEMINI_HEDGE', '0'),
+                hedge_min_samples=int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20')),
+            )
+        return _gemini_client
+
+def clean_text_and_load_json(response_text):
+    """Parses and normalizes an invoice OCR reply; None when it holds no JSON object."""
+    response_dict = parse_model_json(response_text)
+    if response_dict is None:
         return None
+    return validate_receipt(response_dict, kind="invoice")[0]
+
+# --- Image pre-processing ---
+_PIL_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() not in ('0', 'false', 'no', '')
 
-def gemini_img_ocr(image_data, file_extension):
+def preprocess_settings():
+    """Reads the pre-processing knobs at call time so scripts that load .env late still see them."""
+    return {
+        "enabled": _env_flag('OCR_IMAGE_PREPROCESS', '1'),
+        "max_dim": int(os.getenv('OCR_IMAGE_MAX_DIM', '1600')),
+        "grayscale": _env_flag('OCR_IMAGE_GRAYSCALE', '0'),
+        "format": os.getenv('OCR_IMAGE_FORMAT', 'JPEG').strip().upper(),
+        "quality": int(os.getenv('OCR_IMAGE_QUALITY', '85')),
+    }
+
+def preprocess_signature(settings=None):
+    """Short string identifying the pre-processing config, used to key cached OCR results."""
+    s = settings or preprocess_settings()
+    if not s["enabled"]:
+        return "raw"
+    return f"{s['max_dim']}-{'L' if s['grayscale'] else 'C'}-{s['format']}{s['quality']}"
+
+def preprocess_image(image_data, settings=None):
+    """
+    Shrinks a receipt image before upload: EXIF-aware rotation, downscale to
+    max_dim on the longest side, optional grayscale and re-encode.
+    Returns (bytes, mime_type, stats); the original bytes are kept whenever
+    re-encoding would not make the payload smaller or PIL cannot read it, and
+    mime_type is None when the caller should derive it from the file extension.
+    """
+    s = settings or preprocess_settings()
+    started = time.perf_counter()
+    stats = {"bytes_in": len(image_data), "bytes_out": len(image_data), "size_in": None, "size_out": None, "elapsed_ms": 0.0}
+    if not s["enabled"]:
+        return image_data, None, stats
+    try:
+        with Image.open(BytesIO(image_data)) as im:
+            original_mime = _PIL_MIME_TYPES.get(im.format, f"image/{(im.format or 'png').lower()}")
+            stats["size_in"] = stats["size_out"] = im.size
+            out = ImageOps.exif_transpose(im)
+            if max(out.size) > s["max_dim"]:
+                out.thumbnail((s["max_dim"], s["max_dim"]), Image.LANCZOS)
+            if s["grayscale"]:
+                out = out.convert("L")
+            elif out.mode not in ("RGB", "L") and s["format"] == "JPEG":
+                # JPEG has no alpha channel; flatten transparent screenshots onto white.
+                rgba = out.convert("RGBA")
+                out = Image.new("RGB", rgba.size, (255, 255, 255))
+                out.paste(rgba, mask=rgba.split()[3])
+
+            buf = BytesIO()
+            out.save(buf, format=s["format"], quality=s["quality"], optimize=True)
+            encoded = buf.getvalue()
+            stats["size_out"] = out.size
+    except Exception as e:
+        print(f"[OCR-PREPROCESS] Skipping pre-processing: {e}", file=sys.stderr)
+        return image_data, None, stats
+    finally:
+        stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    if len(encoded) >= len(image_data) and stats["size_out"] == stats["size_in"]:
+        return image_data, original_mime, stats
+    stats["bytes_out"] = len(encoded)
+    return encoded, _PIL_MIME_TYPES.get(s["format"], "image/jpeg"), stats
+
+# Constrains every invoice OCR reply to the receipt_schema shape.
+INVOICE_GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "response_mime_type": "application/json",
+    "response_schema": INVOICE_RESPONSE_SCHEMA,
+}
+
+def image_mime_type(file_extension):
+    return "image/jpeg" if file_extension in [".jpg", ".jpeg"] else f"image/{file_extension.strip('.')}"
+
+def gemini_img_ocr(image_data, file_extension, mime_type=None, model_name=None, prompt=None):
     try:
-        # === THE FIX: Configure the library right before using it ===
-        _configure_genai()
-        
-        vision_model = genai.GenerativeModel(model_name="gemini-2.5-flash")
-        mime_type = "image/jpeg" if file_extension in [".jpg", ".jpeg"] else f"image/{file_extension.strip('.')}"
+        mime_type = mime_type or image_mime_type(file_extension)
         contents = [
             {"mime_type": mime_type, "data": image_data},
-            {"text": prompt_2},
+            {"text": prompt or prompt_2},
         ]
-        response = vision_model.generate_content(contents)
+        response = get_gemini_client().generate(
+            contents, model_name=model_name, generation_config=INVOICE_GENERATION_CONFIG)
         return response.text
     except Exception as e:
         # Return the actual error message for better debugging
@@ -49,17 +263,60 @@ def gemini_img_ocr(image_data, file_extension):
 
 def gemini_pdf_ocr(pdf_data):
     try:
-        # === THE FIX: Configure the library right before using it ===
-        _configure_genai()
-        
-        vision_model = genai.GenerativeModel(model_name="gemini-2.5-flash")
         mime_type = "application/pdf"
         contents = [
             {"mime_type": mime_type, "data": pdf_data},
             {"text": prompt_2},
         ]
-        response = vision_model.generate_content(contents)
+        response = get_gemini_client().generate(contents, generation_config=INVOICE_GENERATION_CONFIG)
         return response.text
     except Exception as e:
         # Return the actual error message for better debugging
-        return json.dumps({"error": f"Gemini API Error: {str(e)}"})
\ No newline at end of file
+        return json.dumps({"error": f"Gemini API Error: {str(e)}"})
+
+# --- Multi-page PDFs ---
+def pdf_page_count(pdf_data):
+    return int(pdfinfo_from_bytes(pdf_data).get("Pages", 1))
+
+def iter_pdf_page_images(pdf_data, page_count, dpi=None):
+    """Rasterizes one page at a time, so only the page being encoded is held as a bitmap."""
+    dpi = dpi or int(os.getenv('OCR_PDF_DPI', '200'))
+    for page in range(1, page_count + 1):
+        images = convert_from_bytes(pdf_data, dpi=dpi, first_page=page, last_page=page)
+        if not images:
+            continue
+        buf = BytesIO()
+        images[0].convert("RGB").save(buf, format="JPEG", quality=90)
+        images[0].close()
+        yield page, buf.getvalue()
+
+def _page_result(future):
+    try:
+        return clean_text_and_load_json(future.result().text) or {}
+    except Exception as e:
+        return {"error": f"Gemini API Error: {str(e)}"}
+
+def gemini_pdf_ocr_pages(pdf_data):
+    """
+    Returns one receipt dict per PDF page. Single-page PDFs go to Gemini as a
+    PDF in one call (the original path); longer documents are rasterized page
+    by page and every page is submitted as soon as it is rendered, so pages
+    are extracted concurrently (bounded by the Gemini client semaphore).
+    """
+    try:
+        page_count = pdf_page_count(pdf_data)
+    except Exception as e:
+        print(f"[PDF-OCR] Could not read page count, sending whole PDF: {e}", file=sys.stderr)
+        page_count = 1
+    if page_count <= 1:
+        return [clean_text_and_load_json(gemini_pdf_ocr(pdf_data)) or {}]
+
+    client = get_gemini_client()
+    futures = []
+    for _, page_image in iter_pdf_page_images(pdf_data, page_count):
+        image_data, mime_type, _ = preprocess_image(page_image)
+        futures.append(client.submit(
+            [{"mime_type": mime_type or "image/jpeg", "data": image_data}, {"text": prompt_2}],
+            generation_config=INVOICE_GENERATION_CONFIG,
+        ))
+    return [_page_result(future) for future in futures]
@@ -5,7 +5,6 @@ import os
 import sys
 import json
 import time
-import re
 import typing as t
 import base64
 from dataclasses import dataclass
@@ -17,6 +16,8 @@ from dotenv import load_dotenv
 import requests
 import mysql.connector
 
+from telegram_parsing import normalize_name
+
 # --- Load Environment Variables ---
 load_dotenv()
 
@@ -135,12 +136,6 @@ class XPayzClient:
 def get_db_connection():
     return mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_DATABASE)
 
-def normalize_name(name: str) -> str:
-    if not name: return ""
-    name = re.sub(r'[\d.,-]', '', name)
-    name = re.sub(r'\b(ltda|me|sa|eireli|epp)\b', '', name, flags=re.IGNORECASE)
-    return re.sub(r'\s+', ' ', name).strip().lower()
-
 def save_transactions_to_db(subaccount_id: int, transactions: list[Transaction]):
     db = get_db_connection()
     cursor = db.cursor()
@@ -5,6 +5,7 @@ const fsSync = require("fs");
 const pool = require("../config/db");
 const path = require("path");
 const os = require("os");
+const net = require("net");
 const dotenv = require("dotenv");
 const { Queue, Worker } = require("bullmq");
 const cron = require("node-cron");
@@ -74,6 +75,76 @@ const moveFileSafely = async (sourcePath, destinationPath) => {
   }
 };
 
+const OCR_SOCKET_PATH = (process.env.OCR_SOCKET_PATH || "").trim();
+const OCR_SOCKET_TIMEOUT_MS = parseInt(
+  process.env.OCR_SOCKET_TIMEOUT_MS || "120000",
+  10,
+);
+let ocrRequestSeq = 0;
+
+// Sends one process_file request to the resident OCR worker (main.py --serve).
+const requestOcrFromWorker = (filePath) =>
+  new Promise((resolve, reject) => {
+    const requestId = ++ocrRequestSeq;
+    const socket = net.createConnection(OCR_SOCKET_PATH);
+    let buffer = "";
+    socket.setTimeout(OCR_SOCKET_TIMEOUT_MS);
+    socket.on("connect", () => {
+      socket.write(
+        `${JSON.stringify({ id: requestId, op: "process_file", path: filePath })}\n`,
+      );
+    });
+    socket.on("data", (chunk) => {
+      buffer += chunk.toString("utf8");
+      const newlineIndex = buffer.indexOf("\n");
+      if (newlineIndex === -1) return;
+      socket.end();
+      try {
+        const response = JSON.parse(buffer.slice(0, newlineIndex));
+        if (!response.ok) {
+          reject(new Error(response.error || "OCR worker returned an error"));
+          return;
+        }
+        resolve(response.result);
+      } catch (error) {
+        reject(error);
+      }
+    });
+    socket.on("timeout", () => {
+      socket.destroy();
+      reject(new Error("OCR worker request timed out"));
+    });
+    socket.on("error", reject);
+    // No-ops once the reply has settled the promise.
+    socket.on("end", () => {
+      socket.destroy();
+      reject(new Error("OCR worker closed the connection without a reply"));
+    });
+    socket.on("close", () => {
+      reject(new Error("OCR worker connection closed without a reply"));
+    });
+  });
+
+const runInvoiceOcr = async (execa, filePath) => {
+  if (OCR_SOCKET_PATH) {
+    try {
+      return await requestOcrFromWorker(filePath);
+    } catch (error) {
+      console.warn(
+        `[OCR-WORKER] Falling back to one-shot main.py: ${error.message}`,
+      );
+    }
+  }
+  const configuredPython = (process.env.PYTHON_BIN || "").trim();
+  const pythonExecutable =
+    configuredPython || (process.platform === "win32" ? "python" : "python3");
+  const { stdout } = await execa(pythonExecutable, [
+    path.join(__dirname, "..", "python_scripts", "main.py"),
+    filePath,
+  ]);
+  return JSON.parse(stdout);
+};
+
 const sendPingToMonitor = async () => {
   const monitorUrl = process.env.MONITOR_URL;
   if (!monitorUrl) return;
@@ -961,14 +1032,7 @@ const invoiceWorker = new Worker(
       tempFilePaths.push(tempFilePath);
       await fs.writeFile(tempFilePath, Buffer.from(media.data, "base64"));
 
-      const configuredPython = (process.env.PYTHON_BIN || "").trim();
-      const pythonExecutable =
-        configuredPython || (process.platform === "win32" ? "python" : "python3");
-      const { stdout } = await execa(pythonExecutable, [
-        path.join(__dirname, "..", "python_scripts", "main.py"),
-        tempFilePath,
-      ]);
-      const invoiceJson = JSON.parse(stdout);
+      const invoiceJson = await runInvoiceOcr(execa, tempFilePath);
 
       const { amount, sender, recipient, transaction_id } = invoiceJson;
       if (!amount || (!recipient?.name && !recipient?.pix_key)) {
@@ -28,40 +28,80 @@ const syncUsdtTransactions = async () => {
         const scriptPath = path.join(__dirname, 'python_scripts', 'usdt_sync.py');
         let totalUpserted = 0;
 
-        for (const wallet of wallets) {
-            const address = wallet.wallet_address;
-            console.log(`[USDT-SYNC] Fetching transactions for wallet: ${address}`);
-            
-            try {
-                const { stdout } = await execa(pythonExecutable, [scriptPath, address]);
-                const transactions = JSON.parse(stdout);
+        const upsertRows = async (transactions) => {
+            const values = transactions.map(tx => [
+                tx.txid,
+                formatForMySQL(tx.time_iso),
+                tx.from_address,
+                tx.to_address,
+                tx.amount_usdt
+            ]);
+
+            const query = `
+                INSERT INTO usdt_transactions (txid, time_iso, from_address, to_address, amount_usdt)
+                VALUES ?
+                ON DUPLICATE KEY UPDATE txid=txid;
+            `;
+            const [result] = await pool.query(query, [values]);
+            if(result.affectedRows > 0) {
+                totalUpserted += result.affectedRows;
+            }
+        };
 
-                if (transactions.error) {
-                    console.error(`[USDT-SYNC-PYTHON-ERROR] for ${address}:`, transactions.error);
+        // One process fetches every wallet concurrently and streams NDJSON lines tagged by wallet.
+        // With USDT_SYNC_DIRECT_DB it upserts into MySQL itself and only reports counts.
+        const directDb = ['1', 'true', 'yes'].includes(String(process.env.USDT_SYNC_DIRECT_DB || '').trim().toLowerCase());
+        const args = directDb ? [scriptPath, '-', '--to-db'] : [scriptPath, '-'];
+        const addresses = wallets.map(wallet => wallet.wallet_address);
+        // High-water marks of wallets whose rows were all stored; saved back to usdt_sync.py at the end.
+        const failedWallets = new Set();
+        const marks = [];
+        console.log(`[USDT-SYNC] Fetching transactions for ${addresses.length} wallet(s).`);
+        try {
+            const subprocess = execa(pythonExecutable, args, { input: addresses.join('\n') });
+            for await (const line of subprocess) {
+                if (!line.trim()) continue;
+                let record;
+                try {
+                    record = JSON.parse(line);
+                } catch (parseError) {
+                    console.error('[USDT-SYNC] Unparseable output line:', line);
+                    continue;
+                }
+
+                if (record.error) {
+                    console.error(`[USDT-SYNC-PYTHON-ERROR] for ${record.wallet || 'all wallets'}:`, record.error);
                     continue; // Move to next wallet
                 }
 
-                if (transactions.length > 0) {
-                    const values = transactions.map(tx => [
-                        tx.txid,
-                        formatForMySQL(tx.time_iso),
-                        tx.from_address,
-                        tx.to_address,
-                        tx.amount_usdt
-                    ]);
+                if (record.done && record.inserted > 0) {
+                    totalUpserted += record.inserted;
+                }
+
+                if (record.done && record.mark && !failedWallets.has(record.wallet)) {
+                    marks.push({ wallet: record.wallet, mark: record.mark });
+                }
 
-                    const query = `
-                        INSERT INTO usdt_transactions (txid, time_iso, from_address, to_address, amount_usdt)
-                        VALUES ?
-                        ON DUPLICATE KEY UPDATE txid=txid;
-                    `;
-                    const [result] = await pool.query(query, [values]);
-                    if(result.affectedRows > 0) {
-                        totalUpserted += result.affectedRows;
+                if (record.rows && record.rows.length > 0) {
+                    try {
+                        await upsertRows(record.rows);
+                    } catch (error) {
+                        failedWallets.add(record.wallet);
+                        console.error(`[USDT-SYNC-CRITICAL] Failed to store transactions for wallet ${record.wallet}:`, error.message);
                     }
                 }
+            }
+        } catch (error) {
+            console.error('[USDT-SYNC-CRITICAL] usdt_sync.py failed:', error.stderr || error.message);
+        }
+
+        if (marks.length > 0) {
+            try {
+                await execa(pythonExecutable, [scriptPath, '--commit-marks'], {
+                    input: marks.map(mark => JSON.stringify(mark)).join('\n')
+                });
             } catch (error) {
-                console.error(`[USDT-SYNC-CRITICAL] Failed to sync wallet ${address}:`, error.stderr || error.message);
+                console.error('[USDT-SYNC] Could not save high-water marks:', error.stderr || error.message);
             }
         }
         console.log(`[USDT-SYNC] Sync cycle complete. Total new transactions upserted: ${totalUpserted}.`);
@@ -0,0 +1,15 @@
+-- Highest Telegram message ID ingested per channel; telegram_listener.py resumes history sync from here.
+CREATE TABLE IF NOT EXISTS `telegram_sync_checkpoints` (
+  `channel_id` bigint(20) NOT NULL,
+  `last_message_id` bigint(20) NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`channel_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO telegram_sync_checkpoints (channel_id, last_message_id)
+SELECT channel_id, MAX(telegram_message_id)
+FROM telegram_transactions
+GROUP BY channel_id;
+
+ALTER TABLE telegram_transactions
+  ADD INDEX IF NOT EXISTS idx_telegram_tx_channel_message (channel_id, telegram_message_id);
@@ -0,0 +1,12 @@
+-- Lets telegram_checker.py answer from telegram_transactions: equality on amount and
+-- normalized sender, range on transaction_date.
+ALTER TABLE telegram_transactions
+  ADD INDEX IF NOT EXISTS idx_telegram_tx_match (amount, sender_name_normalized, transaction_date);
+
+-- Liveness of long-running ingesters; telegram_listener.py refreshes its row while connected and caught up.
+CREATE TABLE IF NOT EXISTS `service_heartbeats` (
+  `service` varchar(64) NOT NULL,
+  `last_seen_at` datetime NOT NULL,
+  `details` text DEFAULT NULL,
+  PRIMARY KEY (`service`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
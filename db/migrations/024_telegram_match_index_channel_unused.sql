@@ -0,0 +1,5 @@
+-- telegram_checker.py only matches unused transactions of its own channel: lead the match index
+-- with channel_id and is_used so every lookup is a range on (channel, unused, amount).
+ALTER TABLE telegram_transactions
+  DROP INDEX IF EXISTS idx_telegram_tx_match,
+  ADD INDEX IF NOT EXISTS idx_telegram_tx_match (channel_id, is_used, amount, sender_name_normalized, transaction_date);
@@ -0,0 +1,8 @@
+-- Trigram index of normalized sender names for telegram_checker.py's fuzzy matching (sender_matcher.py).
+-- telegram_listener.py adds the names of every batch it writes; index the names already stored with
+--   python backend/python_scripts/sender_matcher.py backfill
+CREATE TABLE IF NOT EXISTS `telegram_sender_trigrams` (
+  `trigram` varbinary(12) NOT NULL,
+  `sender_name_normalized` varchar(255) NOT NULL,
+  PRIMARY KEY (`trigram`, `sender_name_normalized`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;